@@ -1,17 +1,52 @@
-from flask import Flask
-from flask_cors import CORS
+import multiprocessing
+from typing import TYPE_CHECKING
+
 from .config import Config
 
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+def create_app() -> "Flask":
+    # Flask is imported here so the pool workers and scripts that only need
+    # app.integrations / app.services don't pay for it
+    from flask import Flask
+    from flask_cors import CORS
 
-def create_app() -> Flask:
     app = Flask(__name__)
     app.config.from_object(Config)
 
     # CORS
     CORS(app, resources={r"/*": {"origins": app.config.get("CORS_ORIGINS", "*")}})
 
+    # Shared MongoDB pool
+    from .integrations import db  # noqa: WPS433
+    db.configure(
+        uri=app.config.get("MONGO_URI"),
+        db_name=app.config.get("MONGO_DB"),
+        max_pool_size=app.config.get("MONGO_MAX_POOL_SIZE"),
+        min_pool_size=app.config.get("MONGO_MIN_POOL_SIZE"),
+        server_selection_timeout_ms=app.config.get("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        breaker_failures=app.config.get("MONGO_BREAKER_FAILURES"),
+        breaker_reset_sec=app.config.get("MONGO_BREAKER_RESET_SEC"),
+    )
+
+    # Background job queue; picks up jobs left unfinished by a previous run
+    from .services import workers  # noqa: WPS433
+    from .services.jobs import JobQueue  # noqa: WPS433
+    workers.configure(app.config.get("JOB_WORKERS"))
+    job_queue = JobQueue(app.config["JOB_FOLDER"], capacity=app.config.get("JOB_QUEUE_SIZE", 32))
+    if multiprocessing.parent_process() is None:
+        # spawned pool workers re-import run.py (and so create_app); only the server recovers
+        job_queue.recover()
+    app.extensions["job_queue"] = job_queue
+
     # Blueprints
     from .routes import bp as api_bp  # noqa: WPS433 (import within function)
     app.register_blueprint(api_bp, url_prefix="/api")
 
+    if app.config.get("HSN_WATCH_CHANGES"):
+        from .integrations.hsn_index import start_watch  # noqa: WPS433
+        start_watch()
+
     return app
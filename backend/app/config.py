@@ -10,5 +10,30 @@ class Config:
     UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(os.getcwd(), "uploads"))
     ALLOWED_EXTENSIONS = {"txt", "pdf", "docx", "csv", "json", "png", "jpg", "jpeg"}
 
+    # background jobs (/api/jobs): worker processes, max queued+running jobs, state dir
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+    JOB_FOLDER = os.getenv("JOB_FOLDER", os.path.join(os.getcwd(), "jobs"))
+
+    # /api/process/batch: max files per request (after unzipping) and max unzipped bytes
+    BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+    BATCH_MAX_UNZIPPED_BYTES = int(os.getenv("BATCH_MAX_UNZIPPED_BYTES", str(200 * 1024 * 1024)))
+
+    # /api/analyze/batch: invoices per check_invoice chunk (and per pool task with parallel=true)
+    ANALYZE_BATCH_CHUNK = int(os.getenv("ANALYZE_BATCH_CHUNK", "200"))
+
     # CORS
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*")
+
+    # MongoDB (one shared client/pool per process)
+    MONGO_URI = os.getenv("MONGO_URI")
+    MONGO_DB = os.getenv("MONGO_DB", "online_db")
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000"))
+    # circuit breaker: open after N consecutive connection failures, retry after RESET seconds
+    MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", "3"))
+    MONGO_BREAKER_RESET_SEC = float(os.getenv("MONGO_BREAKER_RESET_SEC", "30"))
+
+    # HSN rate index: follow the Mongo collection with a change stream
+    HSN_WATCH_CHANGES = os.getenv("HSN_WATCH_CHANGES", "0") == "1"
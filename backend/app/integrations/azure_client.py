@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+from .deps import installed, optional
+
+AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
+AZURE_KEY = os.getenv("AZURE_KEY")
+AZURE_API_VERSION = os.getenv("AZURE_API_VERSION", "2024-02-29-preview")
+AZURE_MODEL = os.getenv("AZURE_MODEL", "prebuilt-invoice")
+# concurrent analyses allowed by the subscription (F0 tier is 1, S0 allows more)
+AZURE_MAX_INFLIGHT = int(os.getenv("AZURE_MAX_INFLIGHT", "4"))
+AZURE_TIMEOUT_SEC = float(os.getenv("AZURE_TIMEOUT_SEC", "120"))
+
+
+class AzureError(Exception):
+    pass
+
+
+def _retry_after(resp, default: float) -> float:
+    """Seconds to wait according to a Retry-After header (delta or HTTP date)."""
+    val = resp.headers.get("retry-after") if resp is not None else None
+    if not val:
+        return default
+    try:
+        return max(0.0, float(val))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(val).timestamp() - time.time())
+    except Exception:
+        return default
+
+
+class AzureDocumentClient:
+    """Document Intelligence client with connection reuse and bounded concurrency.
+
+    One ``requests.Session`` (keep-alive pool sized to ``max_inflight``) is
+    shared by all threads. At most ``max_inflight`` analyses are submitted or
+    being polled at a time; extra callers wait for a slot. 429/503 responses
+    are retried after ``Retry-After``, and polling backs off exponentially
+    from ``poll_initial`` to ``poll_max`` seconds unless the service asks for
+    a specific interval.
+    """
+
+    def __init__(
+        self,
+        endpoint: Optional[str],
+        key: Optional[str],
+        model: str = AZURE_MODEL,
+        api_version: str = AZURE_API_VERSION,
+        max_inflight: int = AZURE_MAX_INFLIGHT,
+        timeout: float = AZURE_TIMEOUT_SEC,
+        poll_initial: float = 0.5,
+        poll_max: float = 5.0,
+        max_retries: int = 5,
+    ):
+        self.endpoint = (endpoint or "").rstrip("/")
+        self.key = key
+        self.model = model
+        self.api_version = api_version
+        self.max_inflight = max(1, max_inflight)
+        self.timeout = timeout
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._session = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.throttled = 0
+        self.polls = 0
+        self.inflight = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.endpoint and self.key and installed("requests"))
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    requests = optional("requests")
+                    s = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_inflight * 2)
+                    s.mount("https://", adapter)
+                    s.mount("http://", adapter)
+                    s.headers["Ocp-Apim-Subscription-Key"] = self.key or ""
+                    self._session = s
+        return self._session
+
+    def _request(self, method: str, url: str, deadline: float, **kw):
+        """Send with retries on 429/5xx, sleeping per Retry-After (capped by the deadline)."""
+        session = self._get_session()
+        delay = self.poll_initial
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AzureError("timed out")
+            try:
+                resp = session.request(method, url, timeout=min(30.0, remaining), **kw)
+            except optional("requests").RequestException as e:
+                if attempt == self.max_retries:
+                    raise AzureError(str(e)) from e
+                resp = None
+            if resp is not None and resp.status_code not in (429, 500, 502, 503, 504):
+                return resp
+            if resp is not None and resp.status_code == 429:
+                self.throttled += 1
+            if attempt == self.max_retries:
+                break
+            wait = _retry_after(resp, delay) + random.uniform(0, 0.1)
+            time.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, self.poll_max)
+        raise AzureError(f"giving up after {self.max_retries} retries")
+
+    def analyze(
+        self,
+        document: bytes,
+        content_type: str = "application/pdf",
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, Any]:
+        """Submit ``document`` and poll until the analysis finishes; returns the operation JSON.
+
+        If ``timings`` is given, ``azure_submit`` and ``azure_poll`` seconds are stored in it.
+        """
+        if not self.configured:
+            raise AzureError("azure document intelligence not configured")
+        deadline = time.monotonic() + self.timeout
+        url = f"{self.endpoint}/documentintelligence/documentModels/{self.model}:analyze?api-version={self.api_version}"
+        with self._slots:
+            self.inflight += 1
+            try:
+                return self._analyze(url, document, content_type, deadline, timings if timings is not None else {})
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.inflight -= 1
+
+    def _analyze(
+        self, url: str, document: bytes, content_type: str, deadline: float, timings: Dict[str, float]
+    ) -> Dict[str, Any]:
+        self.submitted += 1
+        started = time.perf_counter()
+        r = self._request("POST", url, deadline, data=document, headers={"Content-Type": content_type})
+        submitted = time.perf_counter()
+        timings["azure_submit"] = submitted - started
+        if r.status_code not in (200, 202):
+            raise AzureError(f"submit failed: HTTP {r.status_code}")
+        op = r.headers.get("operation-location")
+        if not op:
+            raise AzureError("submit response has no operation-location")
+        delay = self.poll_initial
+        wait = _retry_after(r, delay)
+        while True:
+            time.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+            self.polls += 1
+            poll = self._request("GET", op, deadline)
+            if poll.status_code not in (200, 202):
+                raise AzureError(f"poll failed: HTTP {poll.status_code}")
+            j = poll.json()
+            status = j.get("status")
+            if status in ("succeeded", "failed"):
+                timings["azure_poll"] = time.perf_counter() - submitted
+            if status == "succeeded":
+                self.succeeded += 1
+                return j
+            if status == "failed":
+                raise AzureError(f"analysis failed: {j.get('error')}")
+            delay = min(delay * 1.5, self.poll_max)
+            wait = _retry_after(poll, delay)
+
+    def analyze_many(self, documents: List[bytes], content_type: str = "application/pdf") -> List[Any]:
+        """Analyze several documents concurrently (bounded by ``max_inflight``).
+
+        Returns results in input order; failed entries hold the raised exception.
+        """
+        def _one(doc: bytes) -> Any:
+            try:
+                return self.analyze(doc, content_type)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.max_inflight) as ex:
+            return list(ex.map(_one, documents))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "polls": self.polls,
+        }
+
+
+_CLIENT: Optional[AzureDocumentClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> AzureDocumentClient:
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = AzureDocumentClient(AZURE_ENDPOINT, AZURE_KEY)
+    return _CLIENT
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from .deps import installed, optional
+
+T = TypeVar("T")
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures.
+
+    While open every call is refused immediately; after ``reset_timeout``
+    seconds a single trial call is let through (half-open) and its outcome
+    closes or re-opens the breaker. A trial that never reports back does
+    not wedge it: another is let through ``reset_timeout`` later.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                # opened_at doubles as the start of the current half-open trial
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _pool_counters():
+    """A ConnectionPoolListener counting connection events; pymongo is imported here, with the first client."""
+    from pymongo import monitoring
+
+    class _PoolCounters(monitoring.ConnectionPoolListener):
+        def __init__(self) -> None:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.checked_in = 0
+            self.checkout_failed = 0
+
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_cleared(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_check_out_started(self, event): pass
+        def connection_ready(self, event): pass
+
+        def connection_created(self, event):
+            self.created += 1
+
+        def connection_closed(self, event):
+            self.closed += 1
+
+        def connection_checked_out(self, event):
+            self.checked_out += 1
+
+        def connection_checked_in(self, event):
+            self.checked_in += 1
+
+        def connection_check_out_failed(self, event):
+            self.checkout_failed += 1
+
+    return _PoolCounters()
+
+
+class MongoPool:
+    """One lazily created MongoClient (and its connection pool) per process."""
+
+    def __init__(
+        self,
+        uri: Optional[str],
+        db_name: str = "online_db",
+        max_pool_size: int = 50,
+        min_pool_size: int = 0,
+        server_selection_timeout_ms: int = 3000,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.uri = uri
+        self.db_name = db_name
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self._counters = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.short_circuits = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.uri and installed("pymongo"))
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._counters = _pool_counters()
+                    self._client = optional("pymongo").MongoClient(
+                        self.uri,
+                        maxPoolSize=self.max_pool_size,
+                        minPoolSize=self.min_pool_size,
+                        serverSelectionTimeoutMS=self.server_selection_timeout_ms,
+                        connectTimeoutMS=self.server_selection_timeout_ms,
+                        event_listeners=[self._counters],
+                        appname="finnov-backend",
+                    )
+        return self._client
+
+    def database(self):
+        """Database handle for callers that manage their own cursors (e.g. change streams)."""
+        if not self.configured:
+            raise DatabaseUnavailable("mongodb not configured")
+        return self._get_client()[self.db_name]
+
+    def run(self, fn: Callable[[Any], T]) -> T:
+        """Call ``fn(db)`` through the circuit breaker.
+
+        Connection-level failures count against the breaker and surface as
+        DatabaseUnavailable; other driver errors (duplicate keys, bad queries)
+        propagate unchanged but count as a success, since the server answered.
+        """
+        if not self.configured:
+            raise DatabaseUnavailable("mongodb not configured")
+        if not self.breaker.allow():
+            self.short_circuits += 1
+            raise DatabaseUnavailable("mongodb circuit open")
+        self.calls += 1
+        connection_failure = optional("pymongo.errors").ConnectionFailure
+        reachable = True
+        try:
+            return fn(self.database())
+        except connection_failure as e:
+            reachable = False
+            self.errors += 1
+            raise DatabaseUnavailable(str(e)) from e
+        finally:
+            if reachable:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "configured": self.configured,
+            "connected": self._client is not None,
+            "calls": self.calls,
+            "errors": self.errors,
+            "short_circuits": self.short_circuits,
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "trips": self.breaker.trips,
+            },
+            "max_pool_size": self.max_pool_size,
+        }
+        c = self._counters
+        if c is not None:
+            out["connections"] = {
+                "created": c.created,
+                "closed": c.closed,
+                "open": c.created - c.closed,
+                "checked_out": c.checked_out,
+                "in_use": c.checked_out - c.checked_in,
+                "checkout_failed": c.checkout_failed,
+            }
+        return out
+
+
+_POOL: Optional[MongoPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _build_pool(
+    uri: Optional[str] = None,
+    db_name: Optional[str] = None,
+    max_pool_size: Optional[int] = None,
+    min_pool_size: Optional[int] = None,
+    server_selection_timeout_ms: Optional[int] = None,
+    breaker_failures: Optional[int] = None,
+    breaker_reset_sec: Optional[float] = None,
+) -> MongoPool:
+    return MongoPool(
+        uri if uri is not None else os.getenv("MONGO_URI"),
+        db_name or os.getenv("MONGO_DB", "online_db"),
+        max_pool_size=max_pool_size or int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+        min_pool_size=min_pool_size if min_pool_size is not None else int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        server_selection_timeout_ms=server_selection_timeout_ms
+        or int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000")),
+        breaker=CircuitBreaker(
+            breaker_failures or int(os.getenv("MONGO_BREAKER_FAILURES", "3")),
+            breaker_reset_sec if breaker_reset_sec is not None else float(os.getenv("MONGO_BREAKER_RESET_SEC", "30")),
+        ),
+    )
+
+
+def configure(**settings: Any) -> MongoPool:
+    """(Re)create the process-wide pool; unset settings fall back to env vars.
+
+    Accepts the keyword arguments of ``_build_pool``.
+    """
+    global _POOL
+    pool = _build_pool(**settings)
+    with _POOL_LOCK:
+        old, _POOL = _POOL, pool
+    if old is not None:
+        old.close()
+    return pool
+
+
+def get_pool() -> MongoPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = _build_pool()
+    return _POOL
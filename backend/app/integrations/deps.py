@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import importlib
+import importlib.util
+from types import ModuleType
+from typing import Dict, Optional
+
+# Optional heavy dependencies (PyMuPDF, OpenCV/NumPy, tesserocr, requests,
+# pymongo) are imported on first use instead of at module import, so
+# create_app() and the analyze-only / text-only paths never load them.
+# `python -m benchmarks.run --only import_app,import_logic` guards this.
+
+_MODULES: Dict[str, Optional[ModuleType]] = {}
+_FOUND: Dict[str, bool] = {}
+
+
+def optional(name: str) -> Optional[ModuleType]:
+    """``import name`` on first call; None (remembered) when it is not installed or fails to load."""
+    try:
+        return _MODULES[name]
+    except KeyError:
+        pass
+    try:
+        module: Optional[ModuleType] = importlib.import_module(name)
+    except Exception:
+        module = None
+    _MODULES[name] = module
+    return module
+
+
+def installed(name: str) -> bool:
+    """Whether ``name`` looks importable, without importing it."""
+    if name in _MODULES:
+        return _MODULES[name] is not None
+    found = _FOUND.get(name)
+    if found is None:
+        try:
+            found = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            found = False
+        _FOUND[name] = found
+    return found
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+EXTRACT_CACHE_ENABLED = os.getenv("EXTRACT_CACHE_ENABLED", "1") == "1"
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(os.getcwd(), "cache", "extract"))
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# a lock file older than this was left by a process that died holding it
+_STALE_LOCK_SEC = 30.0
+
+# options that change what gets done with a result, not the result itself
+_IGNORED_OPTIONS = {"insert_into_mongo", "upload_dir", "use_cache", "check_duplicates"}
+
+
+def cache_key(digest: str, version: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Key for a document given the SHA-256 hex digest of its bytes."""
+    opts = {k: v for k, v in (options or {}).items() if k not in _IGNORED_OPTIONS}
+    h = hashlib.sha256()
+    h.update(digest.encode())
+    h.update(b"\0" + version.encode() + b"\0")
+    h.update(json.dumps(opts, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractCache:
+    """Disk-backed JSON cache with LRU eviction bounded by total bytes.
+
+    Entries live at ``<root>/<key[:2]>/<key>.json`` and reads touch the file,
+    so mtime is last use. The server and its pool workers share the
+    directory: the running total is kept in ``<root>/size.json``, updated
+    under ``<root>/.lock``, and the process that takes it past ``max_bytes``
+    scans the directory and deletes the least recently used entries down to
+    ``low_water`` of the limit, so the bound holds across all of them.
+    """
+
+    def __init__(self, root: str, max_bytes: int = EXTRACT_CACHE_MAX_BYTES, low_water: float = 0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    # ---------- shared size accounting ----------
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive across threads and processes: O_EXCL lock file, taken over when stale."""
+        path = os.path.join(self.root, ".lock")
+        with self._lock:
+            while True:
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    break
+                except FileExistsError:
+                    try:
+                        # left behind by a process that died holding it
+                        if time.time() - os.path.getmtime(path) > _STALE_LOCK_SEC:
+                            os.remove(path)
+                            continue
+                    except OSError:
+                        continue
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _read_total(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(os.path.join(self.root, "size.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            return int(data["bytes"]), int(data["entries"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_total(self, total: Tuple[int, int]) -> None:
+        path = os.path.join(self.root, "size.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"bytes": total[0], "entries": total[1]}, f)
+        os.replace(tmp, path)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """``(mtime, path, size)`` of every entry, least recently used first."""
+        entries = []
+        if os.path.isdir(self.root):
+            for sub in os.listdir(self.root):
+                d = os.path.join(self.root, sub)
+                if not os.path.isdir(d):
+                    continue
+                for name in os.listdir(d):
+                    if name.endswith(".json"):
+                        path = os.path.join(d, name)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, path, st.st_size))
+        entries.sort()
+        return entries
+
+    def _evict(self, target: int) -> Tuple[int, int]:
+        """Delete least recently used entries until at most ``target`` bytes remain; the new total."""
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        # never the most recent one: that is the entry just written
+        for _, path, size in entries[:-1]:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.evictions += removed
+        return total, len(entries) - removed
+
+    # ---------- entries ----------
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                doc = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return doc
+
+    def put(self, key: str, doc: Dict[str, Any]) -> None:
+        data = json.dumps(doc, default=str).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced: Optional[int] = os.path.getsize(path)
+        except OSError:
+            replaced = None
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._locked():
+            total = self._read_total()
+            if total is None:
+                # first write to this directory (or the size file was lost): count it
+                total = self._evict(self.max_bytes)
+            else:
+                total = (total[0] + len(data) - (replaced or 0), total[1] + (replaced is None))
+                if total[0] > self.max_bytes:
+                    total = self._evict(int(self.max_bytes * self.low_water))
+            self._write_total(total)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        total = self._read_total()
+        if total is None:
+            entries = self._scan()
+            total = (sum(size for _, _, size in entries), len(entries))
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "entries": total[1],
+            "bytes": total[0],
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+_CACHE: Optional[ExtractCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> Optional[ExtractCache]:
+    """The process-wide cache, or None when EXTRACT_CACHE_ENABLED=0."""
+    global _CACHE
+    if not EXTRACT_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ExtractCache(EXTRACT_CACHE_DIR)
+    return _CACHE
@@ -4,63 +4,44 @@ import os
 import re
 import io
 import json
+import threading
 import time
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, List, Optional, Tuple
-
-# Optional heavy deps guarded
-try:
-    import fitz  # PyMuPDF
-except Exception:
-    fitz = None  # type: ignore
-
-try:
-    import numpy as np
-    import cv2
-except Exception:
-    np = None  # type: ignore
-    cv2 = None  # type: ignore
-
-try:
-    import requests
-except Exception:
-    requests = None  # type: ignore
-
-try:
-    import pytesseract
-    from PIL import Image
-    TESS_AVAILABLE = True
-except Exception:
-    TESS_AVAILABLE = False
-
-try:
-    from pymongo import MongoClient
-    MONGO_AVAILABLE = True
-except Exception:
-    MONGO_AVAILABLE = False
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from . import fingerprint, metrics, ocr
+from .azure_client import AzureError, get_client as get_azure_client
+from .deps import optional
+from .extract_cache import cache_key, get_cache as get_extract_cache
+from .facts import InvoiceFacts
+from .fields import scan_fields
+from .hsn_index import clean_code, get_hsn_index, load_rates_from_csv
+from .model import LineItem, percent_of, to_paise, to_rupees
+from .source import Document, fetch_url
+from .tables import PageLayout, extract_items as extract_table_items, image_rules, pdf_rules
+from .write_behind import get_writer
+
+# Bump whenever a change alters extract() output so cached results are not reused
+EXTRACTOR_VERSION = "12"
 
 # Config via env (no hard-coded secrets)
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB = os.getenv("MONGO_DB", "online_db")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "invoices")
-HSN_CSV_PATH = os.getenv("HSN_CSV_PATH", os.path.join(os.getcwd(), "Collection_HSN_and_GST_Data.csv"))
+# multi-page documents: pages OCR'd per document unless options.max_pages says otherwise
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "10"))
+# render resolution for OCR: fast | standard | high (see OCR_TARGET_PIXELS)
+OCR_QUALITY = os.getenv("OCR_QUALITY", "standard")
+# a PDF page's own text layer replaces OCR when it has at least this many letters/digits
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "100"))
+# rebuild line items from the page's own table when Azure gives none
+LOCAL_TABLE_ITEMS = os.getenv("LOCAL_TABLE_ITEMS", "1") == "1"
 
 STANDARD_GST_SLABS = [Decimal("0"), Decimal("5"), Decimal("12"), Decimal("18"), Decimal("28")]
 SLAB_TOLERANCE = Decimal("0.5")
+# stated total / GST vs the sum over items
+MISMATCH_TOLERANCE_PAISE = 50
 
-IRN_RE = re.compile(r"([a-f0-9]{64}\s*-\s*[a-f0-9]{32})", flags=re.I)
-GST_LABEL_PATTERNS = [
-    r"(?:COMPANY'S\s*GSTIN\/UIN|COMPANY'S\s*GSTIN|COMPANY\s*GSTIN|GSTIN\/UIN|GSTIN)(?:\s*[:\-\n]\s*|\s+)([0-9A-Z\-\s]{10,30})",
-    r"(?:BUYER|BILL TO|CONSIGNEE|SHIP TO).{0,40}(?:GSTIN\/UIN|GSTIN)(?:\s*[:\-\n]\s*|\s+)([0-9A-Z\-\s]{10,30})",
-]
-GST_SIMPLE = re.compile(r"([0-9A-Z]{15})", flags=re.I)
-PAN_RE = re.compile(r"\b([A-Z]{5}[0-9]{4}[A-Z])\b")
-HSN_RE = re.compile(r"\b[0-9]{4,8}\b")
-AMOUNT_RE = re.compile(r"([0-9]{1,3}(?:,[0-9]{3})*(?:\.\d+)?)")
 COMPANY_KEYWORDS = [
     "LTD",
     "PVT",
@@ -75,6 +56,12 @@ COMPANY_KEYWORDS = [
     "INDUSTRIES",
     "CO.",
 ]
+_COMPANY_LINE_SKIP = re.compile(r"GSTIN|TAX|INVOICE|IRN|ACK")
+_HEADER_LINE_SKIP = re.compile(r"TAX|INVOICE|GSTIN|IRN|ACK")
+_NAME_LINE_SKIP = re.compile(r"TAX INVOICE|INVOICE|IRN|ACK|DATE|HSN|GSTIN", flags=re.I)
+_BUYER_LABEL = re.compile(r"Buyer|Bill to|Bill To|Buyer \(Bill to\)|Consignee|Ship to|Bill\s*to", flags=re.I)
+_BUYER_LINE_SKIP = re.compile(r"GSTIN|GST|ADDRESS|STATE|PIN|PHONE|MOBILE", flags=re.I)
+_BUYER_COMPANY_SKIP = re.compile(r"TAX|INVOICE|GSTIN", flags=re.I)
 
 
 def to_decimal(val: Any) -> Optional[Decimal]:
@@ -116,359 +103,442 @@ def parse_date(s: Optional[str]) -> Optional[str]:
         return None
 
 
-# ---------- HSN -> GST CSV ----------
-import csv
+# ---------- HSN -> GST lookup ----------
 
 def load_hsn_map_from_csv(path: str) -> Dict[str, Decimal]:
-    out: Dict[str, Decimal] = {}
-    if not os.path.exists(path):
-        return out
-    try:
-        with open(path, newline="", encoding="utf-8") as cf:
-            rdr = csv.DictReader(cf)
-            if not rdr.fieldnames:
-                return out
-            heads = [h.lower() for h in rdr.fieldnames]
-            hsn_col = None
-            rate_col = None
-            for h in heads:
-                if "hsn" in h or "sac" in h:
-                    hsn_col = h
-                if "gst" in h or "rate" in h or "tax" in h:
-                    rate_col = h
-            if not hsn_col:
-                hsn_col = heads[0]
-            if not rate_col and len(heads) > 1:
-                rate_col = heads[1]
-            for row in rdr:
-                raw_hsn = row.get(hsn_col, "") if hsn_col else ""
-                raw_rate = row.get(rate_col, "") if rate_col else ""
-                raw_hsn = re.sub(r"\D", "", str(raw_hsn))
-                rate_dec = to_decimal(raw_rate)
-                if raw_hsn and rate_dec is not None:
-                    out[raw_hsn] = rate_dec
-    except Exception:
-        return {}
-    return out
+    return load_rates_from_csv(path)
 
-_HSN_MAP = load_hsn_map_from_csv(HSN_CSV_PATH)
 
-
-def get_gst_for_hsn(hsn: Optional[str], db_client: Optional[Any] = None) -> Optional[Decimal]:
+def get_gst_for_hsn(hsn: Optional[str]) -> Optional[Decimal]:
     if not hsn:
         return None
-    key = re.sub(r"\D", "", str(hsn))
-    if not key:
-        return None
-    if key in _HSN_MAP:
-        return _HSN_MAP[key]
-    if db_client and MONGO_AVAILABLE:
-        try:
-            db = db_client[MONGO_DB]
-            doc = db.get_collection("users").find_one({"HSN_SAC_Code": {"$regex": key}})
-            if doc:
-                rate = doc.get("Tax_Rate") or doc.get("gst_rate") or doc.get("Rate")
-                return to_decimal(rate)
-        except Exception:
-            pass
-    return None
+    return get_hsn_index().get(hsn)
 
 
 # ---------- IO helpers ----------
 
-def pdf_to_image(pdf_path: str, page: int = 0, dpi: int = 300):
+# Long side, in pixels, a page is rendered at for each OCR quality level. A4 at
+# "standard" comes out near 300 DPI, the resolution Tesseract is tuned for;
+# small pages (receipts) get more DPI, large ones less.
+OCR_TARGET_PIXELS = {"fast": 2500, "standard": 3500, "high": 4700}
+MIN_DPI = 150
+MAX_DPI = 400
+
+
+def choose_dpi(width_pt: float, height_pt: float, quality: str = "standard") -> int:
+    target = OCR_TARGET_PIXELS.get(quality, OCR_TARGET_PIXELS["standard"])
+    long_side_in = max(width_pt, height_pt, 1.0) / 72.0
+    return int(max(MIN_DPI, min(MAX_DPI, target / long_side_in)))
+
+
+# a file path, or the bytes of an upload / download held in a Document
+Source = Union[str, Document]
+
+
+def _as_document(src: Source) -> Document:
+    return src if isinstance(src, Document) else Document.from_path(src)
+
+
+def _open_pdf(src: Source):
+    fitz = optional("fitz")  # PyMuPDF
     if not fitz:
         raise RuntimeError("PyMuPDF not installed")
-    doc = fitz.open(pdf_path)
-    page_obj = doc[page]
-    pix = page_obj.get_pixmap(dpi=dpi)
-    import numpy as _np
-    img = _np.frombuffer(pix.samples, dtype=_np.uint8).reshape(pix.height, pix.width, pix.n)
-    if pix.n == 4:
-        import cv2 as _cv2
-        img = _cv2.cvtColor(img, _cv2.COLOR_RGBA2RGB)
-    return img
-
-
-def pil_to_cv(img_pil):
-    rgb = img_pil.convert("RGB")
-    import numpy as _np
-    return _np.array(rgb)
-
-
-def load_image_any(path: str, page: int = 0):
-    pl = path.lower()
-    if pl.endswith(".pdf"):
-        return pdf_to_image(path, page=page, dpi=400)
+    doc = _as_document(src)
+    if doc.data is not None:
+        return fitz.open(stream=doc.data, filetype="pdf")
+    return fitz.open(doc.path)
+
+
+def pdf_to_image(pdf: Source, page: int = 0, dpi: Optional[int] = None, quality: str = "standard"):
+    """Render one page straight to a single-channel grayscale array."""
+    with _open_pdf(pdf) as doc:
+        page_obj = doc[page]
+        if dpi is None:
+            dpi = choose_dpi(page_obj.rect.width, page_obj.rect.height, quality)
+        pix = page_obj.get_pixmap(dpi=dpi, colorspace=optional("fitz").csGRAY, alpha=False)
+    np = optional("numpy")
+    img = np.frombuffer(pix.samples, dtype=np.uint8)
+    if pix.stride != pix.width:
+        return img.reshape(pix.height, pix.stride)[:, : pix.width]
+    return img.reshape(pix.height, pix.width)
+
+
+def page_count(src: Source) -> int:
+    doc = _as_document(src)
+    if doc.is_pdf:
+        with _open_pdf(doc) as pdf:
+            return pdf.page_count
     try:
         from PIL import Image as _Image
-        pil = _Image.open(path)
-        if getattr(pil, "n_frames", 1) > 1:
-            pil.seek(0)
-        return pil_to_cv(pil)
+        with _Image.open(doc.path if doc.data is None else io.BytesIO(doc.data)) as pil:
+            return getattr(pil, "n_frames", 1)
     except Exception:
-        if cv2 is None:
-            raise
-        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            raise FileNotFoundError(f"Unable to open image: {path}")
-        if img.ndim == 2:
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-        elif img.shape[2] == 4:
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
+        return 1
+
+
+def load_image_any(src: Source, page: int = 0, quality: str = "standard"):
+    """Load a page/frame as a single-channel grayscale array (all OCR needs)."""
+    doc = _as_document(src)
+    if doc.is_pdf:
+        return pdf_to_image(doc, page=page, quality=quality)
+    cv2 = optional("cv2")
+    if cv2 is not None:
+        img = None
+        if doc.data is not None:
+            # multi-frame images in memory go through PIL below
+            if page == 0:
+                np = optional("numpy")
+                img = cv2.imdecode(np.frombuffer(doc.data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        elif page == 0:
+            img = cv2.imread(doc.path, cv2.IMREAD_GRAYSCALE)
         else:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        return img
+            ok, frames = cv2.imreadmulti(doc.path, flags=cv2.IMREAD_GRAYSCALE)
+            img = frames[page] if ok and page < len(frames) else None
+        if img is not None:
+            return img
+    from PIL import Image as _Image
+    try:
+        pil = _Image.open(doc.path if doc.data is None else io.BytesIO(doc.data))
+    except Exception:
+        raise FileNotFoundError(f"Unable to open image: {doc.name}")
+    if getattr(pil, "n_frames", 1) > 1:
+        pil.seek(page)
+    return optional("numpy").asarray(pil.convert("L"))
+
 
+def deskew_image(img, max_skew_deg: float = 15.0, thumb_px: int = 1000):
+    """Straighten small text skew.
 
-def deskew_image(img_rgb, max_skew_deg: float = 15.0):
+    The angle is measured on a grayscale thumbnail (at most ``thumb_px`` on
+    the long side; rotation angles don't change with scale) and applied once
+    to the full-size grayscale image.
+    """
+    cv2 = optional("cv2")
     if cv2 is None:
-        return img_rgb
+        return img
     try:
-        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
         h, w = gray.shape
-        scale = 1.0
-        if max(w, h) > 2000:
-            scale = 2000.0 / max(w, h)
-            small = cv2.resize(gray, (int(w * scale), int(h * scale)))
+        if max(w, h) > thumb_px:
+            scale = thumb_px / float(max(w, h))
+            small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
         else:
-            small = gray.copy()
+            small = gray
         blur = cv2.GaussianBlur(small, (5, 5), 0)
-        _, bw = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        bw = 255 - bw
+        _, bw = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 3))
         bw = cv2.morphologyEx(bw, cv2.MORPH_CLOSE, kernel)
         contours, _ = cv2.findContours(bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if not contours:
-            return img_rgb
+            return gray
         largest = max(contours, key=cv2.contourArea)
-        rect = cv2.minAreaRect(largest)
-        angle = rect[-1]
-        if angle < -45:
-            angle = 90 + angle
-        if scale != 1.0:
-            angle = angle / scale
-        if abs(angle) < 0.05:
-            angle = 0.0
-        if abs(angle) > 45:
-            import numpy as _np
-            img_rgb = _np.rot90(img_rgb)
-            return deskew_image(img_rgb, max_skew_deg=max_skew_deg)
+        angle = cv2.minAreaRect(largest)[-1]
+        # OpenCV reports [-90, 0) or (0, 90] depending on version; fold to (-45, 45].
+        # The folded angle is the rotation that levels the text block.
+        if angle > 45:
+            angle -= 90
+        elif angle <= -45:
+            angle += 90
         if 0.1 < abs(angle) < max_skew_deg:
-            (h, w) = img_rgb.shape[:2]
             center = (w // 2, h // 2)
-            M = cv2.getRotationMatrix2D(center, -angle, 1.0)
-            img_rgb = cv2.warpAffine(
-                img_rgb, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE
-            )
-        return img_rgb
+            M = cv2.getRotationMatrix2D(center, angle, 1.0)
+            gray = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return gray
     except Exception:
-        return img_rgb
+        return img
 
 
 # ---------- OCR ----------
 
 def tesseract_text(img) -> str:
-    if not TESS_AVAILABLE:
-        return ""
-    try:
-        return pytesseract.image_to_string(Image.fromarray(img))
-    except Exception:
-        return ""
+    return ocr.recognize(img)
+
+
+def _ocr_page_timed(
+    src: Source, page: int, quality: str, layout: bool = False
+) -> Tuple[str, Dict[str, float], Optional[PageLayout]]:
+    """Rasterize, deskew and OCR one page; top-level so OCR workers can run it.
+
+    With ``layout`` the word boxes and ruling lines come back too, for the
+    local table extractor.
+    """
+    t0 = time.perf_counter()
+    img = load_image_any(src, page=page, quality=quality)
+    t1 = time.perf_counter()
+    img = deskew_image(img)
+    t2 = time.perf_counter()
+    if not layout:
+        text, ocr_sec = ocr.recognize_timed(img)
+        return text, {"rasterize": t1 - t0, "deskew": t2 - t1, "ocr": ocr_sec}, None
+    rules = image_rules(img)
+    t3 = time.perf_counter()
+    text, words, ocr_sec = ocr.recognize_words_timed(img)
+    return text, {"rasterize": t1 - t0, "deskew": t2 - t1, "table_rules": t3 - t2, "ocr": ocr_sec}, PageLayout(words, rules, "px")
+
+
+def ocr_page(src: Source, page: int, quality: str = "standard") -> str:
+    """Rasterize, deskew and OCR one page."""
+    text, t, _ = _ocr_page_timed(src, page, quality)
+    ocr.record(t["ocr"])
+    return text
+
+
+def ocr_pages(
+    src: Source,
+    pages: List[int],
+    quality: str = "standard",
+    timings: Optional[Dict[str, float]] = None,
+    layouts: Optional[List[Optional[PageLayout]]] = None,
+) -> List[str]:
+    """OCR the given pages, in parallel when there is more than one; texts in the same order.
+
+    Per-stage seconds summed over pages are added to ``timings`` when given;
+    each page's PageLayout is appended to ``layouts`` when given.
+    """
+    started = time.perf_counter()
+    n = len(pages)
+    want_layout = layouts is not None
+    if n <= 1 or ocr.page_workers() <= 1:
+        results = [_ocr_page_timed(src, p, quality, want_layout) for p in pages]
+    else:
+        # an in-memory document is pickled to the workers along with each page
+        results = list(ocr.get_executor().map(_ocr_page_timed, [src] * n, pages, [quality] * n, [want_layout] * n))
+    texts = []
+    for text, t, layout in results:
+        if layouts is not None:
+            layouts.append(layout)
+        ocr.record(t["ocr"])
+        metrics.observe_many(t, ("rasterize", "deskew", "table_rules", "ocr"))
+        if timings is not None:
+            for stage, sec in t.items():
+                timings[stage] = timings.get(stage, 0.0) + sec
+        texts.append(text)
+    TEXT_LAYER_STATS["ocr_pages"] += n
+    TEXT_LAYER_STATS["ocr_sec"] += time.perf_counter() - started
+    return texts
+
+
+# ---------- PDF text layer ----------
+
+# per-process counters for the native-text fast path
+TEXT_LAYER_STATS: Dict[str, Any] = {
+    "documents": 0,
+    "fast_path_documents": 0,
+    "fast_path_pages": 0,
+    "ocr_pages": 0,
+    "ocr_sec": 0.0,
+}
+
+
+def text_layer_stats() -> Dict[str, Any]:
+    st = dict(TEXT_LAYER_STATS)
+    avg_ocr = st["ocr_sec"] / st["ocr_pages"] if st["ocr_pages"] else None
+    st["ocr_sec"] = round(st["ocr_sec"], 3)
+    st["avg_ocr_page_sec"] = round(avg_ocr, 3) if avg_ocr is not None else None
+    # what the skipped pages would have cost at the observed OCR rate
+    st["est_time_saved_sec"] = round(avg_ocr * st["fast_path_pages"], 3) if avg_ocr is not None else None
+    return st
+
+
+def pdf_page_words(pdf: Source, pages: List[int]) -> List[List[Tuple[float, float, float, float, str, int, int, int]]]:
+    """Words with coordinates from the PDF's own text layer, one list per page.
+
+    Each word is PyMuPDF's ``(x0, y0, x1, y1, text, block_no, line_no, word_no)``.
+    """
+    if not optional("fitz"):
+        return [[] for _ in pages]
+    with _open_pdf(pdf) as doc:
+        return [doc[p].get_text("words", sort=True) for p in pages]
+
+
+def pdf_page_layouts(pdf: Source, pages: List[int]) -> List[PageLayout]:
+    """pdf_page_words() plus each page's vertical ruling lines, for the local table extractor."""
+    if not optional("fitz"):
+        return [PageLayout([]) for _ in pages]
+    with _open_pdf(pdf) as doc:
+        return [PageLayout(doc[p].get_text("words", sort=True), pdf_rules(doc[p])) for p in pages]
+
+
+def words_to_text(words) -> str:
+    lines: List[str] = []
+    current: List[str] = []
+    key = None
+    for w in words:
+        k = (w[5], w[6])
+        if key is not None and k != key:
+            lines.append(" ".join(current))
+            current = []
+        key = k
+        current.append(w[4])
+    if current:
+        lines.append(" ".join(current))
+    return "\n".join(lines)
+
+
+def has_usable_text(text: str) -> bool:
+    return sum(ch.isalnum() for ch in text) >= TEXT_LAYER_MIN_CHARS
 
 
 # ---------- Azure invoice extraction ----------
 
-def azure_extract(pdf_bytes: bytes) -> Dict[str, Any]:
-    if not (AZURE_ENDPOINT and AZURE_KEY and requests):
-        return {}
-    api_url = f"{AZURE_ENDPOINT.rstrip('/')}/documentintelligence/documentModels/prebuilt-invoice:analyze?api-version=2024-02-29-preview"
-    headers = {"Ocp-Apim-Subscription-Key": AZURE_KEY, "Content-Type": "application/pdf"}
-    r = requests.post(api_url, headers=headers, data=pdf_bytes)
-    if r.status_code not in (200, 202):
+def azure_extract(pdf_bytes: bytes, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    client = get_azure_client()
+    if not client.configured:
         return {}
-    op = r.headers.get("operation-location")
-    if not op:
+    try:
+        j = client.analyze(pdf_bytes, timings=timings)
+    except AzureError as e:
+        # configured but failed: reported, and keeps the result out of the cache
+        return {"error": f"{type(e).__name__}: {e}"}
+    docs = j.get("analyzeResult", {}).get("documents", [])
+    if not docs:
         return {}
-    for _ in range(90):
-        poll = requests.get(op, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY})
-        if poll.status_code not in (200, 202):
-            break
-        j = poll.json()
-        status = j.get("status")
-        if status == "succeeded":
-            docs = j.get("analyzeResult", {}).get("documents", [])
-            if not docs:
-                return {}
-            fields = docs[0].get("fields", {})
-
-            def val(k):
-                return fields.get(k, {}).get("content")
-
-            return {
-                "vendor": val("VendorName"),
-                "invoice_no": val("InvoiceId"),
-                "invoice_date": val("InvoiceDate") or val("InvoiceDateIssued") or val("DueDate"),
-                "gst": val("TotalTax") or val("TaxAmount"),
-                "total_amount": val("InvoiceTotal"),
-                "items_azure": fields.get("Items"),
-                "raw_fields": fields,
-            }
-        elif status == "failed":
-            break
-        time.sleep(1)
-    return {}
+    fields = docs[0].get("fields", {})
+    items = fields.get("Items")
+    if len(docs) > 1:
+        # a long invoice may come back as several documents; keep all line items in order
+        merged: List[Any] = []
+        for d in docs:
+            it = d.get("fields", {}).get("Items")
+            merged.extend(it.get("valueArray", []) if isinstance(it, dict) else (it or []))
+        items = {"type": "array", "valueArray": merged}
+
+    def val(k):
+        return fields.get(k, {}).get("content")
+
+    return {
+        "vendor": val("VendorName"),
+        "invoice_no": val("InvoiceId"),
+        "invoice_date": val("InvoiceDate") or val("InvoiceDateIssued") or val("DueDate"),
+        "gst": val("TotalTax") or val("TaxAmount"),
+        "total_amount": val("InvoiceTotal"),
+        "items_azure": items,
+        "raw_fields": fields,
+    }
+
+
+def _timed_azure_extract(pdf_bytes: bytes) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    out = azure_extract(pdf_bytes, timings=timings)
+    timings["azure"] = time.perf_counter() - t0
+    return out, timings
+
+
+_AZURE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_AZURE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _azure_executor() -> ThreadPoolExecutor:
+    global _AZURE_EXECUTOR
+    if _AZURE_EXECUTOR is None:
+        with _AZURE_EXECUTOR_LOCK:
+            if _AZURE_EXECUTOR is None:
+                # threads beyond the client's in-flight cap just queue on its semaphore
+                _AZURE_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=get_azure_client().max_inflight * 2, thread_name_prefix="azure"
+                )
+    return _AZURE_EXECUTOR
 
 
 def normalize_azure_item(valobj: Dict[str, Any]) -> Dict[str, Any]:
-    out = {
-        "description": None,
-        "hsn": None,
-        "quantity": None,
-        "unit": None,
-        "unit_price": None,
-        "taxable_value": None,
-        "cgst_percent": None,
-        "cgst_amount": None,
-        "sgst_percent": None,
-        "sgst_amount": None,
-        "gst_percent": None,
-        "gst_amount": None,
-        "igst_percent": None,
-        "igst_amount": None,
-        "line_total": None,
-    }
+    return azure_line_item(valobj).to_dict()
+
+
+def azure_line_item(valobj: Dict[str, Any]) -> LineItem:
     v = valobj.get("valueObject", {}) if isinstance(valobj, dict) else valobj
-    out["description"] = v.get("Description", {}).get("content") or v.get("Description", {}).get("valueString")
-    out["hsn"] = v.get("ProductCode", {}).get("content") or v.get("ProductCode", {}).get("valueString")
+    item = LineItem()
+    item.description = v.get("Description", {}).get("content") or v.get("Description", {}).get("valueString")
+    item.hsn = v.get("ProductCode", {}).get("content") or v.get("ProductCode", {}).get("valueString")
     qty = v.get("Quantity", {}).get("valueNumber") or v.get("Quantity", {}).get("content")
     if isinstance(qty, (int, float)):
-        out["quantity"] = int(qty) if isinstance(qty, int) or (isinstance(qty, float) and qty.is_integer()) else float(qty)
+        item.quantity = int(qty) if isinstance(qty, int) or (isinstance(qty, float) and qty.is_integer()) else float(qty)
     else:
         try:
-            out["quantity"] = int(str(qty)) if str(qty).isdigit() else float(qty)
+            item.quantity = int(str(qty)) if str(qty).isdigit() else float(qty)
         except Exception:
-            out["quantity"] = None
+            item.quantity = None
     up = v.get("UnitPrice", {}).get("valueCurrency", {}).get("amount") or v.get("UnitPrice", {}).get("content")
-    out["unit_price"] = float(to_decimal(up)) if up else None
+    item.unit_price = float(to_decimal(up)) if up else None
     amt = v.get("Amount", {}).get("valueCurrency", {}).get("amount") or v.get("Amount", {}).get("content")
-    out["taxable_value"] = float(to_decimal(amt)) if amt else None
-    out["unit"] = v.get("Unit", {}).get("valueString") or v.get("Unit", {}).get("content")
-    return out
+    item.taxable = to_paise(amt) if amt else None
+    item.unit = v.get("Unit", {}).get("valueString") or v.get("Unit", {}).get("content")
+    return item
 
 
 def extract_gstins_with_context(text: str) -> List[Tuple[str, int, str]]:
-    out: List[Tuple[str, int, str]] = []
-    if not text:
-        return out
-    upper = text.upper()
-    for pat in GST_LABEL_PATTERNS:
-        for m in re.finditer(pat, upper, flags=re.I | re.S):
-            raw = m.group(1)
-            pos = m.start(1)
-            cleaned = re.sub(r"[^0-9A-Z]", "", raw.upper())
-            if len(cleaned) == 15 and re.match(r"[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z0-9]{3}", cleaned):
-                window = upper[max(0, pos - 60) : pos + 60]
-                label = "other"
-                if any(k in window for k in ("COMPANY", "VENDOR", "SELLER", "SUPPLIER", "FROM")):
-                    label = "company"
-                if any(k in window for k in ("BUYER", "BILL TO", "CONSIGNEE", "SHIP TO", "TO")):
-                    label = "buyer"
-                out.append((cleaned, pos, label))
-    if not out:
-        for m in re.finditer(GST_SIMPLE, upper):
-            gst = m.group(1)
-            pos = m.start(1)
-            if re.match(r"[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z0-9]{3}", gst):
-                window = upper[max(0, pos - 60) : pos + 60]
-                label = "other"
-                if any(k in window for k in ("COMPANY", "VENDOR", "SELLER", "SUPPLIER", "FROM")):
-                    label = "company"
-                if any(k in window for k in ("BUYER", "BILL TO", "CONSIGNEE", "SHIP TO", "TO")):
-                    label = "buyer"
-                out.append((gst, pos, label))
-    seen = set()
-    out2: List[Tuple[str, int, str]] = []
-    for g, p, l in sorted(out, key=lambda x: x[1]):
-        if g not in seen:
-            seen.add(g)
-            out2.append((g, p, l))
-    return out2
+    return scan_fields(text).gstins()
 
 
 def extract_irn_loose(text: str) -> Optional[str]:
-    if not text:
-        return None
-    m = IRN_RE.search(text)
-    if m:
-        return m.group(1).replace(" ", "").lower()
-    cleaned = re.sub(r"\s+", "", text)
-    m2 = IRN_RE.search(cleaned)
-    if m2:
-        return m2.group(1).replace(" ", "").lower()
-    m3 = re.search(r"([a-f0-9]{60,64}).{0,8}?-?.{0,8}?([a-f0-9]{28,32})", cleaned, flags=re.I)
-    if m3:
-        return (m3.group(1) + "-" + m3.group(2)).lower()
-    return None
+    return scan_fields(text).first("irn")
 
 
 def extract_amount_in_words_best(text: str) -> Optional[str]:
-    if not text:
-        return None
-    m = re.search(r"(INR[\s\S]{0,120}?Only)", text, flags=re.I)
-    if m:
-        return m.group(1).strip()
-    m2 = re.search(r"Amount Chargeable\s*\(in words\)\s*[:\-\s]*([\s\S]{1,120})", text, flags=re.I)
-    if m2:
-        return m2.group(1).splitlines()[0].strip()
-    return None
+    return scan_fields(text).first("amount_in_words")
 
 
 def find_company_like_line(lines: List[str]) -> Optional[str]:
     for ln in lines[:30]:
         L = ln.upper()
-        if any(k in L for k in COMPANY_KEYWORDS) and len(ln) > 3 and not re.search(r"GSTIN|TAX|INVOICE|IRN|ACK", L):
+        if any(k in L for k in COMPANY_KEYWORDS) and len(ln) > 3 and not _COMPANY_LINE_SKIP.search(L):
             return ln
     for ln in lines[:12]:
-        if len(ln) > 4 and ln.isupper() and not re.search(r"TAX|INVOICE|GSTIN|IRN|ACK", ln.upper()):
+        if len(ln) > 4 and ln.isupper() and not _HEADER_LINE_SKIP.search(ln.upper()):
             return ln
     for ln in lines[:20]:
-        if len(ln) > 3 and not re.search(r"TAX INVOICE|INVOICE|IRN|ACK|DATE|HSN|GSTIN", ln, flags=re.I):
+        if len(ln) > 3 and not _NAME_LINE_SKIP.search(ln):
             return ln
     return None
 
 
 def find_buyer_name(lines: List[str]) -> Optional[str]:
     for i, ln in enumerate(lines):
-        if re.search(r"Buyer|Bill to|Bill To|Buyer \(Bill to\)|Consignee|Ship to|Bill\s*to", ln, flags=re.I):
+        if _BUYER_LABEL.search(ln):
             for j in range(i + 1, min(i + 6, len(lines))):
                 cand = lines[j].strip()
-                if cand and not re.search(r"GSTIN|GST|ADDRESS|STATE|PIN|PHONE|MOBILE", cand, flags=re.I):
+                if cand and not _BUYER_LINE_SKIP.search(cand):
                     return cand
     for ln in lines:
-        if any(k in ln.upper() for k in COMPANY_KEYWORDS) and not re.search(r"TAX|INVOICE|GSTIN", ln, flags=re.I):
+        if any(k in ln.upper() for k in COMPANY_KEYWORDS) and not _BUYER_COMPANY_SKIP.search(ln):
             return ln
     return None
 
 
-def compute_item_gst(item: Dict[str, Any], db_client: Optional[Any] = None) -> Dict[str, Any]:
-    taxable = to_decimal(item.get("taxable_value") or item.get("taxable") or item.get("amount"))
-    gst_pct = to_decimal(item.get("gst_percent") or item.get("gst") or item.get("total_gst"))
-    cgst_pct = to_decimal(item.get("cgst_percent") or item.get("cgst"))
-    sgst_pct = to_decimal(item.get("sgst_percent") or item.get("sgst"))
-    igst_pct = to_decimal(item.get("igst_percent") or item.get("igst"))
+def compute_item_gst(item: Dict[str, Any], hsn_rates: Optional[Dict[str, Optional[Decimal]]] = None) -> Dict[str, Any]:
+    # unlike LineItem.from_dict, this helper has always read bare cgst/sgst/igst as rates
+    shaped = {k: v for k, v in item.items() if k not in ("cgst", "sgst", "igst")}
+    for tax in ("cgst", "sgst", "igst"):
+        if not shaped.get(f"{tax}_percent") and item.get(tax):
+            shaped[f"{tax}_percent"] = item[tax]
+    line = _item_gst(LineItem.from_dict(shaped), hsn_rates)
+    item.update(line.to_dict())
+    if line.notes:
+        item["notes"] = line.notes
+    return item
+
+
+def _item_gst(item: LineItem, hsn_rates: Optional[Dict[str, Optional[Decimal]]] = None) -> LineItem:
+    """compute_item_gst on a LineItem, in place."""
+    taxable = item.taxable
+    gst_pct = item.gst_percent
+    cgst_pct = item.cgst_percent
+    sgst_pct = item.sgst_percent
+    igst_pct = item.igst_percent
 
     if gst_pct is None and (cgst_pct is not None or sgst_pct is not None):
         cg = cgst_pct or Decimal("0")
         sg = sgst_pct or Decimal("0")
         gst_pct = cg + sg
 
-    if gst_pct is None and item.get("hsn"):
-        gst_from_hsn = get_gst_for_hsn(item.get("hsn"), db_client=db_client)
+    if gst_pct is None and item.hsn:
+        if hsn_rates is not None:
+            gst_from_hsn = hsn_rates.get(clean_code(item.hsn))
+        else:
+            gst_from_hsn = get_gst_for_hsn(item.hsn)
         if gst_from_hsn is not None:
             gst_pct = gst_from_hsn
-            item.setdefault("notes", {})
-            item["notes"]["filled_gst_from_hsn"] = True
+            item.notes = dict(item.notes or {}, filled_gst_from_hsn=True)
 
     if gst_pct is not None and (cgst_pct is None and sgst_pct is None and igst_pct is None):
         try:
@@ -490,43 +560,31 @@ def compute_item_gst(item: Dict[str, Any], db_client: Optional[Any] = None) -> D
     gst_amt = None
     if taxable is not None:
         if cgst_pct is not None:
-            cgst_amt = quant2(taxable * cgst_pct / Decimal("100"))
+            cgst_amt = percent_of(taxable, cgst_pct)
         if sgst_pct is not None:
-            sgst_amt = quant2(taxable * sgst_pct / Decimal("100"))
+            sgst_amt = percent_of(taxable, sgst_pct)
         if igst_pct is not None:
-            igst_amt = quant2(taxable * igst_pct / Decimal("100"))
+            igst_amt = percent_of(taxable, igst_pct)
         amounts = [a for a in (cgst_amt, sgst_amt, igst_amt) if a is not None]
         if amounts:
             gst_amt = sum(amounts)
     if gst_amt is None and gst_pct is not None and taxable is not None:
-        gst_amt = quant2(taxable * gst_pct / Decimal("100"))
-
-    line_total = None
-    if taxable is not None:
-        line_total = float((taxable + (gst_amt or Decimal("0"))).quantize(Decimal("0.01")))
-
-    if gst_pct is not None:
-        item["gst_percent"] = float(gst_pct)
-    else:
-        item["gst_percent"] = None
-    item["gst_amount"] = float(gst_amt) if gst_amt is not None else None
-    item["cgst_percent"] = float(cgst_pct) if cgst_pct is not None else None
-    item["sgst_percent"] = float(sgst_pct) if sgst_pct is not None else None
-    item["igst_percent"] = float(igst_pct) if igst_pct is not None else None
-    item["cgst_amount"] = float(cgst_amt) if cgst_amt is not None else None
-    item["sgst_amount"] = float(sgst_amt) if sgst_amt is not None else None
-    item["igst_amount"] = float(igst_amt) if igst_amt is not None else None
-    item["line_total"] = line_total
-
-    if (item.get("gst_percent") is None) and (not item.get("hsn")):
-        item.setdefault("anomalies", []).append("missing_gst_and_hsn")
-    try:
-        if item.get("gst_percent") is not None:
-            gp = Decimal(str(item["gst_percent"]))
-            if not any(abs(gp - s) <= SLAB_TOLERANCE for s in STANDARD_GST_SLABS):
-                item.setdefault("anomalies", []).append("nonstandard_gst_slab")
-    except Exception:
-        pass
+        gst_amt = percent_of(taxable, gst_pct)
+
+    item.gst_percent = gst_pct
+    item.cgst_percent = cgst_pct
+    item.sgst_percent = sgst_pct
+    item.igst_percent = igst_pct
+    item.gst = gst_amt
+    item.cgst = cgst_amt
+    item.sgst = sgst_amt
+    item.igst = igst_amt
+    item.line_total = taxable + (gst_amt or 0) if taxable is not None else None
+
+    if gst_pct is None and not item.hsn:
+        item.anomalies.append("missing_gst_and_hsn")
+    if gst_pct is not None and not any(abs(gst_pct - s) <= SLAB_TOLERANCE for s in STANDARD_GST_SLABS):
+        item.anomalies.append("nonstandard_gst_slab")
 
     return item
 
@@ -553,29 +611,9 @@ def build_priority_nested_json(flat_result: Dict[str, Any]) -> Dict[str, Any]:
         "total_igst": flat_result.get("total_igst") if flat_result.get("total_igst") else None,
         "amount_in_words": flat_result.get("amount_in_words"),
     }
-    nested_items: List[Dict[str, Any]] = []
-    for it in flat_result.get("items", []):
-        nested_items.append(
-            {
-                "hsn": it.get("hsn"),
-                "description": it.get("description"),
-                "quantity": it.get("quantity"),
-                "unit": it.get("unit"),
-                "unit_price": it.get("unit_price"),
-                "taxable_value": it.get("taxable_value"),
-                "gst_percent": it.get("gst_percent"),
-                "gst_amount": it.get("gst_amount"),
-                "cgst_percent": it.get("cgst_percent"),
-                "cgst_amount": it.get("cgst_amount"),
-                "sgst_percent": it.get("sgst_percent"),
-                "sgst_amount": it.get("sgst_amount"),
-                "igst_percent": it.get("igst_percent"),
-                "igst_amount": it.get("igst_amount"),
-                "line_total": it.get("line_total"),
-                "line_no": it.get("line_no"),
-                "anomalies": it.get("anomalies", []),
-            }
-        )
+    nested_items = [
+        (it if isinstance(it, LineItem) else LineItem.from_dict(it)).to_dict() for it in flat_result.get("items", [])
+    ]
     nested["items"] = nested_items
     nested["metadata"] = {
         "hsn_codes_detected": flat_result.get("hsn_codes"),
@@ -583,15 +621,23 @@ def build_priority_nested_json(flat_result: Dict[str, Any]) -> Dict[str, Any]:
         "computed_items_sum": flat_result.get("computed_items_sum"),
         "raw_text_sample": (flat_result.get("raw_text_sample")[:2000] if flat_result.get("raw_text_sample") else None),
         "azure_raw_fields": flat_result.get("azure_raw", None),
+        "timings": flat_result.get("timings"),
+        "fields": flat_result.get("fields"),
     }
     nested["source_file"] = flat_result.get("file")
     nested["anomalies"] = flat_result.get("anomalies", [])
     return nested
 
 
-def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
+def build_output(
+    source: Source,
+    max_pages: Optional[int] = None,
+    use_text_layer: bool = True,
+    ocr_quality: str = OCR_QUALITY,
+    local_items: bool = LOCAL_TABLE_ITEMS,
+) -> Dict[str, Any]:
     result: Dict[str, Any] = {
-        "file": pdf_path,
+        "file": None,
         "invoice_no": None,
         "invoice_date": None,
         "vendor_name": None,
@@ -614,22 +660,69 @@ def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
         "anomalies": [],
     }
 
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-
-    azure = {}
-    try:
-        azure = azure_extract(pdf_bytes)
-    except Exception:
-        azure = {}
-
-    img = load_image_any(pdf_path, page=page)
-    img = deskew_image(img)
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    # Azure is network-bound and independent of local text extraction: start it
+    # first, do the text layer / OCR work meanwhile, and only then wait for it
+    azure_future = None
+    doc = _as_document(source)
+    result["file"] = doc.name
+    if get_azure_client().configured:
+        azure_future = _azure_executor().submit(_timed_azure_extract, doc.read_bytes())
+
+    total_pages = page_count(doc)
+    pages = list(range(min(total_pages, max_pages or EXTRACT_MAX_PAGES)))
+    result["notes"]["pages"] = {"total": total_pages, "processed": len(pages)}
+
+    # digitally generated PDFs carry their own text: use it and OCR only the pages without
+    page_texts: List[str] = [""] * len(pages)
+    # word boxes per page for the local table extractor
+    layouts: List[Optional[PageLayout]] = [None] * len(pages)
+    if use_text_layer and doc.is_pdf:
+        t0 = time.perf_counter()
+        if local_items:
+            page_layouts = pdf_page_layouts(doc, pages)
+        else:
+            page_layouts = [PageLayout(words) for words in pdf_page_words(doc, pages)]
+        for i, layout in enumerate(page_layouts):
+            txt = words_to_text(layout.words)
+            if has_usable_text(txt):
+                page_texts[i] = txt
+                layouts[i] = layout
+        timings["text_layer"] = time.perf_counter() - t0
+    native = sum(1 for t in page_texts if t)
+    TEXT_LAYER_STATS["documents"] += 1
+    TEXT_LAYER_STATS["fast_path_pages"] += native
+    if pages and native == len(pages):
+        TEXT_LAYER_STATS["fast_path_documents"] += 1
+    result["notes"]["text_source"] = "text_layer" if native == len(pages) else ("mixed" if native else "ocr")
 
     paddle_txt = ""
     tess_txt = ""
-    if TESS_AVAILABLE:
-        tess_txt = tesseract_text(img)
+    todo = [p for i, p in enumerate(pages) if not page_texts[i]]
+    if todo and ocr.available():
+        # word boxes come from the same OCR pass; kept even with Azure, in case it fails or finds no items
+        ocr_layouts: Optional[List[Optional[PageLayout]]] = [] if local_items else None
+        for p, txt in zip(todo, ocr_pages(doc, todo, ocr_quality, timings=timings, layouts=ocr_layouts)):
+            page_texts[p] = txt
+        for p, layout in zip(todo, ocr_layouts or []):
+            layouts[p] = layout
+    tess_txt = "\n".join(t for t in page_texts if t)
+    timings["local_text"] = time.perf_counter() - started
+
+    azure: Dict[str, Any] = {}
+    if azure_future is not None:
+        t0 = time.perf_counter()
+        try:
+            azure, azure_timings = azure_future.result()
+            timings.update(azure_timings)
+        except Exception as e:
+            azure = {"error": f"{type(e).__name__}: {e}"}
+        timings["azure_wait"] = time.perf_counter() - t0
+        if azure.get("error"):
+            result["notes"]["azure_error"] = azure["error"]
+    parse_started = time.perf_counter()
 
     agg_text = "\n".join([s for s in (paddle_txt, tess_txt) if s]).strip()
     result["raw_text_sample"] = agg_text
@@ -647,16 +740,23 @@ def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
     if azure.get("gst"):
         result["total_tax"] = float(to_decimal(azure.get("gst")) or 0)
 
-    irn_candidate = extract_irn_loose(agg_text)
-    result["irn"] = irn_candidate or result.get("irn")
-    m_ack = re.search(r"\bAck\s*No\.?\s*[:\-]?\s*([0-9]{6,})", agg_text, flags=re.I)
-    if m_ack:
-        result["ack_no"] = m_ack.group(1)
-    m_ackd = re.search(r"\bAck\s*Date\s*[:\-]?\s*([0-9]{1,2}[/-][A-Za-z0-9]{1,3}[/-][0-9]{2,4})", agg_text, flags=re.I)
-    if m_ackd:
-        result["ack_date"] = parse_date(m_ackd.group(1))
-
-    gst_positions = extract_gstins_with_context(agg_text)
+    # one scan of the text for every regex-found field; spans kept for check_invoice
+    fields = scan_fields(agg_text)
+    result["fields"] = fields.to_dict()
+    if not result.get("invoice_no"):
+        result["invoice_no"] = fields.first("invoice_no")
+    if not result.get("invoice_date") and fields.first("invoice_date"):
+        result["invoice_date"] = parse_date(fields.first("invoice_date"))
+    if result.get("total_amount") is None and fields.first("total"):
+        amount = to_decimal(fields.first("total"))
+        result["total_amount"] = float(amount) if amount is not None else None
+
+    result["irn"] = fields.first("irn") or result.get("irn")
+    result["ack_no"] = fields.first("ack_no")
+    if fields.first("ack_date"):
+        result["ack_date"] = parse_date(fields.first("ack_date"))
+
+    gst_positions = fields.gstins()
     if gst_positions:
         seller = None
         buyer = None
@@ -681,9 +781,9 @@ def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
         if b:
             result["buyer_name"] = b
 
-    result["hsn_codes"] = list(dict.fromkeys(HSN_RE.findall(agg_text)))
+    result["hsn_codes"] = list(dict.fromkeys(fields.values("hsn")))
 
-    items_out: List[Dict[str, Any]] = []
+    items_out: List[LineItem] = []
     if azure.get("items_azure"):
         try:
             arr = (
@@ -694,73 +794,68 @@ def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
             idx = 1
             for entry in arr:
                 try:
-                    normalized = normalize_azure_item(entry if isinstance(entry, dict) else {"valueObject": entry})
-                    normalized["line_no"] = idx
-                    items_out.append(normalized)
+                    line = azure_line_item(entry if isinstance(entry, dict) else {"valueObject": entry})
+                    line.line_no = idx
+                    items_out.append(line)
                 except Exception:
                     pass
                 idx += 1
         except Exception:
             items_out = []
-
-    # Fallback: if Azure didn't provide items, we leave empty (text table parsing omitted for brevity)
-
-    db_client = None
-    if MONGO_AVAILABLE and MONGO_URI:
+    if items_out:
+        result["notes"]["items_source"] = "azure"
+    elif local_items and any(layouts):
+        # no Azure items: rebuild them from the item table's word boxes
+        t0 = time.perf_counter()
         try:
-            db_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=3000)
-            db_client.server_info()
+            items_out = extract_table_items(layouts)
         except Exception:
-            db_client = None
-
-    for i, it in enumerate(items_out):
+            items_out = []
+        timings["table"] = time.perf_counter() - t0
+        if items_out:
+            result["notes"]["items_source"] = "local_table"
+
+    t0 = time.perf_counter()
+    hsn_rates = get_hsn_index().resolve_many(it.hsn for it in items_out if it.hsn)
+    timings["hsn_lookup"] = time.perf_counter() - t0
+    for it in items_out:
         try:
-            items_out[i] = compute_item_gst(it, db_client=db_client)
+            _item_gst(it, hsn_rates=hsn_rates)
         except Exception:
-            items_out[i]["anomalies"] = items_out[i].get("anomalies", []) + ["gst_compute_error"]
+            it.anomalies.append("gst_compute_error")
 
+    # LineItems until build_priority_nested_json; check_invoice gets the same objects via facts
     result["items"] = items_out
-    try:
-        result["computed_items_sum"] = float(sum(Decimal(str(it.get("taxable_value") or 0)) for it in items_out))
-    except Exception:
-        result["computed_items_sum"] = None
+    result["facts"] = InvoiceFacts(fields, items_out)
+    result["computed_items_sum"] = to_rupees(sum(it.taxable or 0 for it in items_out))
 
-    sum_cgst = sum(Decimal(str(it.get("cgst_amount") or 0)) for it in items_out) if items_out else Decimal("0")
-    sum_sgst = sum(Decimal(str(it.get("sgst_amount") or 0)) for it in items_out) if items_out else Decimal("0")
-    sum_igst = sum(Decimal(str(it.get("igst_amount") or 0)) for it in items_out) if items_out else Decimal("0")
-    sum_gst = sum(Decimal(str(it.get("gst_amount") or 0)) for it in items_out) if items_out else Decimal("0")
+    sum_cgst = sum(it.cgst or 0 for it in items_out)
+    sum_sgst = sum(it.sgst or 0 for it in items_out)
+    sum_igst = sum(it.igst or 0 for it in items_out)
+    sum_gst = sum(it.gst or 0 for it in items_out)
 
-    result["total_cgst"] = float(sum_cgst) if sum_cgst else result.get("total_cgst")
-    result["total_sgst"] = float(sum_sgst) if sum_sgst else result.get("total_sgst")
-    result["total_igst"] = float(sum_igst) if sum_igst else result.get("total_igst")
+    result["total_cgst"] = to_rupees(sum_cgst) if sum_cgst else result.get("total_cgst")
+    result["total_sgst"] = to_rupees(sum_sgst) if sum_sgst else result.get("total_sgst")
+    result["total_igst"] = to_rupees(sum_igst) if sum_igst else result.get("total_igst")
     if result.get("total_tax") is None and sum_gst:
-        result["total_tax"] = float(sum_gst)
+        result["total_tax"] = to_rupees(sum_gst)
 
-    maybe_words = extract_amount_in_words_best(agg_text)
-    if maybe_words:
-        result["amount_in_words"] = maybe_words
+    if fields.first("amount_in_words"):
+        result["amount_in_words"] = fields.first("amount_in_words")
 
-    panm = PAN_RE.search(agg_text)
-    if panm:
-        result["notes"]["company_pan"] = panm.group(1)
+    if fields.first("pan"):
+        result["notes"]["company_pan"] = fields.first("pan")
 
     anomalies: List[str] = []
-    try:
-        line_totals_sum = sum(Decimal(str(it.get("line_total") or 0)) for it in items_out)
-        if result["total_amount"] is not None:
-            if abs(Decimal(str(result["total_amount"])) - Decimal(str(line_totals_sum))) > Decimal("0.5"):
-                anomalies.append(
-                    f"Total mismatch: stated {result['total_amount']} vs sum of line_totals {line_totals_sum}."
-                )
-    except Exception:
-        pass
-    try:
-        computed_gst_sum = sum(Decimal(str(it.get("gst_amount") or 0)) for it in items_out)
-        if result.get("total_tax") is not None:
-            if abs(Decimal(str(result.get("total_tax"))) - computed_gst_sum) > Decimal("0.5"):
-                anomalies.append("GST mismatch between reported GST and sum(item gst amounts).")
-    except Exception:
-        pass
+    line_totals_sum = sum(it.line_total or 0 for it in items_out)
+    stated_total = to_paise(result["total_amount"])
+    if stated_total is not None and abs(stated_total - line_totals_sum) > MISMATCH_TOLERANCE_PAISE:
+        anomalies.append(
+            f"Total mismatch: stated {result['total_amount']} vs sum of line_totals {Decimal(line_totals_sum).scaleb(-2)}."
+        )
+    stated_tax = to_paise(result.get("total_tax"))
+    if stated_tax is not None and abs(stated_tax - sum_gst) > MISMATCH_TOLERANCE_PAISE:
+        anomalies.append("GST mismatch between reported GST and sum(item gst amounts).")
 
     try:
         if result.get("invoice_date"):
@@ -771,35 +866,44 @@ def build_output(pdf_path: str, page: int = 0) -> Dict[str, Any]:
         pass
 
     result["anomalies"] = anomalies
+    timings["parse"] = time.perf_counter() - parse_started - timings["hsn_lookup"] - timings.get("table", 0.0)
+    timings["total"] = time.perf_counter() - started
+    metrics.observe_many(timings, ("text_layer", "azure_submit", "azure_poll", "table", "parse", "hsn_lookup"))
+    result["timings"] = {k: round(v, 4) for k, v in timings.items()}
     return result
 
 
 def insert_into_mongo(nested_doc: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
-    if not (MONGO_AVAILABLE and MONGO_URI):
+    """Queue ``nested_doc`` for the background Mongo writer; ``(True, _id)`` once queued.
+
+    The insert itself happens off the request, batched with other invoices
+    (see write_behind.py).
+    """
+    writer = get_writer(MONGO_COLLECTION)
+    if not writer.configured:
         return False, "mongodb not configured"
-    try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        client.server_info()
-        db = client[MONGO_DB]
-        coll = db[MONGO_COLLECTION]
-        res = coll.insert_one(nested_doc)
-        client.close()
-        return True, str(res.inserted_id)
-    except Exception as e:
-        return False, str(e)
+    return True, writer.enqueue(nested_doc)
 
 
 # Public API expected by the Flask adapter
 
 def extract(input: Dict[str, Any]) -> Dict[str, Any]:
     """
-    input may include: text, file_path, url, options
+    input may include: text, document (source.Document), file_path, url, options
     returns: extracted nested dict
     """
+    return extract_with_facts(input)[0]
+
+
+def extract_with_facts(input: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[InvoiceFacts]]:
+    """extract(), plus the parsed fields and item amounts for logic.analyze(facts=...).
+
+    Facts are None on a cache hit and for text-only input.
+    """
     options = input.get("options") or {}
 
     # If text-only, return minimal stub
-    if input.get("text") and not (input.get("file_path") or input.get("url")):
+    if input.get("text") and not (input.get("document") or input.get("file_path") or input.get("url")):
         text = str(input["text"])[:2000]
         return {
             "company": {},
@@ -809,37 +913,65 @@ def extract(input: Dict[str, Any]) -> Dict[str, Any]:
             "metadata": {"raw_text_sample": text},
             "source_file": None,
             "anomalies": ["text_only_input"],
-        }
-
-    # Resolve file
-    file_path = input.get("file_path")
-    temp_file = None
-    if not file_path and input.get("url"):
-        if not requests:
-            raise RuntimeError("requests not installed to download URL")
-        resp = requests.get(input["url"], timeout=30)
-        resp.raise_for_status()
-        upload_dir = options.get("upload_dir") or os.path.join(os.getcwd(), "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        fd, temp_file = tempfile.mkstemp(suffix=".bin", dir=upload_dir)
-        with os.fdopen(fd, "wb") as f:
-            f.write(resp.content)
-        file_path = temp_file
-
-    if not file_path:
+        }, None
+
+    # Resolve the document: an in-memory upload, a saved file, or a URL streamed into memory
+    doc: Optional[Document] = input.get("document")
+    if doc is None and input.get("file_path"):
+        doc = Document.from_path(input["file_path"])
+    elif doc is None and input.get("url"):
+        doc = fetch_url(input["url"], spool_dir=options.get("upload_dir") or os.path.join(os.getcwd(), "uploads"))
+
+    if doc is None:
         raise ValueError("file_path or url or text must be provided")
+    try:
+        return _extract_document(doc, options)
+    finally:
+        # spooled downloads / large uploads
+        doc.close()
+
+
+def _settings(options: Dict[str, Any]) -> Dict[str, Any]:
+    """The options build_output() runs with, env defaults filled in; part of the cache key."""
+    return {
+        "max_pages": options.get("max_pages") or EXTRACT_MAX_PAGES,
+        "use_text_layer": options.get("use_text_layer", True),
+        "ocr_quality": options.get("ocr_quality") or OCR_QUALITY,
+        "local_items": options.get("local_items", LOCAL_TABLE_ITEMS),
+        "text_layer_min_chars": TEXT_LAYER_MIN_CHARS,
+        "azure": get_azure_client().configured,
+    }
+
+
+def _extract_document(doc: Document, options: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[InvoiceFacts]]:
+    digest = doc.digest
+    settings = _settings(options)
+    cache = get_extract_cache() if options.get("use_cache", True) else None
+    # keyed on the effective settings, so changing an env default doesn't serve stale results
+    key = cache_key(digest, EXTRACTOR_VERSION, dict(options, **settings)) if cache else None
+    nested = cache.get(key) if cache else None
+    facts: Optional[InvoiceFacts] = None
+    if nested is not None:
+        nested["source_file"] = doc.name
+    else:
+        flat = build_output(
+            doc,
+            max_pages=settings["max_pages"],
+            use_text_layer=settings["use_text_layer"],
+            ocr_quality=settings["ocr_quality"],
+            local_items=settings["local_items"],
+        )
+        facts = flat.pop("facts", None)
+        nested = build_priority_nested_json(flat)
+        # a result missing Azure's fields only because the call failed would be served for good
+        if cache and not nested["metadata"]["notes"].get("azure_error"):
+            cache.put(key, nested)
 
-    flat = build_output(file_path)
-    nested = build_priority_nested_json(flat)
+    # checked on every call, cache hit or not: the answer depends on what was ingested since
+    if options.get("check_duplicates", True):
+        nested["metadata"]["duplicate_check"] = fingerprint.register(nested, ref=digest)
 
     if options.get("insert_into_mongo"):
         insert_into_mongo(nested)
 
-    # cleanup temp
-    if temp_file and os.path.exists(temp_file):
-        try:
-            os.remove(temp_file)
-        except Exception:
-            pass
-
-    return nested
+    return nested, facts
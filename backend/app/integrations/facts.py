@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+from .fields import FieldScan
+from .model import LineItem
+
+# What extract() already worked out, handed to check_invoice on the process
+# path (/api/process, jobs, batch) so nothing is parsed twice. Never
+# serialized: /api/analyze on posted JSON rebuilds the same values itself.
+
+
+class InvoiceFacts:
+    """Parsed fields (with spans) and computed line items of one extracted invoice.
+
+    ``items`` lines up with ``extracted["items"]``; it is None when the
+    amounts are unknown (cache hit, posted JSON).
+    """
+
+    __slots__ = ("fields", "items")
+
+    def __init__(self, fields: FieldScan, items: Optional[List[LineItem]] = None) -> None:
+        self.fields = fields
+        self.items = items
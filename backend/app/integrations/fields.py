@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Every pattern is compiled once here. scan_fields() makes two passes over
+# the text: a token pass (words shaped like a PAN, HSN code, GSTIN or IRN
+# piece) and one pass of a combined alternation for the labelled fields.
+# Amount-in-words (free text that may span lines) and UPI ids (only when the
+# text has an "@") are searched apart.
+
+# only words that can be one of the token fields reach Python: PAN-shaped,
+# 4-8 digit (HSN), hex (IRN pieces) or 15+ characters (GSTIN)
+_TOKEN_RE = re.compile(r"\b(?:(?P<pan>[A-Z]{5}[0-9]{4}[A-Z])|(?P<hsn>[0-9]{4,8})|(?P<run>\w{15,}|[0-9a-fA-F]{8,14}))\b")
+_GSTIN_SHAPE = re.compile(r"[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z0-9]{4}")
+_HEX = frozenset("0123456789abcdefABCDEF")
+
+# every label starts a word with one of these letters; the lookahead lets the
+# engine reject other positions before trying the alternatives
+_LABELLED_RE = re.compile(
+    r"\b(?=[ADFGIPRSTU])(?:" + "|".join([
+        r"Ack\s*No\.?\s*[:\-]?\s*(?P<ack_no>[0-9]{6,})",
+        r"Ack\s*Date\s*[:\-]?\s*(?P<ack_date>[0-9]{1,2}[/-][A-Za-z0-9]{1,3}[/-][0-9]{2,4})",
+        r"Invoice[ \t]*(?:No\b|Number\b|#)\.?[ \t]*[:\-]?[ \t]*(?P<invoice_no>[A-Z0-9][A-Z0-9/\-]{1,30})",
+        r"(?:Invoice[ \t]*Date|Dated|Date)[ \t]*[:\-]?[ \t]*"
+        r"(?P<invoice_date>[0-9]{1,2}[/.\- ][A-Za-z0-9]{1,3}[/.\- ][0-9]{2,4})",
+        r"(?:Grand[ \t]*Total|Total[ \t]*Amount|Invoice[ \t]*Total|Amount[ \t]*Payable)[ \t]*[:\-]?[ \t]*"
+        r"(?:INR|Rs\.?|₹)?[ \t]*(?P<total>[0-9][0-9,]*(?:\.\d{1,2})?)",
+        # GSTINs broken up by OCR ("29ABCDE 1234F1Z5"); unbroken ones come from the token pass
+        r"GSTIN(?:\s*/\s*UIN)?\s*[:\-]?\s*(?P<gstin_spaced>[0-9]{2}(?:[ \-]?[0-9A-Z]){13})\b",
+        r"(?:Txn ID|Transaction ID|UTR|Ref|TXN|Transaction No|Trans ID)\s*[:\-\s]*(?P<upi_txn>[A-Za-z0-9\-_/]{6,})",
+        r"(?:From|Sender|Remitter|Paid By)[ \t]*[:\-]?[ \t]*(?P<upi_sender>[A-Za-z][A-Za-z \t]{1,59})",
+    ]) + ")",
+    flags=re.I,
+)
+_UPI_ID_RE = re.compile(r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}")
+# first amount-looking number of a UPI receipt
+_AMOUNT_RE = re.compile(r"([0-9]{1,3}(?:,[0-9]{3})*(?:\.\d+)?)")
+_NOT_ALNUM = re.compile(r"[^0-9A-Z]")
+
+_WORDS_INR_RE = re.compile(r"(INR[\s\S]{0,120}?Only)", flags=re.I)
+_WORDS_CHARGEABLE_RE = re.compile(r"Amount Chargeable\s*\(in words\)\s*[:\-\s]*([\s\S]{1,120})", flags=re.I)
+
+# header fields: the first occurrence wins, like re.search
+_FIRST_ONLY = frozenset(("ack_no", "ack_date", "invoice_no", "invoice_date", "total"))
+
+_SELLER_WORDS = ("COMPANY", "VENDOR", "SELLER", "SUPPLIER", "FROM")
+_BUYER_WORDS = ("BUYER", "BILL TO", "CONSIGNEE", "SHIP TO", "TO")
+
+Span = Tuple[int, int, str]
+
+
+class FieldScan:
+    """Result of :func:`scan_fields`: ``{field: [(start, end, value), ...]}`` in text order.
+
+    Fields: pan, hsn, gstin (value is the cleaned GSTIN, label in
+    ``gstin_labels``), irn, ack_no, ack_date, invoice_no, invoice_date,
+    total, upi_id, upi_txn, upi_sender, upi_amount, amount_in_words.
+    """
+
+    __slots__ = ("spans", "gstin_labels")
+
+    def __init__(self) -> None:
+        self.spans: Dict[str, List[Span]] = {}
+        self.gstin_labels: List[str] = []
+
+    def add(self, field: str, start: int, end: int, value: str) -> None:
+        self.spans.setdefault(field, []).append((start, end, value))
+
+    def first(self, field: str) -> Optional[str]:
+        hits = self.spans.get(field)
+        return hits[0][2] if hits else None
+
+    def values(self, field: str) -> List[str]:
+        return [v for _, _, v in self.spans.get(field, ())]
+
+    def gstins(self) -> List[Tuple[str, int, str]]:
+        """``(gstin, position, "company" | "buyer" | "other")``, first occurrence of each."""
+        return [(v, s, label) for (s, _, v), label in zip(self.spans.get("gstin", ()), self.gstin_labels)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {k: [list(s) for s in v] for k, v in self.spans.items()}
+        if self.gstin_labels:
+            out["gstin_labels"] = list(self.gstin_labels)
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FieldScan":
+        scan = cls()
+        for k, v in (data or {}).items():
+            if k == "gstin_labels":
+                scan.gstin_labels = list(v)
+            else:
+                scan.spans[k] = [tuple(s) for s in v]  # type: ignore[misc]
+        return scan
+
+
+def _gstin_label(upper: str, pos: int) -> str:
+    window = upper[max(0, pos - 60): pos + 60]
+    label = "other"
+    if any(k in window for k in _SELLER_WORDS):
+        label = "company"
+    if any(k in window for k in _BUYER_WORDS):
+        label = "buyer"
+    return label
+
+
+def scan_fields(text: str) -> FieldScan:
+    scan = FieldScan()
+    if not text:
+        return scan
+    upper = text.upper()
+
+    # --- token pass ---
+    gstins: List[Span] = []
+    hex_runs: List[Span] = []
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        tok = m.group()
+        n = len(tok)
+        if kind != "run":
+            scan.add(kind, m.start(), m.end(), tok)
+            if n == 8:
+                hex_runs.append((m.start(), m.end(), tok))
+            continue
+        if n >= 15:
+            up = tok.upper()
+            if n == 15:
+                if _GSTIN_SHAPE.fullmatch(up):
+                    gstins.append((m.start(), m.end(), up))
+            else:
+                g = _GSTIN_SHAPE.search(up)
+                if g and not (set(tok) <= _HEX):
+                    gstins.append((m.start() + g.start(), m.start() + g.end(), g.group()))
+        if n >= 8 and set(tok) <= _HEX:
+            hex_runs.append((m.start(), m.end(), tok.lower()))
+
+    # --- labelled pass ---
+    for m in _LABELLED_RE.finditer(text):
+        field = m.lastgroup
+        if field == "gstin_spaced":
+            cleaned = _NOT_ALNUM.sub("", m.group(field).upper())
+            if _GSTIN_SHAPE.fullmatch(cleaned):
+                gstins.append((m.start(field), m.end(field), cleaned))
+            continue
+        if field in _FIRST_ONLY and field in scan.spans:
+            continue
+        value = m.group(field)
+        scan.add(field, m.start(field), m.end(field), value.strip() if field == "upi_sender" else value)
+
+    # GSTINs in text order, deduplicated, labelled by nearby words
+    seen = set()
+    for start, end, g in sorted(gstins):
+        if g not in seen:
+            seen.add(g)
+            scan.add("gstin", start, end, g)
+            scan.gstin_labels.append(_gstin_label(upper, start))
+
+    if "@" in text:
+        for m in _UPI_ID_RE.finditer(text):
+            scan.add("upi_id", m.start(), m.end(), m.group())
+        if "upi_id" in scan.spans:
+            m = _AMOUNT_RE.search(text)
+            if m:
+                scan.add("upi_amount", m.start(1), m.end(1), m.group(1))
+
+    # IRN: a 64-hex run, or OCR-split hex runs separated by whitespace only
+    irn = _irn_from_runs(text, hex_runs)
+    if irn:
+        scan.add("irn", *irn)
+
+    m = _WORDS_INR_RE.search(text)
+    if m:
+        scan.add("amount_in_words", m.start(1), m.end(1), m.group(1).strip())
+    else:
+        m = _WORDS_CHARGEABLE_RE.search(text)
+        if m:
+            scan.add("amount_in_words", m.start(1), m.end(1), m.group(1).splitlines()[0].strip())
+    return scan
+
+
+def _irn_from_runs(text: str, runs: List[Span]) -> Optional[Span]:
+    i = 0
+    while i < len(runs):
+        start, end, value = runs[i]
+        j = i
+        # glue runs separated only by whitespace (OCR line/space breaks)
+        while len(value) < 64 and j + 1 < len(runs) and not text[end:runs[j + 1][0]].strip():
+            j += 1
+            end = runs[j][1]
+            value += runs[j][2]
+        if 60 <= len(value) <= 64:
+            # "<64 hex>-<32 hex>" form kept whole, as the older extractor did
+            nxt = runs[j + 1] if j + 1 < len(runs) else None
+            if nxt and 28 <= len(nxt[2]) <= 32 and text[end:nxt[0]].strip() == "-":
+                return start, nxt[1], f"{value}-{nxt[2]}"
+            return start, end, value
+        i = j + 1
+    return None
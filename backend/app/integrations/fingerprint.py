@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+from .db import DatabaseUnavailable, get_pool
+from .deps import optional
+
+# auto: Mongo when MONGO_URI is set, else SQLite | mongo | sqlite | off
+FINGERPRINT_STORE = os.getenv("FINGERPRINT_STORE", "auto").lower()
+FINGERPRINT_DB = os.getenv("FINGERPRINT_DB", os.path.join(os.getcwd(), "cache", "fingerprints.sqlite3"))
+FINGERPRINT_COLLECTION = os.getenv("FINGERPRINT_COLLECTION", "invoice_fingerprints")
+
+_WS = re.compile(r"\s+")
+_TRAILING = "-/.,:_ "
+# characters OCR most often confuses; folded so "MOM17" and "M0M17" collide
+_OCR_FOLD = str.maketrans({"O": "0", "I": "1"})
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%d-%m-%y", "%d/%m/%y", "%d-%b-%Y", "%d-%b-%y", "%d %b %Y")
+
+
+def _norm_text(value: Any) -> str:
+    if value is None:
+        return ""
+    return _WS.sub("", str(value).upper()).rstrip(_TRAILING).translate(_OCR_FOLD)
+
+
+def _norm_date(value: Any) -> str:
+    s = str(value or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return _norm_text(s)
+
+
+def _norm_amount(value: Any) -> str:
+    s = str(value if value is not None else "").replace(",", "").replace("INR", "").replace("₹", "").strip()
+    try:
+        return str(int(Decimal(s).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100))
+    except (InvalidOperation, ValueError):
+        return ""
+
+
+def fingerprint_keys(doc: Dict[str, Any]) -> List[str]:
+    """Lookup keys for an extracted invoice (nested or flat shape).
+
+    ``inv:<hash>`` of seller GSTIN + invoice no + date + total (paise), when
+    GSTIN and invoice no are known, and ``irn:<irn>`` when an IRN is present.
+    """
+    company = doc.get("company") or {}
+    inv = doc.get("invoice") or {}
+    totals = doc.get("totals") or {}
+    gstin = _norm_text(company.get("gstin") or doc.get("seller_gstin") or doc.get("gstin"))
+    number = _norm_text(inv.get("invoice_no") or doc.get("invoice_no"))
+    keys = []
+    if gstin and number:
+        date = _norm_date(inv.get("invoice_date") or doc.get("invoice_date"))
+        total = _norm_amount(totals.get("total_amount") or doc.get("total_amount"))
+        h = hashlib.sha256("\0".join((gstin, number, date, total)).encode()).hexdigest()[:32]
+        keys.append(f"inv:{h}")
+    irn = re.sub(r"[^0-9a-f]", "", str(inv.get("irn") or doc.get("irn") or "").lower())
+    if len(irn) >= 60:
+        keys.append(f"irn:{irn}")
+    return keys
+
+
+def content_ref(doc: Dict[str, Any]) -> str:
+    """Stable id of a submission when no file digest is available."""
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class MongoFingerprintStore:
+    """Fingerprints as ``_id`` of a Mongo collection: the built-in unique index does the work."""
+
+    name = "mongo"
+
+    def __init__(self, collection: str = FINGERPRINT_COLLECTION):
+        self.collection = collection
+
+    @property
+    def errors(self) -> Tuple[type, ...]:
+        """What a failed claim raises: the breaker's DatabaseUnavailable or any driver error."""
+        errors = optional("pymongo.errors")
+        return (DatabaseUnavailable, errors.PyMongoError) if errors is not None else (DatabaseUnavailable,)
+
+    def claim(self, keys: List[str], ref: str) -> Dict[str, str]:
+        return self.claim_many([(keys, ref)])
+
+    def claim_many(self, claims: List[Tuple[List[str], str]]) -> Dict[str, str]:
+        """Claim every ``(keys, ref)`` pair in one round trip; owners of keys already taken."""
+        bulk_write_error = optional("pymongo.errors").BulkWriteError
+
+        def op(db):
+            coll = db[self.collection]
+            now = datetime.utcnow()
+            docs = [{"_id": k, "ref": ref, "created_at": now} for keys, ref in claims for k in keys]
+            try:
+                coll.insert_many(docs, ordered=False)
+                return {}
+            except bulk_write_error as e:
+                errors = e.details.get("writeErrors", [])
+                if any(err.get("code") != 11000 for err in errors):
+                    raise
+                taken = [err["op"]["_id"] for err in errors]
+                return {d["_id"]: d.get("ref") for d in coll.find({"_id": {"$in": taken}}, {"ref": 1})}
+
+        return get_pool().run(op)
+
+
+class SqliteFingerprintStore:
+    """Local stand-in: one SQLite file (WAL), primary-key lookups, shared by processes."""
+
+    name = "sqlite"
+    errors: Tuple[type, ...] = (sqlite3.Error,)
+
+    def __init__(self, path: str = FINGERPRINT_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints (key TEXT PRIMARY KEY, ref TEXT, created_at TEXT) WITHOUT ROWID"
+            )
+            self._local.conn = conn
+        return conn
+
+    def claim(self, keys: List[str], ref: str) -> Dict[str, str]:
+        return self.claim_many([(keys, ref)])
+
+    def claim_many(self, claims: List[Tuple[List[str], str]]) -> Dict[str, str]:
+        """Claim every ``(keys, ref)`` pair in one transaction; owner of each key afterwards."""
+        conn = self._conn()
+        now = datetime.utcnow().isoformat()
+        rows = [(k, ref, now) for keys, ref in claims for k in keys]
+        all_keys = list({k for k, _, _ in rows})
+        owners: Dict[str, str] = {}
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO fingerprints (key, ref, created_at) VALUES (?, ?, ?)", rows)
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(all_keys), 500):
+                part = all_keys[i : i + 500]
+                owners.update(conn.execute(
+                    f"SELECT key, ref FROM fingerprints WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall())
+        return owners
+
+
+STATS: Dict[str, int] = {"checked": 0, "duplicates": 0, "unavailable": 0}
+
+_STORE: Any = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    """The configured fingerprint store, or None when FINGERPRINT_STORE=off."""
+    global _STORE
+    if _STORE is None and FINGERPRINT_STORE != "off":
+        with _STORE_LOCK:
+            if _STORE is None:
+                use_mongo = FINGERPRINT_STORE == "mongo" or (FINGERPRINT_STORE == "auto" and get_pool().configured)
+                _STORE = MongoFingerprintStore() if use_mongo else SqliteFingerprintStore()
+    return _STORE
+
+
+def register(doc: Dict[str, Any], ref: Optional[str] = None) -> Dict[str, Any]:
+    """Record ``doc``'s fingerprints and report whether another submission already owns one.
+
+    ``ref`` identifies this submission (the file's SHA-256); re-submitting
+    the same bytes is not a duplicate. Returns the ``duplicate_check``
+    metadata block that ``check_invoice`` reads.
+    """
+    return register_many([doc], [ref])[0]
+
+
+def register_many(docs: List[Dict[str, Any]], refs: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    """register() for many documents with a single store round trip.
+
+    A fingerprint repeated within ``docs`` is owned by the first document
+    carrying it, as if they had been registered one by one.
+    """
+    store = get_store()
+    if store is None:
+        return [{"status": "disabled"} for _ in docs]
+    out: List[Dict[str, Any]] = []
+    claims: List[Tuple[List[str], str]] = []
+    for doc, ref in zip(docs, refs or [None] * len(docs)):
+        keys = fingerprint_keys(doc)
+        if not keys:
+            out.append({"status": "skipped", "reason": "no seller GSTIN + invoice no or IRN"})
+            continue
+        claims.append((keys, ref or content_ref(doc)))
+        out.append({})
+    if not claims:
+        return out
+    try:
+        owners = store.claim_many(claims)
+    except store.errors as e:
+        # best effort: a store that fails (down, or rejecting the write) doesn't fail the caller
+        STATS["unavailable"] += len(claims)
+        unavailable = {"status": "unavailable", "reason": str(e)}
+        return [dict(unavailable) if not o else o for o in out]
+    pending = iter(claims)
+    for i, o in enumerate(out):
+        if not o:
+            keys, ref = next(pending)
+            out[i] = _check(store, keys, ref, owners)
+    return out
+
+
+def _check(store: Any, keys: List[str], ref: str, owners: Dict[str, str]) -> Dict[str, Any]:
+    STATS["checked"] += 1
+    out: Dict[str, Any] = {"status": "checked", "store": store.name, "keys": keys, "duplicate": False}
+    # an IRN match is authoritative, so report it first
+    for key in sorted(keys, key=lambda k: not k.startswith("irn:")):
+        owner = owners.get(key)
+        if owner and owner != ref:
+            STATS["duplicates"] += 1
+            out.update(duplicate=True, duplicate_of=owner, matched_on=key.split(":", 1)[0])
+            break
+    return out
+
+
+def stats() -> Dict[str, Any]:
+    store = get_store()
+    return dict(STATS, store=store.name if store else None)
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import bisect
+import csv
+import os
+import re
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .db import DatabaseUnavailable, get_pool
+
+# Env
+HSN_COLLECTION_NAME = os.getenv("HSN_COLLECTION", "users")
+HSN_CSV_PATH = os.getenv(
+    "HSN_CSV_PATH",
+    os.getenv("HSN_CSV_FALLBACK", os.path.join(os.getcwd(), "Collection_HSN_and_GST_Data.csv")),
+)
+HSN_INDEX_TTL_SEC = float(os.getenv("HSN_INDEX_TTL_SEC", "900"))
+
+# HSN/SAC codes are hierarchical: chapter (2), heading (4), sub-heading (6), tariff item (8)
+PREFIX_LENGTHS = (8, 6, 4, 2)
+
+_NON_DIGIT = re.compile(r"\D")
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def clean_code(code: Any) -> str:
+    return _NON_DIGIT.sub("", str(code or ""))
+
+
+def _to_rate(val: Any) -> Optional[Decimal]:
+    if val is None:
+        return None
+    if isinstance(val, Decimal):
+        return val
+    s = str(val).replace("₹", "").replace("INR", "").replace(",", "").strip()
+    m = _NUMBER.search(s)
+    if not m:
+        return None
+    try:
+        return Decimal(m.group(0))
+    except Exception:
+        return None
+
+
+def load_rates_from_csv(path: str) -> Dict[str, Decimal]:
+    out: Dict[str, Decimal] = {}
+    if not path or not os.path.exists(path):
+        return out
+    try:
+        with open(path, newline="", encoding="utf-8") as cf:
+            rdr = csv.DictReader(cf)
+            if not rdr.fieldnames:
+                return out
+            heads = list(rdr.fieldnames)
+            hsn_col = None
+            rate_col = None
+            for h in heads:
+                hl = h.lower()
+                if "hsn" in hl or "sac" in hl:
+                    hsn_col = h
+                if "gst" in hl or "rate" in hl or "tax" in hl:
+                    rate_col = h
+            if not hsn_col:
+                hsn_col = heads[0]
+            if not rate_col and len(heads) > 1:
+                rate_col = heads[1]
+            for row in rdr:
+                code = clean_code(row.get(hsn_col, "") if hsn_col else "")
+                rate = _to_rate(row.get(rate_col, "") if rate_col else "")
+                if code and rate is not None:
+                    out[code] = rate
+    except Exception:
+        return {}
+    return out
+
+
+def load_rates_from_db(db) -> Dict[str, Decimal]:
+    out: Dict[str, Decimal] = {}
+    projection = {"HSN_SAC_Code": 1, "hsn": 1, "HSN": 1, "Tax_Rate": 1, "GST_Rate": 1,
+                  "gst_rate": 1, "gst": 1, "Rate": 1}
+    for d in db[HSN_COLLECTION_NAME].find({}, projection):
+        code = clean_code(d.get("HSN_SAC_Code") or d.get("hsn") or d.get("HSN"))
+        if not code:
+            continue
+        rate = _to_rate(d.get("Tax_Rate") or d.get("GST_Rate") or d.get("gst_rate") or d.get("gst") or d.get("Rate"))
+        if rate is not None:
+            out[code] = rate
+    return out
+
+
+def default_loader() -> Dict[str, Decimal]:
+    """CSV rates overlaid with the Mongo HSN collection when one is configured."""
+    rates = load_rates_from_csv(HSN_CSV_PATH)
+    pool = get_pool()
+    if pool.configured:
+        try:
+            rates.update(pool.run(load_rates_from_db))
+        except DatabaseUnavailable:
+            pass
+    return rates
+
+
+class HsnTable:
+    """Immutable rate table with longest-prefix resolution over HSN/SAC codes."""
+
+    __slots__ = ("rates", "codes")
+
+    def __init__(self, rates: Dict[str, Decimal]):
+        self.rates = rates
+        self.codes: List[str] = sorted(rates)
+
+    def __len__(self) -> int:
+        return len(self.rates)
+
+    def resolve(self, key: str) -> Optional[Decimal]:
+        """Rate for ``key`` (digits only).
+
+        Tries the exact code, then its 8/6/4/2-digit ancestors. A code shorter
+        than anything in the table resolves only when every more specific code
+        under it carries the same rate.
+        """
+        rates = self.rates
+        rate = rates.get(key)
+        if rate is not None:
+            return rate
+        n = len(key)
+        for ln in PREFIX_LENGTHS:
+            if ln < n:
+                rate = rates.get(key[:ln])
+                if rate is not None:
+                    return rate
+        codes = self.codes
+        lo = bisect.bisect_left(codes, key)
+        hi = bisect.bisect_left(codes, key + ":", lo)  # ':' sorts right after '9'
+        if lo == hi:
+            return None
+        first = rates[codes[lo]]
+        for i in range(lo + 1, hi):
+            if rates[codes[i]] != first:
+                return None
+        return first
+
+
+class HsnIndex:
+    """Process-wide HSN/SAC -> GST rate table.
+
+    The table is loaded on first use and refreshed once it is older than
+    ``ttl`` seconds (or when ``invalidate``/``reload`` is called). Readers
+    always see a complete snapshot; a refresh swaps the dict atomically and
+    bumps ``version``.
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, Decimal]] = default_loader, ttl: float = HSN_INDEX_TTL_SEC):
+        self._loader = loader
+        self.ttl = ttl
+        self._table: Optional[HsnTable] = None
+        self._loaded_at = 0.0
+        self._stale = False
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _expired(self) -> bool:
+        return self._stale or (self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _snapshot(self) -> HsnTable:
+        table = self._table
+        if table is None:
+            with self._lock:
+                if self._table is None:
+                    self._refresh_locked()
+            return self._table  # type: ignore[return-value]
+        if self._expired() and self._lock.acquire(blocking=False):
+            # one thread refreshes, the rest keep serving the current snapshot
+            try:
+                if self._expired():
+                    self._refresh_locked()
+            finally:
+                self._lock.release()
+        return self._table  # type: ignore[return-value]
+
+    def _refresh_locked(self) -> None:
+        try:
+            table = HsnTable(self._loader())
+        except Exception:
+            self.refresh_errors += 1
+            table = self._table if self._table is not None else HsnTable({})
+        else:
+            self.version += 1
+            self.refreshes += 1
+        self._table = table
+        self._loaded_at = time.monotonic()
+        self._stale = False
+
+    def reload(self) -> int:
+        """Synchronously reload the table and return the new version."""
+        with self._lock:
+            self._refresh_locked()
+        return self.version
+
+    def invalidate(self) -> None:
+        """Mark the table stale; the next lookup triggers a refresh."""
+        self._stale = True
+
+    def get(self, code: Any) -> Optional[Decimal]:
+        key = clean_code(code)
+        if not key:
+            return None
+        rate = self._snapshot().resolve(key)
+        if rate is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rate
+
+    def resolve_many(self, codes: Iterable[Any]) -> Dict[str, Optional[Decimal]]:
+        """Resolve every distinct code against a single snapshot.
+
+        Keys of the result are the cleaned (digits-only) codes.
+        """
+        table = self._snapshot()
+        out: Dict[str, Optional[Decimal]] = {}
+        for code in codes:
+            key = clean_code(code)
+            if not key or key in out:
+                continue
+            rate = table.resolve(key)
+            out[key] = rate
+            if rate is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return out
+
+    def __contains__(self, code: Any) -> bool:
+        return self.get(code) is not None
+
+    def __len__(self) -> int:
+        return len(self._snapshot())
+
+    def watch(self, collection) -> bool:
+        """Invalidate on every change to ``collection`` using a Mongo change stream.
+
+        Change streams need a replica set; returns False if one can't be opened.
+        """
+        if self._watcher is not None:
+            return True
+        try:
+            stream = collection.watch()
+        except Exception:
+            return False
+
+        def _run() -> None:
+            try:
+                with stream:
+                    for _ in stream:
+                        self.invalidate()
+            except Exception:
+                pass
+            finally:
+                self._watcher = None
+
+        self._watcher = threading.Thread(target=_run, name="hsn-index-watch", daemon=True)
+        self._watcher.start()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._table) if self._table is not None else 0,
+            "age_sec": round(time.monotonic() - self._loaded_at, 3) if self._table is not None else None,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "watching": self._watcher is not None,
+        }
+
+
+_INDEX: Optional[HsnIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_hsn_index() -> HsnIndex:
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = HsnIndex()
+    return _INDEX
+
+
+def start_watch() -> bool:
+    """Follow the Mongo HSN collection so edits invalidate the shared index."""
+    pool = get_pool()
+    if not pool.configured:
+        return False
+    try:
+        return get_hsn_index().watch(pool.database()[HSN_COLLECTION_NAME])
+    except Exception:
+        return False
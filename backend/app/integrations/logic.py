@@ -4,37 +4,22 @@ import os
 import re
 from datetime import datetime, date
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, Optional, Tuple, List
-
-try:
-    from pymongo import MongoClient
-    MONGO_AVAILABLE = True
-except Exception:
-    MONGO_AVAILABLE = False
+from typing import Any, Dict, Optional, Tuple, List, Union
 
 import json
 
-# Env
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB = os.getenv("MONGO_DB", "online_db")
-HSN_COLLECTION_NAME = os.getenv("HSN_COLLECTION", "users")
-HSN_CSV_FALLBACK = os.getenv("HSN_CSV_FALLBACK", os.path.join(os.getcwd(), "Collection_HSN_and_GST_Data.csv"))
+from . import fingerprint, metrics
+from .facts import InvoiceFacts
+from .fields import FieldScan, scan_fields
+from .hsn_index import HsnIndex, get_hsn_index
+from .model import InvoiceTotals, LineItem, halve, percent_of, to_paise, to_rupees
 
 AMOUNT_TOLERANCE = Decimal("1.0")
+TOLERANCE_PAISE = to_paise(AMOUNT_TOLERANCE)
 STANDARD_SLABS = {0, 0.0, 5, 12, 18, 28, 3, 1}
 
 GST_RE = re.compile(r"\b([0-9]{2}[A-Z]{5}[0-9]{4}[A-Z0-9]{3})\b", flags=re.I)
-PAN_RE = re.compile(r"\b([A-Z]{5}[0-9]{4}[A-Z])\b")
 NUM_RE = re.compile(r"-?\d+(?:\.\d+)?")
-UPI_ID_RE = re.compile(r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}", flags=re.I)
-UPI_TXN_RE = re.compile(r"(?:Txn ID|Transaction ID|UTR|Ref|TXN|Transaction No|Trans ID)\s*[:\-\s]*([A-Za-z0-9\-_/]{6,})", flags=re.I)
-AMOUNT_RE = re.compile(r"([0-9]{1,3}(?:,[0-9]{3})*(?:\.\d+)?)")
-
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-except Exception:
-    PANDAS_AVAILABLE = False
 
 
 def to_decimal(x: Any) -> Optional[Decimal]:
@@ -89,47 +74,28 @@ def compute_tax_components_from_total(total_gst: Decimal) -> Tuple[Decimal, Deci
     return half, half
 
 
-def connect_db(uri: str):
-    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-    client.server_info()
-    db = client[MONGO_DB]
-    return client, db
+def _resolve_hsn_rates(hsn_map: Union[HsnIndex, Dict[str, Dict[str, Any]]], items: List[Dict[str, Any]]) -> Dict[str, Optional[Decimal]]:
+    codes = (it.get("hsn") for it in items if isinstance(it, dict) and it.get("hsn") is not None)
+    if isinstance(hsn_map, HsnIndex):
+        return hsn_map.resolve_many(codes)
+    out: Dict[str, Optional[Decimal]] = {}
+    for code in codes:
+        key = re.sub(r"\D", "", str(code))
+        entry = hsn_map.get(key)
+        out[key] = Decimal(str(entry["gst"])) if entry else None
+    return out
 
 
-def load_hsn_map(db) -> Dict[str, Dict[str, Any]]:
-    hsn_map: Dict[str, Dict[str, Any]] = {}
-    try:
-        coll = db[HSN_COLLECTION_NAME]
-        docs = list(coll.find({}))
-        if docs:
-            for d in docs:
-                code = str(d.get("HSN_SAC_Code") or d.get("hsn") or d.get("HSN") or "").strip()
-                if not code:
-                    continue
-                code = re.sub(r"\D", "", code)
-                rate = d.get("Tax_Rate") or d.get("GST_Rate") or d.get("gst_rate") or d.get("gst")
-                gst = to_decimal(rate)
-                if gst is not None:
-                    hsn_map[code] = {"gst": float(gst)}
-        else:
-            if os.path.exists(HSN_CSV_FALLBACK) and PANDAS_AVAILABLE:
-                df = pd.read_csv(HSN_CSV_FALLBACK)
-                for _, row in df.iterrows():
-                    try:
-                        code = str(row.get("HSN_SAC_Code") or row.get("HSN") or row.get("hsn") or "").strip()
-                        code = re.sub(r"\D", "", code)
-                        rate = row.get("Tax_Rate") or row.get("GST_Rate") or row.get("GST%") or row.get("GST")
-                        gst = to_decimal(rate)
-                        if code and gst is not None:
-                            hsn_map[code] = {"gst": float(gst)}
-                    except Exception:
-                        continue
-    except Exception:
-        pass
-    return hsn_map
-
+def check_invoice(
+    invoice: Dict[str, Any],
+    hsn_map: Union[HsnIndex, Dict[str, Dict[str, Any]]],
+    facts: Optional[InvoiceFacts] = None,
+) -> Dict[str, Any]:
+    """Flag problems in one extracted invoice.
 
-def check_invoice(invoice: Dict[str, Any], hsn_map: Dict[str, Dict[str,Any]]) -> Dict[str, Any]:
+    ``facts`` (from extractor.extract_with_facts) supplies the already parsed
+    fields and item amounts; without it they are read from ``invoice``.
+    """
     checks: Dict[str, Any] = {
         "flags": [],
         "auto_fixes": [],
@@ -139,9 +105,8 @@ def check_invoice(invoice: Dict[str, Any], hsn_map: Dict[str, Dict[str,Any]]) ->
     try:
         company = invoice.get("company", {})
         inv_meta = invoice.get("invoice", {})
-        totals = invoice.get("totals", {})
         items = invoice.get("items") or invoice.get("items", [])
-        raw_text = invoice.get("metadata", {}).get("raw_text_sample") or invoice.get("raw_text_sample") or invoice.get("raw_text") or ""
+        raw_text = (invoice.get("metadata") or {}).get("raw_text_sample") or invoice.get("raw_text_sample") or invoice.get("raw_text") or ""
 
         missing_gstin = False
         if not (company.get("gstin") or invoice.get("seller_gstin") or invoice.get("company", {}).get("gstin")):
@@ -149,11 +114,22 @@ def check_invoice(invoice: Dict[str, Any], hsn_map: Dict[str, Dict[str,Any]]) ->
             checks["flags"].append("missing_company_gstin")
         checks["details"]["missing_gstin"] = missing_gstin
 
-        pan = None
-        if raw_text:
-            pm = PAN_RE.search(raw_text)
-            if pm:
-                pan = pm.group(1)
+        dup = (invoice.get("metadata") or {}).get("duplicate_check") or {}
+        if dup.get("duplicate"):
+            checks["flags"].append("duplicate_invoice")
+            checks["details"]["duplicate_of"] = dup.get("duplicate_of")
+            checks["details"]["duplicate_matched_on"] = dup.get("matched_on")
+
+        # extract() already scanned the full text; otherwise scan the sample once
+        stored = (invoice.get("metadata") or {}).get("fields")
+        if facts is not None:
+            fields = facts.fields
+        elif isinstance(stored, dict):
+            fields = FieldScan.from_dict(stored)
+        else:
+            fields = scan_fields(raw_text)
+
+        pan = fields.first("pan")
         if not pan and invoice.get("notes", {}).get("company_pan"):
             pan = invoice["notes"]["company_pan"]
         if not pan:
@@ -171,160 +147,138 @@ def check_invoice(invoice: Dict[str, Any], hsn_map: Dict[str, Dict[str,Any]]) ->
         else:
             checks["details"]["invoice_date"] = invoice_date
 
-        total_gst = to_decimal(totals.get("total_tax") or totals.get("total_gst") or totals.get("totalTax") or invoice.get("total_tax"))
-        total_cgst = to_decimal(totals.get("total_cgst") or invoice.get("total_cgst"))
-        total_sgst = to_decimal(totals.get("total_sgst") or invoice.get("total_sgst"))
+        header = InvoiceTotals.from_invoice(invoice)
+        total_gst = header.total_tax
+        total_cgst = header.total_cgst
+        total_sgst = header.total_sgst
 
         item_issues: List[Dict[str, Any]] = []
         hsn_not_found: List[str] = []
         filled_from_hsn_count = 0
         missing_both_count = 0
 
-        taxable_sum = Decimal("0.00")
-        computed_line_totals = Decimal("0.00")
+        hsn_rates = _resolve_hsn_rates(hsn_map, items or [])
+        known = facts.items if facts is not None and facts.items is not None and len(facts.items) == len(items or []) else None
+        # (taxable, cgst, sgst) paise of each item once any HSN fill is done;
+        # everything below the loop reads these instead of the items
+        amounts: List[Tuple[Optional[int], int, int]] = []
+        computed_line_totals = 0
         for idx, it in enumerate(items or []):
             try:
-                hsn = str(it.get("hsn") or "") if it.get("hsn") is not None else ""
+                line = known[idx] if known else LineItem.from_dict(it)
+                hsn = str(line.hsn or "") if line.hsn is not None else ""
                 hsn_clean = re.sub(r"\D", "", hsn) if hsn else ""
-                taxable = to_decimal(it.get("taxable_value") or it.get("amount") or it.get("taxable") or it.get("value"))
-                if taxable is None:
-                    taxable = to_decimal(it.get("line_total")) or Decimal("0.00")
-                if taxable is None:
-                    taxable = Decimal("0.00")
-                taxable_sum += taxable
-
-                cg = to_decimal(it.get("cgst_amount")) or to_decimal(it.get("cgst")) or None
-                sg = to_decimal(it.get("sgst_amount")) or to_decimal(it.get("sgst")) or None
-
-                if (total_gst is None or total_gst == Decimal("0")) and (not cg and not sg):
-                    if hsn_clean and hsn_clean in hsn_map:
-                        gst_pct = Decimal(str(hsn_map[hsn_clean]["gst"]))
-                        total_line_gst = (taxable * gst_pct / Decimal("100")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                        cg_amt, sg_amt = compute_tax_components_from_total(total_line_gst)
+                taxable = line.taxable if line.taxable is not None else (line.line_total or 0)
+                cg = line.cgst
+                sg = line.sgst
+                tv, cg_amt, sg_amt = line.taxable, cg or 0, sg or 0
+
+                if not total_gst and (not cg and not sg):
+                    gst_pct = hsn_rates.get(hsn_clean) if hsn_clean else None
+                    if gst_pct is not None:
+                        cg_amt = sg_amt = halve(percent_of(taxable, gst_pct))
+                        tv = taxable
                         it["cgst_percent"] = float(gst_pct/2)
                         it["sgst_percent"] = float(gst_pct/2)
-                        it["cgst_amount"] = float(cg_amt)
-                        it["sgst_amount"] = float(sg_amt)
-                        it["taxable_value"] = float(taxable)
+                        it["cgst_amount"] = to_rupees(cg_amt)
+                        it["sgst_amount"] = to_rupees(sg_amt)
+                        it["taxable_value"] = to_rupees(taxable)
                         checks["auto_fixes"].append({"file": invoice.get("source_file"), "line_no": it.get("line_no"), "filled_gst_pct": float(gst_pct)})
                         filled_from_hsn_count += 1
                     else:
                         if (not hsn_clean) and (not cg and not sg):
                             missing_both_count += 1
                             item_issues.append({"line": idx + 1, "issue": "missing_hsn_and_gst"})
-                        elif hsn_clean and hsn_clean not in hsn_map:
+                        elif hsn_clean:
                             hsn_not_found.append(hsn_clean)
                             item_issues.append({"line": idx + 1, "issue": "hsn_not_in_map", "hsn": hsn_clean})
 
-                cg_amt = to_decimal(it.get("cgst_amount")) or Decimal("0.00")
-                sg_amt = to_decimal(it.get("sgst_amount")) or Decimal("0.00")
-                line_total = to_decimal(it.get("line_total")) or (taxable + cg_amt + sg_amt)
-                computed_line_totals += (line_total or Decimal("0.00"))
+                amounts.append((tv, cg_amt, sg_amt))
+                computed_line_totals += line.line_total or (taxable + cg_amt + sg_amt)
             except Exception:
                 item_issues.append({"line": idx+1, "issue": "parsing_error"})
+                amounts.append((None, 0, 0))
 
         checks["details"]["item_issues"] = item_issues
         checks["details"]["hsn_not_found_list"] = list(set(hsn_not_found))
         checks["details"]["filled_from_hsn_count"] = filled_from_hsn_count
         checks["details"]["missing_both_count"] = missing_both_count
 
-        taxable_sum = Decimal(str(sum((to_decimal(it.get("taxable_value")) or Decimal("0.00")) for it in items or []))).quantize(Decimal("0.01"))
+        taxable_sum = sum(tv or 0 for tv, _, _ in amounts)
 
-        if total_gst is None or total_gst == Decimal("0"):
-            total_from_items = Decimal("0.00")
-            for it in items or []:
-                cg_amt = to_decimal(it.get("cgst_amount")) or Decimal("0.00")
-                sg_amt = to_decimal(it.get("sgst_amount")) or Decimal("0.00")
-                total_from_items += (cg_amt + sg_amt)
+        if not total_gst:
+            total_from_items = sum(cg_amt + sg_amt for _, cg_amt, sg_amt in amounts)
             if total_from_items > 0:
                 total_gst = total_from_items
-                checks["auto_fixes"].append({"file": invoice.get("source_file"), "filled_total_gst_from_items": float(total_from_items)})
+                checks["auto_fixes"].append({"file": invoice.get("source_file"), "filled_total_gst_from_items": to_rupees(total_from_items)})
         else:
             if total_cgst is None or total_sgst is None:
-                split_c, split_s = compute_tax_components_from_total(total_gst)
-                total_cgst = total_cgst or split_c
-                total_sgst = total_sgst or split_s
+                split = halve(total_gst)
+                total_cgst = total_cgst or split
+                total_sgst = total_sgst or split
             else:
-                sum_csg = (total_cgst or Decimal("0")) + (total_sgst or Decimal("0"))
-                if total_gst is not None and not decimal_equal(Decimal(str(total_gst)), sum_csg, AMOUNT_TOLERANCE):
+                sum_csg = total_cgst + total_sgst
+                if not decimal_equal(total_gst, sum_csg, TOLERANCE_PAISE):
                     checks["flags"].append("gst_mismatch_cgst_sgst")
                     checks["details"]["gst_mismatch_detail"] = {
-                        "total_gst": float(total_gst),
-                        "sum_c_s": float(sum_csg)
+                        "total_gst": to_rupees(total_gst),
+                        "sum_c_s": to_rupees(sum_csg)
                     }
 
-        checks["details"]["computed_taxable_sum"] = float(taxable_sum)
-        checks["details"]["computed_line_totals_sum"] = float(computed_line_totals or Decimal("0.00"))
+        checks["details"]["computed_taxable_sum"] = to_rupees(taxable_sum)
+        checks["details"]["computed_line_totals_sum"] = to_rupees(computed_line_totals)
 
-        total_amount = to_decimal(totals.get("total_amount") or invoice.get("total_amount") or invoice.get("totals", {}).get("total_amount"))
-        if total_amount is None:
-            total_amount = to_decimal(invoice.get("total_amount") or invoice.get("invoice_total") or invoice.get("grand_total"))
+        total_amount = header.total_amount
 
         expected_total = None
         if total_amount is None:
             if total_gst is not None:
-                expected_total = (taxable_sum + Decimal(str(total_gst))).quantize(Decimal("0.01"))
+                expected_total = taxable_sum + total_gst
             else:
-                expected_total = computed_line_totals.quantize(Decimal("0.01"))
+                expected_total = computed_line_totals
         else:
             expected_total = total_amount
 
         if total_amount is not None:
-            diff = None
-            try:
-                computed = computed_line_totals
-                diff = (Decimal(str(total_amount)) - computed).copy_abs()
-                if diff > AMOUNT_TOLERANCE:
-                    checks["flags"].append("arithmetic_mismatch")
-                    checks["details"]["arithmetic"] = {
-                        "reported_total": float(total_amount),
-                        "computed_from_lines": float(computed),
-                        "diff": float(diff)
-                    }
-            except Exception:
-                checks["flags"].append("arithmetic_error_parsing")
+            diff = abs(total_amount - computed_line_totals)
+            if diff > TOLERANCE_PAISE:
+                checks["flags"].append("arithmetic_mismatch")
+                checks["details"]["arithmetic"] = {
+                    "reported_total": to_rupees(total_amount),
+                    "computed_from_lines": to_rupees(computed_line_totals),
+                    "diff": to_rupees(diff)
+                }
         else:
-            checks["details"]["expected_total_inferred"] = float(expected_total)
+            checks["details"]["expected_total_inferred"] = to_rupees(expected_total)
 
+        # effective rate of each line from its paise amounts
         nonstandard = False
-        try:
-            gst_pct_candidates = set()
-            if total_gst is not None and taxable_sum > 0:
-                from Decimal import Decimal as _D  # guard no, but compute directly
-            for it in items or []:
-                tv = to_decimal(it.get("taxable_value") or 0) or Decimal("0")
-                cg_amt = to_decimal(it.get("cgst_amount") or 0) or Decimal("0")
-                sg_amt = to_decimal(it.get("sgst_amount") or 0) or Decimal("0")
-                if tv > 0:
-                    pct = float(((cg_amt + sg_amt) / tv * 100).quantize(Decimal("0.01")))
-                    gst_pct_candidates.add(pct)
-            for cand in gst_pct_candidates:
-                cand_rounded = round(float(cand))
-                if cand_rounded not in STANDARD_SLABS:
-                    nonstandard = True
-                    checks["details"].setdefault("nonstandard_slabs", []).append(cand)
-            if nonstandard:
-                checks["flags"].append("nonstandard_gst_slab")
-        except Exception:
-            pass
+        gst_pct_candidates = set()
+        for tv, cg_amt, sg_amt in amounts:
+            if tv and tv > 0:
+                pct = float((Decimal(cg_amt + sg_amt) / tv * 100).quantize(Decimal("0.01")))
+                gst_pct_candidates.add(pct)
+        for cand in gst_pct_candidates:
+            cand_rounded = round(float(cand))
+            if cand_rounded not in STANDARD_SLABS:
+                nonstandard = True
+                checks["details"].setdefault("nonstandard_slabs", []).append(cand)
+        if nonstandard:
+            checks["flags"].append("nonstandard_gst_slab")
 
         upi_found = False
         upi_issues: List[str] = []
         if raw_text:
-            if UPI_ID_RE.search(raw_text):
+            if fields.first("upi_id"):
                 upi_found = True
-            txn_m = UPI_TXN_RE.search(raw_text)
-            if upi_found:
                 checks["details"]["upi_detected"] = True
-                checks["details"]["upi_id"] = UPI_ID_RE.search(raw_text).group(0)
-                if txn_m:
-                    checks["details"]["upi_txn_id"] = txn_m.group(1)
-                m_sender = re.search(r"(?:From|Sender|Remitter|Paid By)\s*[:\-]?\s*([A-Za-z\s]{2,60})", raw_text, flags=re.I)
-                if m_sender:
-                    checks["details"]["upi_sender"] = m_sender.group(1).strip()
-                am = AMOUNT_RE.search(raw_text)
-                if am:
-                    checks["details"]["upi_amount_detected"] = float(Decimal(am.group(1).replace(",", "")))
+                checks["details"]["upi_id"] = fields.first("upi_id")
+                if fields.first("upi_txn"):
+                    checks["details"]["upi_txn_id"] = fields.first("upi_txn")
+                if fields.first("upi_sender"):
+                    checks["details"]["upi_sender"] = fields.first("upi_sender")
+                if fields.first("upi_amount"):
+                    checks["details"]["upi_amount_detected"] = float(Decimal(fields.first("upi_amount").replace(",", "")))
                 else:
                     upi_issues.append("upi_amount_missing")
                 if "upi_txn_id" not in checks["details"]:
@@ -350,20 +304,69 @@ def check_invoice(invoice: Dict[str, Any], hsn_map: Dict[str, Dict[str,Any]]) ->
     return checks
 
 
+def _needs_duplicate_check(invoice: Dict[str, Any]) -> bool:
+    metadata = invoice.get("metadata")
+    return not (isinstance(metadata, dict) and "duplicate_check" in metadata)
+
+
+def _with_duplicate_check(invoice: Dict[str, Any], duplicate_check: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of ``invoice`` with ``metadata.duplicate_check`` set; the caller's dict is left as posted."""
+    metadata = invoice.get("metadata")
+    metadata = dict(metadata) if isinstance(metadata, dict) else {}
+    metadata["duplicate_check"] = duplicate_check
+    return dict(invoice, metadata=metadata)
+
+
 # Public API
 
-def analyze(extracted: Dict[str, Any], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def analyze(
+    extracted: Dict[str, Any],
+    options: Optional[Dict[str, Any]] = None,
+    facts: Optional[InvoiceFacts] = None,
+) -> Dict[str, Any]:
     """Run checks on a single extracted invoice dict.
     options:
       - use_db_hsn_map: bool (default True)
+      - check_duplicates: bool (default False) also record the fingerprints of an invoice
+        not coming from extract() (which registers its own), so later ones are checked against it
+    facts: what extract_with_facts() parsed, so it isn't parsed again
     """
     options = options or {}
-    hsn_map: Dict[str, Dict[str, Any]] = {}
-    if options.get("use_db_hsn_map", True) and MONGO_AVAILABLE and MONGO_URI:
+    if options.get("check_duplicates", False) and _needs_duplicate_check(extracted):
+        extracted = _with_duplicate_check(extracted, fingerprint.register(extracted))
+    with metrics.timer("check_invoice"):
+        return check_invoice(extracted, _hsn_map(options), facts)
+
+
+def analyze_many(extracted_list: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """analyze() over many invoices, e.g. one chunk of /api/analyze/batch.
+
+    The HSN index is resolved once and, with ``check_duplicates``, every
+    fingerprint is claimed in one store round trip. Returns ``{"result": ...}``
+    or ``{"error": "..."}`` per invoice, in input order; one bad invoice
+    doesn't fail the others.
+    """
+    options = options or {}
+    invoices: List[Any] = list(extracted_list)
+    if options.get("check_duplicates", False):
+        todo = [i for i, inv in enumerate(invoices) if isinstance(inv, dict) and _needs_duplicate_check(inv)]
+        for i, dup in zip(todo, fingerprint.register_many([invoices[i] for i in todo])):
+            invoices[i] = _with_duplicate_check(invoices[i], dup)
+    hsn_map = _hsn_map(options)
+    out: List[Dict[str, Any]] = []
+    for inv in invoices:
+        if not isinstance(inv, dict):
+            out.append({"error": f"expected an object, got {type(inv).__name__}"})
+            continue
         try:
-            client, db = connect_db(MONGO_URI)
-            hsn_map = load_hsn_map(db)
-            client.close()
-        except Exception:
-            hsn_map = {}
-    return check_invoice(extracted, hsn_map)
+            with metrics.timer("check_invoice"):
+                out.append({"result": check_invoice(inv, hsn_map)})
+        except Exception as e:
+            out.append({"error": f"{type(e).__name__}: {e}"})
+    return out
+
+
+def _hsn_map(options: Dict[str, Any]) -> Union[HsnIndex, Dict[str, Dict[str, Any]]]:
+    if options.get("use_db_hsn_map", True):
+        return get_hsn_index()
+    return {}
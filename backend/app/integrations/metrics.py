@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# seconds; wide enough for a cached HSN lookup and a throttled Azure poll alike
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (non-cumulative, last = +Inf), sum]
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][i] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((k, list(c), s[0]) for k, (c, s) in self._series.items())
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _fmt(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "invoice_stage_seconds",
+    "Time spent in one pipeline stage (per page for rasterize/deskew/ocr).",
+    ("stage",),
+)
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ("route", "method", "status"))
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.", ("route", "method"))
+
+_METRICS = (STAGE_SECONDS, HTTP_REQUESTS, HTTP_SECONDS)
+
+# in pool worker processes observations are buffered here and shipped back
+# to the server process with the task result (see drain()/replay())
+_captured: Optional[List[Tuple[str, float]]] = None
+
+
+def enabled() -> bool:
+    return METRICS_ENABLED
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not METRICS_ENABLED:
+        return
+    if _captured is not None:
+        _captured.append((stage, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def observe_many(timings: Optional[Dict[str, float]], stages: Iterable[str]) -> None:
+    """Observe the given ``stages`` that are present in a timings dict."""
+    if not METRICS_ENABLED or not timings:
+        return
+    for stage in stages:
+        sec = timings.get(stage)
+        if sec is not None:
+            observe(stage, sec)
+
+
+class _Timer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.stage, time.perf_counter() - self.started)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopTimer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopTimer()
+
+
+def timer(stage: str):
+    """``with timer("stage"):`` records the block's duration; a shared no-op when disabled."""
+    return _Timer(stage) if METRICS_ENABLED else _NOOP
+
+
+def start_capture() -> None:
+    """Buffer observations instead of recording them (pool worker initializer)."""
+    global _captured
+    _captured = []
+
+
+def drain() -> Optional[List[Tuple[str, float]]]:
+    """Return and clear buffered observations; None when not capturing."""
+    if _captured is None:
+        return None
+    out = list(_captured)
+    del _captured[:]
+    return out
+
+
+def replay(observations: Optional[Iterable[Tuple[str, float]]]) -> None:
+    for stage, seconds in observations or ():
+        observe(stage, seconds)
+
+
+def observe_request(route: str, method: str, status: int, seconds: float) -> None:
+    if not METRICS_ENABLED:
+        return
+    HTTP_REQUESTS.inc(route, method, str(status))
+    HTTP_SECONDS.observe(seconds, route, method)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
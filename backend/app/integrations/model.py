@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
+
+# Line items and invoice totals as the extractor and check_invoice work on
+# them. Amounts are integer paise from the moment they are read (Azure
+# fields, posted JSON) until they are written back out as rupee floats in
+# the nested JSON; percentages stay Decimal. from_dict() is the one place
+# the key fallbacks ("taxable_value" or "taxable" or "amount" ...) live.
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_ONE = Decimal("1")
+_HUNDRED = Decimal("100")
+
+
+def _decimal(value: Any) -> Optional[Decimal]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    m = _NUMBER_RE.search(str(value).replace(",", ""))
+    return Decimal(m.group(0)) if m else None
+
+
+def to_paise(value: Any) -> Optional[int]:
+    """Rupee amount (number, Decimal or text like "₹1,234.50") to integer paise."""
+    d = _decimal(value)
+    if d is None:
+        return None
+    try:
+        return int((d * _HUNDRED).quantize(_ONE, rounding=ROUND_HALF_UP))
+    except InvalidOperation:  # NaN / Infinity
+        return None
+
+
+def to_rupees(paise: Optional[int]) -> Optional[float]:
+    return paise / 100 if paise is not None else None
+
+
+def to_percent(value: Any) -> Optional[Decimal]:
+    return _decimal(value)
+
+
+def percent_of(paise: int, pct: Decimal) -> int:
+    """``pct`` percent of an amount, rounded half-up to the paisa."""
+    return int((paise * pct / _HUNDRED).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def halve(paise: int) -> int:
+    """CGST/SGST half of a GST amount, rounded half-up to the paisa."""
+    return int((Decimal(paise) / 2).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def _float(value: Optional[Decimal]) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+class LineItem:
+    """One invoice line: amounts in paise, percentages as Decimal."""
+
+    __slots__ = (
+        "line_no", "hsn", "description", "quantity", "unit", "unit_price",
+        "taxable", "gst_percent", "cgst_percent", "sgst_percent", "igst_percent",
+        "gst", "cgst", "sgst", "igst", "line_total", "anomalies", "notes",
+    )
+
+    def __init__(
+        self,
+        line_no: Optional[int] = None,
+        hsn: Optional[str] = None,
+        description: Optional[str] = None,
+        quantity: Any = None,
+        unit: Optional[str] = None,
+        unit_price: Optional[float] = None,
+        taxable: Optional[int] = None,
+    ) -> None:
+        self.line_no = line_no
+        self.hsn = hsn
+        self.description = description
+        self.quantity = quantity
+        self.unit = unit
+        self.unit_price = unit_price
+        self.taxable = taxable
+        self.gst_percent: Optional[Decimal] = None
+        self.cgst_percent: Optional[Decimal] = None
+        self.sgst_percent: Optional[Decimal] = None
+        self.igst_percent: Optional[Decimal] = None
+        self.gst: Optional[int] = None
+        self.cgst: Optional[int] = None
+        self.sgst: Optional[int] = None
+        self.igst: Optional[int] = None
+        self.line_total: Optional[int] = None
+        self.anomalies: List[str] = []
+        self.notes: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LineItem":
+        """Normalize an item dict (nested JSON item, posted JSON, older shapes)."""
+        item = cls(
+            line_no=d.get("line_no"),
+            hsn=d.get("hsn"),
+            description=d.get("description"),
+            quantity=d.get("quantity"),
+            unit=d.get("unit"),
+            unit_price=d.get("unit_price"),
+            taxable=to_paise(d.get("taxable_value") or d.get("taxable") or d.get("amount") or d.get("value")),
+        )
+        item.gst_percent = to_percent(d.get("gst_percent") or d.get("gst") or d.get("total_gst"))
+        item.cgst_percent = to_percent(d.get("cgst_percent"))
+        item.sgst_percent = to_percent(d.get("sgst_percent"))
+        item.igst_percent = to_percent(d.get("igst_percent"))
+        item.gst = to_paise(d.get("gst_amount"))
+        # bare cgst/sgst/igst are tax amounts in rupees, as check_invoice has always read them
+        item.cgst = to_paise(d.get("cgst_amount") or d.get("cgst"))
+        item.sgst = to_paise(d.get("sgst_amount") or d.get("sgst"))
+        item.igst = to_paise(d.get("igst_amount") or d.get("igst"))
+        item.line_total = to_paise(d.get("line_total"))
+        item.anomalies = list(d.get("anomalies") or [])
+        item.notes = dict(d["notes"]) if isinstance(d.get("notes"), dict) else None
+        return item
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The item as it appears in the nested JSON ``items`` list."""
+        return {
+            "hsn": self.hsn,
+            "description": self.description,
+            "quantity": self.quantity,
+            "unit": self.unit,
+            "unit_price": self.unit_price,
+            "taxable_value": to_rupees(self.taxable),
+            "gst_percent": _float(self.gst_percent),
+            "gst_amount": to_rupees(self.gst),
+            "cgst_percent": _float(self.cgst_percent),
+            "cgst_amount": to_rupees(self.cgst),
+            "sgst_percent": _float(self.sgst_percent),
+            "sgst_amount": to_rupees(self.sgst),
+            "igst_percent": _float(self.igst_percent),
+            "igst_amount": to_rupees(self.igst),
+            "line_total": to_rupees(self.line_total),
+            "line_no": self.line_no,
+            "anomalies": list(self.anomalies),
+        }
+
+
+class InvoiceTotals:
+    """Header totals of an extracted invoice, in paise."""
+
+    __slots__ = ("total_amount", "total_tax", "total_cgst", "total_sgst")
+
+    def __init__(
+        self,
+        total_amount: Optional[int] = None,
+        total_tax: Optional[int] = None,
+        total_cgst: Optional[int] = None,
+        total_sgst: Optional[int] = None,
+    ) -> None:
+        self.total_amount = total_amount
+        self.total_tax = total_tax
+        self.total_cgst = total_cgst
+        self.total_sgst = total_sgst
+
+    @classmethod
+    def from_invoice(cls, invoice: Dict[str, Any]) -> "InvoiceTotals":
+        """Read totals from the nested shape, falling back to flat / older keys."""
+        totals = invoice.get("totals") or {}
+        return cls(
+            total_amount=to_paise(
+                totals.get("total_amount")
+                or invoice.get("total_amount")
+                or invoice.get("invoice_total")
+                or invoice.get("grand_total")
+            ),
+            total_tax=to_paise(
+                totals.get("total_tax") or totals.get("total_gst") or totals.get("totalTax") or invoice.get("total_tax")
+            ),
+            total_cgst=to_paise(totals.get("total_cgst") or invoice.get("total_cgst")),
+            total_sgst=to_paise(totals.get("total_sgst") or invoice.get("total_sgst")),
+        )
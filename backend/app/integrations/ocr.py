@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .deps import installed, optional
+
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+OCR_TIMEOUT_SEC = float(os.getenv("OCR_TIMEOUT_SEC", "120"))
+# worker processes that OCR pages in parallel; each keeps its Tesseract engine loaded
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# PyMuPDF's word tuple, which OCR'd words are returned as too
+Word = Tuple[float, float, float, float, str, int, int, int]
+
+
+class _Engine:
+    """Per-process Tesseract handle.
+
+    With tesserocr the model is loaded once and pixel buffers are passed
+    straight to the C++ API. Otherwise the ``tesseract`` CLI is fed an
+    in-memory PNM on stdin and read from stdout (no temp files).
+    """
+
+    def __init__(self) -> None:
+        self._api = None
+        self._lock = threading.Lock()
+        self._cli: Optional[str] = None
+        self._tesserocr = False
+        self._probed = False
+
+    def backend(self) -> Optional[str]:
+        # probed without importing tesserocr / OpenCV; they load with the first page
+        if not self._probed:
+            self._cli = shutil.which(TESSERACT_CMD)
+            self._tesserocr = installed("tesserocr")
+            self._probed = True
+        if self._tesserocr:
+            return "tesserocr"
+        if self._cli and installed("cv2"):
+            return "cli"
+        return None
+
+    def _loaded_backend(self) -> Optional[str]:
+        """backend(), after importing it; falls back to the next one if an installed module fails to load."""
+        backend = self.backend()
+        if backend == "tesserocr" and optional("tesserocr") is None:
+            self._tesserocr = False
+            backend = self.backend()
+        if backend == "cli" and optional("cv2") is None:
+            self._cli = None
+            backend = None
+        return backend
+
+    def warm(self) -> None:
+        if self._loaded_backend() == "tesserocr":
+            with self._lock:
+                self._get_api()
+
+    def _get_api(self):
+        if self._api is None:
+            self._api = optional("tesserocr").PyTessBaseAPI(lang=TESSERACT_LANG)
+        return self._api
+
+    def recognize(self, img) -> str:
+        backend = self._loaded_backend()
+        if backend == "tesserocr":
+            channels = 1 if img.ndim == 2 else img.shape[2]
+            h, w = img.shape[:2]
+            with self._lock:
+                api = self._get_api()
+                api.SetImageBytes(img.tobytes(), w, h, channels, w * channels)
+                return api.GetUTF8Text()
+        if backend == "cli":
+            ok, buf = optional("cv2").imencode(".pgm" if img.ndim == 2 else ".ppm", img)
+            if not ok:
+                return ""
+            proc = subprocess.run(
+                [self._cli, "stdin", "stdout", "-l", TESSERACT_LANG],
+                input=buf.tobytes(),
+                capture_output=True,
+                timeout=OCR_TIMEOUT_SEC,
+            )
+            return proc.stdout.decode("utf-8", errors="replace")
+        return ""
+
+    def recognize_words(self, img) -> Tuple[str, List[Word]]:
+        """Text plus word boxes (Tesseract's TSV output) from one recognition pass."""
+        backend = self._loaded_backend()
+        if backend == "tesserocr":
+            channels = 1 if img.ndim == 2 else img.shape[2]
+            h, w = img.shape[:2]
+            with self._lock:
+                api = self._get_api()
+                api.SetImageBytes(img.tobytes(), w, h, channels, w * channels)
+                text = api.GetUTF8Text()
+                return text, parse_tsv(api.GetTSVText(0))
+        if backend == "cli":
+            ok, buf = optional("cv2").imencode(".pgm" if img.ndim == 2 else ".ppm", img)
+            if not ok:
+                return "", []
+            proc = subprocess.run(
+                [self._cli, "stdin", "stdout", "-l", TESSERACT_LANG, "tsv"],
+                input=buf.tobytes(),
+                capture_output=True,
+                timeout=OCR_TIMEOUT_SEC,
+            )
+            words = parse_tsv(proc.stdout.decode("utf-8", errors="replace"))
+            return _words_text(words), words
+        return "", []
+
+
+def parse_tsv(tsv: str) -> List[Word]:
+    """Word rows of Tesseract's TSV output (what pytesseract's image_to_data reads) as word tuples."""
+    words: List[Word] = []
+    for row in tsv.splitlines():
+        parts = row.split("\t")
+        if len(parts) < 12 or parts[0] != "5":
+            continue
+        text = parts[11].strip()
+        if not text:
+            continue
+        try:
+            left, top, width, height = (int(p) for p in parts[6:10])
+            block, par, line, word = (int(p) for p in parts[2:6])
+        except ValueError:
+            continue
+        words.append((float(left), float(top), float(left + width), float(top + height), text, block, par * 1000 + line, word))
+    return words
+
+
+def _words_text(words: List[Word]) -> str:
+    lines: List[str] = []
+    key = None
+    for w in words:
+        if (w[5], w[6]) != key:
+            lines.append(w[4])
+            key = (w[5], w[6])
+        else:
+            lines[-1] += " " + w[4]
+    return "\n".join(lines)
+
+
+_ENGINE = _Engine()
+
+# per-process page counters; pages OCR'd in pool workers are reported back via record()
+OCR_STATS: Dict[str, Any] = {"pages": 0, "errors": 0, "total_sec": 0.0, "max_sec": 0.0}
+
+
+def available() -> bool:
+    return _ENGINE.backend() is not None
+
+
+def page_workers() -> int:
+    """Processes that OCR one document's pages.
+
+    1 inside a job / batch pool worker: its siblings already keep every
+    core busy, and a page pool in each of them would multiply the process
+    count by OCR_PAGE_WORKERS.
+    """
+    return 1 if multiprocessing.parent_process() is not None else OCR_PAGE_WORKERS
+
+
+def recognize_timed(img) -> Tuple[str, float]:
+    """OCR one page image (grayscale or RGB uint8 array); returns ``(text, seconds)``."""
+    started = time.perf_counter()
+    try:
+        text = _ENGINE.recognize(img)
+    except Exception:
+        OCR_STATS["errors"] += 1
+        text = ""
+    return text, time.perf_counter() - started
+
+
+def recognize_words_timed(img) -> Tuple[str, List[Word], float]:
+    """recognize_timed(), plus the word boxes; returns ``(text, words, seconds)``."""
+    started = time.perf_counter()
+    try:
+        text, words = _ENGINE.recognize_words(img)
+    except Exception:
+        OCR_STATS["errors"] += 1
+        text, words = "", []
+    return text, words, time.perf_counter() - started
+
+
+def recognize(img) -> str:
+    text, sec = recognize_timed(img)
+    record(sec)
+    return text
+
+
+def record(sec: float) -> None:
+    OCR_STATS["pages"] += 1
+    OCR_STATS["total_sec"] += sec
+    OCR_STATS["max_sec"] = max(OCR_STATS["max_sec"], sec)
+
+
+def stats() -> Dict[str, Any]:
+    pages = OCR_STATS["pages"]
+    return {
+        "backend": _ENGINE.backend(),
+        "workers": page_workers(),
+        "pages": pages,
+        "errors": OCR_STATS["errors"],
+        "total_sec": round(OCR_STATS["total_sec"], 3),
+        "avg_sec": round(OCR_STATS["total_sec"] / pages, 3) if pages else None,
+        "max_sec": round(OCR_STATS["max_sec"], 3),
+    }
+
+
+def _init_worker() -> None:
+    _ENGINE.warm()
+
+
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Long-lived OCR worker processes, each holding a warmed-up engine."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ProcessPoolExecutor(
+                    max_workers=OCR_PAGE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+    return _EXECUTOR
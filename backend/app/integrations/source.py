@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Optional
+
+from .deps import optional
+from .extract_cache import file_digest
+
+# uploads / downloads up to this size stay in memory; larger ones are spooled to a temp file
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# URL inputs: give up once the body passes this many bytes
+URL_MAX_BYTES = int(os.getenv("URL_MAX_BYTES", str(20 * 1024 * 1024)))
+URL_TIMEOUT_SEC = float(os.getenv("URL_TIMEOUT_SEC", "30"))
+
+_CHUNK = 1 << 20
+
+
+class DocumentTooLarge(ValueError):
+    pass
+
+
+class Document:
+    """An input file's bytes, in memory (``data``) or on disk (``path``), with its SHA-256.
+
+    Documents read from a stream are hashed as they are read; one opened
+    from an existing path is hashed on first use of ``digest``.
+    """
+
+    __slots__ = ("name", "data", "path", "_digest", "_owns_path")
+
+    def __init__(
+        self,
+        name: str,
+        data: Optional[bytes] = None,
+        path: Optional[str] = None,
+        digest: Optional[str] = None,
+        owns_path: bool = False,
+    ) -> None:
+        self.name = name
+        self.data = data
+        self.path = path
+        self._digest = digest
+        self._owns_path = owns_path
+
+    @classmethod
+    def from_path(cls, path: str) -> "Document":
+        return cls(path, path=path)
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            if self.data is not None:
+                self._digest = hashlib.sha256(self.data).hexdigest()
+            else:
+                self._digest = file_digest(self.path)
+        return self._digest
+
+    @property
+    def is_pdf(self) -> bool:
+        if self.name.lower().endswith(".pdf"):
+            return True
+        return self.head(5) == b"%PDF-"
+
+    def head(self, n: int) -> bytes:
+        if self.data is not None:
+            return self.data[:n]
+        with open(self.path, "rb") as f:
+            return f.read(n)
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self) -> None:
+        """Remove the spooled temp file, if this document created one."""
+        if self._owns_path and self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self._owns_path = False
+
+    def __getstate__(self):
+        # OCR pool workers get a copy; only the creating process removes the spool file
+        return (self.name, self.data, self.path, self._digest)
+
+    def __setstate__(self, state) -> None:
+        self.name, self.data, self.path, self._digest = state
+        self._owns_path = False
+
+
+def read_chunks(
+    chunks: Iterable[bytes],
+    name: str,
+    spool_dir: Optional[str] = None,
+    spool_bytes: int = UPLOAD_SPOOL_BYTES,
+    max_bytes: Optional[int] = None,
+) -> Document:
+    """Hash ``chunks`` while collecting them; past ``spool_bytes`` they go to a temp file in ``spool_dir``."""
+    h = hashlib.sha256()
+    buf = io.BytesIO()
+    spool: Optional[BinaryIO] = None
+    spool_path: Optional[str] = None
+    size = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise DocumentTooLarge(f"{name}: larger than {max_bytes} bytes")
+            h.update(chunk)
+            if spool is None and size > spool_bytes:
+                if spool_dir:
+                    os.makedirs(spool_dir, exist_ok=True)
+                suffix = os.path.splitext(name)[1] or ".bin"
+                fd, spool_path = tempfile.mkstemp(suffix=suffix, dir=spool_dir)
+                spool = os.fdopen(fd, "wb")
+                spool.write(buf.getbuffer())
+                buf = io.BytesIO()
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buf.write(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool_path)
+        raise
+    if spool is not None:
+        spool.close()
+        return Document(name, path=spool_path, digest=h.hexdigest(), owns_path=True)
+    return Document(name, data=buf.getvalue(), digest=h.hexdigest())
+
+
+def read_stream(stream: BinaryIO, name: str, spool_dir: Optional[str] = None, **kwargs) -> Document:
+    return read_chunks(iter(lambda: stream.read(_CHUNK), b""), name, spool_dir=spool_dir, **kwargs)
+
+
+def fetch_url(url: str, spool_dir: Optional[str] = None, max_bytes: int = URL_MAX_BYTES) -> Document:
+    """Stream a URL into a Document, refusing bodies over ``max_bytes``."""
+    requests = optional("requests")
+    if not requests:
+        raise RuntimeError("requests not installed to download URL")
+    with requests.get(url, stream=True, timeout=URL_TIMEOUT_SEC) as resp:
+        resp.raise_for_status()
+        declared = resp.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise DocumentTooLarge(f"{url}: Content-Length {declared} over {max_bytes} bytes")
+        name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1] or "download"
+        return read_chunks(resp.iter_content(_CHUNK), name, spool_dir=spool_dir, max_bytes=max_bytes)
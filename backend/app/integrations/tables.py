@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import re
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .deps import optional
+from .hsn_index import clean_code
+from .model import LineItem, percent_of, to_paise, to_percent
+
+# Line items rebuilt locally from word boxes, for invoices Azure is not
+# configured for (or found no items in). Words come from the PDF text layer
+# or Tesseract's TSV output; rows are grouped by baseline, the header row
+# names the columns, and vertical ruling lines (vector strokes in the PDF,
+# or lines found with OpenCV on the OCR'd page) give the column edges when
+# the table is ruled. Amounts become LineItems; compute_item_gst does the rest.
+
+Word = Tuple[float, float, float, float, str, int, int, int]  # PyMuPDF's (x0, y0, x1, y1, text, block, line, word)
+Rule = Tuple[float, float, float]  # vertical ruling line: (x, y0, y1)
+
+_HEADER_WORD = re.compile(
+    r"^(?:s\.?no\.?|sl\.?|sr\.?|no\.?|#|hsn|sac|hsn/sac|code|description|particulars|items?|goods|products?"
+    r"|services?|of|and|&|qty\.?|quantity|uom|unit|units|per|rate|price|mrp|taxable|value|amount|amt\.?|gst|cgst|sgst"
+    r"|igst|utgst|tax|%|rate%|disc\.?|discount|total)$",
+    re.I,
+)
+_STOP_ROW = re.compile(
+    r"^(?:sub\s*-?\s*total|total|grand\s+total|amount\s+chargeable|amount\s+in\s+words|rupees|e\.?\s*&\s*o\.?\s*e|declaration|bank)",
+    re.I,
+)
+_HSN = re.compile(r"(?<!\d)\d{4,8}(?!\d)")
+_NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+# an amount cell is a number and nothing else; keeps header text like "Dated: 01-04-2024" out of the items
+_AMOUNT_CELL = re.compile(r"^(?:rs\.?|inr|₹)?\s*-?\d[\d,]*(?:\.\d{1,2})?$", re.I)
+_UNIT = re.compile(r"[A-Za-z][A-Za-z.]*")
+
+# CGST/SGST are half of a standard slab, IGST (or a single GST column) all of it
+_HALF_SLABS = [Decimal(s) for s in ("0", "2.5", "6", "9", "14")]
+_FULL_SLABS = [Decimal(s) for s in ("0", "5", "12", "18", "28")]
+_SLAB_TOLERANCE = Decimal("0.5")
+_AMOUNT_TOLERANCE_PAISE = 100
+
+# ruling lines shorter than this (PDF points / a fraction of the image height) are ignored
+MIN_RULE_PT = 8.0
+MIN_RULE_FRAC = 0.02
+
+
+class PageLayout:
+    """Word boxes and vertical ruling lines of one page.
+
+    ``space`` is "pt" for the PDF text layer and "px" for an OCR'd page
+    image; a table running on from the previous page reuses its columns
+    only within the same space.
+    """
+
+    __slots__ = ("words", "rules", "space")
+
+    def __init__(self, words: Sequence[Word], rules: Sequence[Rule] = (), space: str = "pt") -> None:
+        self.words = list(words)
+        self.rules = list(rules)
+        self.space = space
+
+
+def image_rules(gray) -> List[Rule]:
+    """Vertical ruling lines on a grayscale page image, by morphological opening."""
+    cv2 = optional("cv2")
+    if cv2 is None:
+        return []
+    h, w = gray.shape[:2]
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    min_len = max(12, int(h * MIN_RULE_FRAC))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, min_len))
+    vertical = cv2.morphologyEx(bw, cv2.MORPH_OPEN, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(vertical, connectivity=8)
+    max_width = max(6, w // 200)
+    return [
+        (float(x) + cw / 2.0, float(y), float(y + ch))
+        for x, y, cw, ch, _area in stats[1:]
+        if ch >= min_len and cw <= max_width
+    ]
+
+
+def pdf_rules(page) -> List[Rule]:
+    """Vertical ruling lines drawn on a PyMuPDF page: line strokes, hairline fills and cell borders."""
+    try:
+        drawings = page.get_drawings()
+    except Exception:
+        return []
+    rules: List[Rule] = []
+    for path in drawings:
+        stroked = path.get("color") is not None
+        for item in path.get("items", ()):
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.x - p2.x) <= 1 and abs(p1.y - p2.y) >= MIN_RULE_PT:
+                    rules.append(((p1.x + p2.x) / 2, min(p1.y, p2.y), max(p1.y, p2.y)))
+            elif item[0] == "re":
+                r = item[1]
+                if r.height < MIN_RULE_PT:
+                    continue
+                if r.width <= 2:
+                    rules.append(((r.x0 + r.x1) / 2, r.y0, r.y1))
+                elif stroked:
+                    rules.append((r.x0, r.y0, r.y1))
+                    rules.append((r.x1, r.y0, r.y1))
+    return rules
+
+
+# ---------- rows and columns ----------
+
+def _rows(words: Sequence[Word]) -> List[List[Word]]:
+    """Words grouped into visual rows by vertical centre, each row left to right."""
+    if not words:
+        return []
+    heights = sorted(w[3] - w[1] for w in words)
+    tol = max(heights[len(heights) // 2] * 0.5, 1.0)
+    rows: List[List[Word]] = []
+    current: List[Word] = []
+    centre = 0.0
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        c = (w[1] + w[3]) / 2
+        if current and c - centre > tol:
+            rows.append(sorted(current, key=lambda w: w[0]))
+            current = []
+        current.append(w)
+        centre = c if len(current) == 1 else centre + (c - centre) / len(current)
+    if current:
+        rows.append(sorted(current, key=lambda w: w[0]))
+    return rows
+
+
+def column_kind(text: str) -> Optional[str]:
+    """What a header cell such as "Taxable Value" or "CGST Rate" holds."""
+    t = text.lower()
+    for tax, kind in (("igst", "igst"), ("cgst", "cgst"), ("sgst", "sgst"), ("utgst", "sgst")):
+        if tax in t:
+            return f"{kind}_percent" if ("%" in t or "rate" in t) else kind
+    if "hsn" in t or "sac" in t:
+        return "hsn"
+    if "taxable" in t:
+        return "taxable"
+    if re.search(r"\b(?:gst|tax)\b", t):
+        return "gst_percent" if ("%" in t or "rate" in t) else "gst"
+    if "%" in t:
+        return "gst_percent"
+    if re.search(r"\bqty\b|quantity", t):
+        return "quantity"
+    if "rate" in t or "price" in t or "mrp" in t:
+        return "rate"
+    if re.search(r"\b(?:uom|units?|per)\b", t):
+        return "unit"
+    if re.search(r"desc|particular|item|goods|product|service", t):
+        return "description"
+    if "disc" in t:
+        return "discount"
+    if re.search(r"amount|\bamt\b|value|total", t):
+        return "amount"
+    if re.search(r"\b(?:sl|sr|s\.?no|no)\b|#", t):
+        return "serial"
+    return None
+
+
+def _is_header_row(row: List[Word]) -> bool:
+    words = [w[4] for w in row]
+    hits = sum(1 for t in words if _HEADER_WORD.match(t.strip(":.,()")))
+    if hits < 3 or hits < 0.6 * len(words):
+        return False
+    kinds = {column_kind(t) for t in words} - {None}
+    return len(kinds) >= 3 and bool(kinds & {"taxable", "amount", "hsn"})
+
+
+def _cells(row: List[Word]) -> List[List[float]]:
+    """Split a header row into cells at gaps wider than an ordinary word space: ``[x0, x1]`` each."""
+    heights = sorted(w[3] - w[1] for w in row)
+    gap = heights[len(heights) // 2] * 0.8
+    cells: List[List[float]] = []
+    for w in row:
+        if cells and w[0] - cells[-1][1] <= gap:
+            cells[-1][1] = max(cells[-1][1], w[2])
+        else:
+            cells.append([w[0], w[2]])
+    return cells
+
+
+class _Column:
+    __slots__ = ("x0", "x1", "words", "kind")
+
+    def __init__(self, x0: float, x1: float) -> None:
+        self.x0 = x0
+        self.x1 = x1
+        self.words: List[str] = []
+        self.kind: Optional[str] = None
+
+
+def _overlap(a0: float, a1: float, b0: float, b1: float) -> float:
+    return min(a1, b1) - max(a0, b0)
+
+
+def _columns(header_rows: List[List[Word]], rules: Sequence[Rule]) -> List[_Column]:
+    """Columns of the table whose header is ``header_rows`` (main row first, then sub-header rows)."""
+    header = [w for row in header_rows for w in row]
+    top = min(w[1] for w in header)
+    bottom = max(w[3] for w in header)
+    left = min(w[0] for w in header)
+    right = max(w[2] for w in header)
+
+    # rules crossing the header band split it into columns
+    xs: List[float] = []
+    for x, y0, y1 in sorted(rules):
+        if y0 <= (top + bottom) / 2 and y1 >= bottom and left - 50 <= x <= right + 50:
+            if not xs or x - xs[-1] > 2:
+                xs.append(x)
+    if len(xs) >= 3:
+        edges = [min(left, xs[0]) - 1] + xs + [max(right, xs[-1]) + 1]
+        columns = [_Column(a, b) for a, b in zip(edges, edges[1:]) if b - a > 2]
+    else:
+        # unruled: the finest split of the header rows, e.g. "CGST" over "Rate  Amount"
+        columns = [_Column(a, b) for a, b in _cells(header_rows[0])]
+        for row in header_rows[1:]:
+            split: List[_Column] = []
+            subs = _cells(row)
+            for col in columns:
+                inside = [s for s in subs if _overlap(col.x0, col.x1, s[0], s[1]) > 0]
+                if len(inside) >= 2:
+                    split.extend(_Column(min(s[0], col.x0) if i == 0 else s[0], s[1]) for i, s in enumerate(inside))
+                else:
+                    split.append(col)
+            columns = split
+
+    # a header word belongs to every column it covers a good part of ("CGST" spanning Rate and Amount)
+    for w in header:
+        for col in columns:
+            ov = _overlap(col.x0, col.x1, w[0], w[2])
+            if ov > 0 and ov >= 0.5 * min(w[2] - w[0], col.x1 - col.x0):
+                col.words.append(w[4])
+    for col in columns:
+        col.kind = column_kind(" ".join(col.words))
+    return [col for col in columns if col.kind]
+
+
+def _assign(row: List[Word], columns: List[_Column]) -> Dict[str, str]:
+    """Cell texts of a body row keyed by column kind: each word goes to the column it overlaps most, else the nearest."""
+    cells: Dict[str, List[str]] = {}
+    for w in row:
+        best = max(columns, key=lambda c: _overlap(c.x0, c.x1, w[0], w[2]))
+        if _overlap(best.x0, best.x1, w[0], w[2]) <= 0:
+            mid = (w[0] + w[2]) / 2
+            best = min(columns, key=lambda c: min(abs(mid - c.x0), abs(mid - c.x1)))
+        cells.setdefault(best.kind, []).append(w[4])
+    return {kind: " ".join(words) for kind, words in cells.items()}
+
+
+# ---------- cells to line items ----------
+
+def _number(text: Optional[str]) -> Optional[Decimal]:
+    m = _NUMBER.search(text.replace(" ", "")) if text else None
+    if not m:
+        return None
+    try:
+        return Decimal(m.group(0).replace(",", ""))
+    except Exception:
+        return None
+
+
+def _amount(text: Optional[str]) -> Optional[int]:
+    return to_paise(text) if text and _AMOUNT_CELL.match(text.strip()) else None
+
+
+def _implied_percent(amount: Optional[int], taxable: Optional[int], slabs: List[Decimal]) -> Optional[Decimal]:
+    """The rate a printed tax amount stands for: the nearest standard slab when it reproduces the amount."""
+    if amount is None or not taxable:
+        return None
+    pct = Decimal(amount * 100) / Decimal(taxable)
+    best = min(slabs, key=lambda s: abs(s - pct))
+    if abs(best - pct) <= _SLAB_TOLERANCE and abs(percent_of(taxable, best) - amount) <= _AMOUNT_TOLERANCE_PAISE:
+        return best
+    return pct.quantize(Decimal("0.01"))
+
+
+def _tax(item: LineItem, cells: Dict[str, str], kind: str, slabs: List[Decimal]) -> Optional[Decimal]:
+    """Percent from a rate column, or from an amount column ("9%" reads as a rate wherever it sits)."""
+    pct_text = cells.get(f"{kind}_percent")
+    if pct_text and _number(pct_text) is not None:
+        return to_percent(pct_text)
+    amount_text = cells.get(kind)
+    if amount_text is None:
+        return None
+    if "%" in amount_text:
+        return to_percent(amount_text)
+    return _implied_percent(to_paise(amount_text), item.taxable, slabs)
+
+
+def _line_item(cells: Dict[str, str]) -> Optional[LineItem]:
+    """A LineItem from one body row, or None when the row has no amount to tax."""
+    qty = _number(cells.get("quantity"))
+    rate = _number(cells.get("rate"))
+    taxable = _amount(cells.get("taxable"))
+    if taxable is None:
+        taxable = _amount(cells.get("amount"))
+    if taxable is None and qty is not None and rate is not None:
+        taxable = to_paise(qty * rate)
+    if taxable is None:
+        return None
+
+    hsn = _HSN.search(cells.get("hsn", ""))
+    description = cells.get("description")
+    if not (hsn or description or qty is not None):
+        return None
+
+    item = LineItem(
+        hsn=clean_code(hsn.group(0)) if hsn else None,
+        description=description,
+        quantity=(int(qty) if qty == qty.to_integral_value() else float(qty)) if qty is not None else None,
+        unit_price=float(rate) if rate is not None else None,
+        taxable=taxable,
+    )
+    unit = cells.get("unit") or " ".join(_UNIT.findall(cells.get("quantity", ""))) or None
+    item.unit = unit
+    item.igst_percent = _tax(item, cells, "igst", _FULL_SLABS)
+    item.cgst_percent = _tax(item, cells, "cgst", _HALF_SLABS)
+    item.sgst_percent = _tax(item, cells, "sgst", _HALF_SLABS)
+    item.gst_percent = _tax(item, cells, "gst", _FULL_SLABS)
+    if item.gst_percent is None and item.igst_percent is not None and item.cgst_percent is None and item.sgst_percent is None:
+        item.gst_percent = item.igst_percent
+    return item
+
+
+def _numeric_cells(cells: Dict[str, str]) -> bool:
+    return any(
+        _number(text) is not None
+        for kind, text in cells.items()
+        if kind not in ("description", "serial", "unit")
+    )
+
+
+def extract_items(pages: Sequence[Optional[PageLayout]]) -> List[LineItem]:
+    """Line items from the item table(s) on ``pages``, numbered in reading order."""
+    items: List[LineItem] = []
+    columns: Optional[List[_Column]] = None
+    space: Optional[str] = None
+    for page in pages:
+        if page is None:
+            columns = None
+            continue
+        if page.space != space:
+            columns = None
+        space = page.space
+        rows = _rows(page.words)
+        last_bottom: Optional[float] = None
+        i = 0
+        while i < len(rows):
+            row = rows[i]
+            if _is_header_row(row):
+                header_rows = [row]
+                # a second header line made only of header words ("Rate  Amount" under "CGST")
+                if i + 1 < len(rows) and all(_HEADER_WORD.match(w[4].strip(":.,()")) for w in rows[i + 1]):
+                    header_rows.append(rows[i + 1])
+                    i += 1
+                columns = _columns(header_rows, page.rules) or None
+                i += 1
+                continue
+            if columns is None:
+                i += 1
+                continue
+            text = " ".join(w[4] for w in row)
+            if _STOP_ROW.match(text):
+                columns = None
+                i += 1
+                continue
+            cells = _assign(row, columns)
+            item = _line_item(cells)
+            top = min(w[1] for w in row)
+            if item is not None:
+                item.line_no = len(items) + 1
+                items.append(item)
+                last_bottom = max(w[3] for w in row)
+            elif (
+                last_bottom is not None
+                and top - last_bottom < max(w[3] - w[1] for w in row)
+                and cells.get("description")
+                and not _numeric_cells(cells)
+            ):
+                # description wrapped onto the next line
+                prev = items[-1]
+                prev.description = f"{prev.description} {cells['description']}" if prev.description else cells["description"]
+                last_bottom = max(w[3] for w in row)
+            i += 1
+    return items
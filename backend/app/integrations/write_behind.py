@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import copy
+import glob
+import json
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from . import metrics
+from .db import DatabaseUnavailable, MongoPool, get_pool
+from .deps import optional
+
+log = logging.getLogger(__name__)
+
+# Extracted invoices are not inserted inside the request: they are queued
+# here and written by a background thread with insert_many, a batch at a
+# time. Failed batches are retried with backoff, then spilled to an
+# on-disk journal that is replayed once Mongo answers again. Each doc gets
+# its _id when queued, so a replayed or retried doc that already made it in
+# is a duplicate-key error, counted as written.
+
+MONGO_WRITE_BATCH = int(os.getenv("MONGO_WRITE_BATCH", "100"))
+MONGO_WRITE_INTERVAL_SEC = float(os.getenv("MONGO_WRITE_INTERVAL_SEC", "1.0"))
+# docs held in memory before new ones go straight to the journal
+MONGO_WRITE_QUEUE_MAX = int(os.getenv("MONGO_WRITE_QUEUE_MAX", "10000"))
+MONGO_WRITE_RETRIES = int(os.getenv("MONGO_WRITE_RETRIES", "3"))
+MONGO_WRITE_BACKOFF_SEC = float(os.getenv("MONGO_WRITE_BACKOFF_SEC", "0.5"))
+MONGO_JOURNAL_DIR = os.getenv("MONGO_JOURNAL_DIR", os.path.join(os.getcwd(), "journal"))
+MONGO_JOURNAL_REPLAY_SEC = float(os.getenv("MONGO_JOURNAL_REPLAY_SEC", "30"))
+MONGO_SHUTDOWN_TIMEOUT_SEC = float(os.getenv("MONGO_SHUTDOWN_TIMEOUT_SEC", "10"))
+
+_DUPLICATE_KEY = 11000
+
+
+def _new_id() -> Any:
+    bson = optional("bson")
+    return bson.ObjectId() if bson is not None else uuid.uuid4().hex
+
+
+def _dumps(doc: Dict[str, Any]) -> str:
+    # extended JSON keeps ObjectId / datetime types across a replay
+    json_util = optional("bson.json_util")
+    return json_util.dumps(doc) if json_util is not None else json.dumps(doc, default=str)
+
+
+def _loads(line: str) -> Dict[str, Any]:
+    json_util = optional("bson.json_util")
+    return json_util.loads(line) if json_util is not None else json.loads(line)
+
+
+class WriteBehind:
+    """Buffered, batched inserts into one collection, with a disk journal as overflow.
+
+    ``enqueue`` never touches the network. The writer thread starts on the
+    first enqueue and is stopped (after a final flush) by ``close``.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        pool: Optional[MongoPool] = None,
+        batch_size: int = MONGO_WRITE_BATCH,
+        interval: float = MONGO_WRITE_INTERVAL_SEC,
+        queue_max: int = MONGO_WRITE_QUEUE_MAX,
+        retries: int = MONGO_WRITE_RETRIES,
+        backoff: float = MONGO_WRITE_BACKOFF_SEC,
+        journal_dir: str = MONGO_JOURNAL_DIR,
+        replay_interval: float = MONGO_JOURNAL_REPLAY_SEC,
+    ) -> None:
+        self.collection = collection
+        self._pool = pool
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.queue_max = queue_max
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.journal_dir = journal_dir
+        self.replay_interval = replay_interval
+        self._buf: List[Dict[str, Any]] = []
+        self._oldest = 0.0
+        self._inflight = 0
+        self._flush_requested = False
+        self._closing = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_replay = 0.0
+        self.counters = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "spilled": 0,
+            "replayed": 0,
+        }
+
+    @property
+    def pool(self) -> MongoPool:
+        return self._pool if self._pool is not None else get_pool()
+
+    @property
+    def configured(self) -> bool:
+        return self.pool.configured
+
+    # ---------- producer side ----------
+
+    def enqueue(self, doc: Dict[str, Any]) -> str:
+        """Queue a copy of ``doc`` for insertion; returns the ``_id`` it will be stored under."""
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", _new_id())
+        with self._cond:
+            self.counters["queued"] += 1
+            if self._closing or len(self._buf) >= self.queue_max:
+                overflow = True
+            else:
+                overflow = False
+                if not self._buf:
+                    self._oldest = time.monotonic()
+                self._buf.append(doc)
+                self._ensure_thread()
+                if len(self._buf) >= self.batch_size:
+                    self._cond.notify()
+        if overflow:
+            self._spill([doc])
+        return str(doc["_id"])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued so far; False if ``timeout`` passed first."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            if self._thread is None:
+                return not self._buf
+            self._flush_requested = True
+            self._cond.notify()
+            while self._buf or self._inflight:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._flush_requested = False
+        return True
+
+    def close(self, timeout: float = MONGO_SHUTDOWN_TIMEOUT_SEC) -> None:
+        """Flush and stop the writer; whatever could not be written in time goes to the journal."""
+        with self._cond:
+            self._closing = True
+            self._flush_requested = True
+            self._cond.notify()
+            thread = self._thread
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            left, self._buf = self._buf, []
+        if left:
+            self._spill(left)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+            self._thread.start()
+
+    # ---------- writer thread ----------
+
+    def _take(self) -> List[Dict[str, Any]]:
+        """Wait for a full batch, the oldest doc to reach ``interval``, a flush or close."""
+        with self._cond:
+            while True:
+                if self._buf and (
+                    len(self._buf) >= self.batch_size
+                    or self._flush_requested
+                    or time.monotonic() - self._oldest >= self.interval
+                ):
+                    batch, self._buf = self._buf[: self.batch_size], self._buf[self.batch_size:]
+                    self._oldest = time.monotonic()
+                    self._inflight += 1
+                    return batch
+                if self._closing:
+                    return []
+                wait = self.interval - (time.monotonic() - self._oldest) if self._buf else self.replay_interval
+                self._cond.wait(max(0.01, wait))
+                if not self._buf and time.monotonic() - self._last_replay >= self.replay_interval:
+                    return []
+
+    def _run(self) -> None:
+        self._replay()
+        while True:
+            batch = self._take()
+            if batch:
+                try:
+                    ok = self._write(batch)
+                finally:
+                    with self._cond:
+                        self._inflight -= 1
+                        self._cond.notify_all()
+                if ok and time.monotonic() - self._last_replay >= self.replay_interval:
+                    self._replay()
+            elif self._closing:
+                return
+            else:
+                self._replay()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        """Insert with retries; spill to the journal when Mongo stays unavailable. True once written."""
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert(batch)
+                return True
+            except DatabaseUnavailable as e:
+                if attempt == self.retries or self._closing:
+                    log.warning("mongo write-behind: %s; journaling %d docs", e, len(batch))
+                    break
+                self.counters["retries"] += 1
+                if self._stop.wait(self.backoff * (2 ** attempt)):
+                    break
+        self._spill(batch)
+        return False
+
+    def _insert(self, batch: List[Dict[str, Any]]) -> None:
+        """One insert_many; duplicate _ids (already written) count as written, other rejected docs are dropped."""
+        coll = self.collection
+        try:
+            with metrics.timer("mongo_insert"):
+                self.pool.run(lambda db: db[coll].insert_many(batch, ordered=False))
+            written, duplicates, failed = len(batch), 0, 0
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            errors_module = optional("pymongo.errors")
+            if errors_module is not None and isinstance(e, errors_module.BulkWriteError):
+                errors = e.details.get("writeErrors", [])
+                duplicates = sum(1 for err in errors if err.get("code") == _DUPLICATE_KEY)
+                failed = len(errors) - duplicates
+                written = len(batch) - failed
+            else:
+                written, duplicates, failed = 0, 0, len(batch)
+            if failed:
+                log.error("mongo write-behind: %d of %d docs rejected: %s", failed, len(batch), e)
+        self.counters["batches"] += 1
+        self.counters["written"] += written
+        self.counters["duplicates"] += duplicates
+        self.counters["failed"] += failed
+
+    # ---------- journal ----------
+
+    def _spill(self, docs: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.journal_dir, exist_ok=True)
+        name = f"mongo-{self.collection}-{os.getpid()}-{time.time_ns()}.jsonl"
+        tmp = os.path.join(self.journal_dir, name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for doc in docs:
+                    f.write(_dumps(doc) + "\n")
+            os.replace(tmp, os.path.join(self.journal_dir, name))
+            self.counters["spilled"] += len(docs)
+        except OSError as e:
+            self.counters["failed"] += len(docs)
+            log.error("mongo write-behind: could not journal %d docs: %s", len(docs), e)
+
+    def journal_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.journal_dir, f"mongo-{self.collection}-*.jsonl")))
+
+    def _replay(self) -> None:
+        """Insert journaled docs, oldest file first, until Mongo refuses again."""
+        self._last_replay = time.monotonic()
+        if not self.configured:
+            return
+        for path in self.journal_files():
+            # claim the file so another process replaying the same directory skips it
+            claimed = f"{path}.{os.getpid()}.replaying"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            try:
+                with open(claimed, encoding="utf-8") as f:
+                    docs = [_loads(line) for line in f if line.strip()]
+                for start in range(0, len(docs), self.batch_size):
+                    self._insert(docs[start:start + self.batch_size])
+            except DatabaseUnavailable:
+                os.rename(claimed, path)
+                return
+            except (OSError, ValueError) as e:
+                log.error("mongo write-behind: unreadable journal %s: %s", path, e)
+                os.rename(claimed, path + ".bad")
+                continue
+            self.counters["replayed"] += len(docs)
+            os.remove(claimed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            buffered = len(self._buf)
+        return dict(
+            self.counters,
+            buffered=buffered,
+            running=self._thread is not None and self._thread.is_alive(),
+            journal_files=len(self.journal_files()),
+        )
+
+
+_WRITERS: Dict[str, WriteBehind] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_writer(collection: str) -> WriteBehind:
+    """The process-wide writer for ``collection``, created on first use."""
+    writer = _WRITERS.get(collection)
+    if writer is None:
+        with _WRITERS_LOCK:
+            writer = _WRITERS.get(collection)
+            if writer is None:
+                if not _WRITERS:
+                    # runs at interpreter exit in the server and when a pool worker
+                    # process exits, where atexit handlers are skipped
+                    multiprocessing.util.Finalize(None, shutdown, exitpriority=10)
+                writer = _WRITERS[collection] = WriteBehind(collection)
+    return writer
+
+
+def shutdown(timeout: float = MONGO_SHUTDOWN_TIMEOUT_SEC) -> None:
+    """Flush and stop every writer in this process."""
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+        _WRITERS.clear()
+    for writer in writers:
+        writer.close(timeout)
+
+
+def stats() -> Dict[str, Any]:
+    return {name: writer.stats() for name, writer in list(_WRITERS.items())}
@@ -1,23 +1,167 @@
 from __future__ import annotations
 
+import json
 import os
+import sys
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
 from werkzeug.utils import secure_filename
 
-from .services.extractor_adapter import ExtractorNotConfigured, extract as run_extract
-from .services.logic_adapter import LogicNotConfigured, analyze as run_analyze
+from .integrations import metrics
+from .integrations.source import Document, DocumentTooLarge, read_stream
+from .services.extractor_adapter import ExtractorNotConfigured, extract as run_extract, extract_with_facts
+from .services import workers
+from .services.jobs import JobQueue, QueueFull, discard_uploads, new_job_id
+from .services.logic_adapter import LogicNotConfigured, analyze as run_analyze, analyze_many as run_analyze_many
 
 bp = Blueprint("api", __name__)
 
 
+@bp.before_request
+def _start_timer() -> None:
+    if metrics.enabled():
+        g.request_started = time.perf_counter()
+
+
+@bp.after_request
+def _record_request(response: Response) -> Response:
+    started = g.pop("request_started", None)
+    if started is not None:
+        # label by rule ("/api/jobs/<job_id>"), not by path, to keep cardinality bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+class _BadRequest(Exception):
+    pass
+
+
 def _allowed_file(filename: str) -> bool:
     allowed = current_app.config.get("ALLOWED_EXTENSIONS", set())
     return "." in filename and filename.rsplit(".", 1)[1].lower() in allowed
 
 
+def _save_upload(file, prefix: str = "") -> str:
+    upload_dir = current_app.config["UPLOAD_FOLDER"]
+    os.makedirs(upload_dir, exist_ok=True)
+    filename = prefix + secure_filename(file.filename)
+    save_path = os.path.join(upload_dir, filename)
+    with metrics.timer("upload_save"):
+        file.save(save_path)
+    return save_path
+
+
+def _read_upload(file) -> Document:
+    """Hash the upload while reading it into memory (spooled to UPLOAD_FOLDER when large)."""
+    with metrics.timer("upload_save"):
+        return read_stream(file.stream, secure_filename(file.filename), spool_dir=current_app.config["UPLOAD_FOLDER"])
+
+
+def _payload_from_request(upload_prefix: str = "", in_memory: bool = False) -> Tuple[Dict[str, Any], bool]:
+    """Shape the extractor payload from a multipart upload or a JSON body.
+
+    With ``in_memory`` the upload is handed over as ``payload["document"]``
+    instead of being saved first; only for requests extracted in this process.
+    Returns ``(payload, return_intermediate)``; raises _BadRequest on invalid input.
+    """
+    payload: Dict[str, Any] = {}
+    if request.content_type and request.content_type.startswith("multipart/form-data"):
+        if "file" not in request.files:
+            raise _BadRequest("file field missing")
+        file = request.files["file"]
+        if file.filename == "":
+            raise _BadRequest("empty filename")
+        if not _allowed_file(file.filename):
+            raise _BadRequest("file type not allowed")
+        # optional JSON options in a separate field
+        if request.form.get("options"):
+            try:
+                payload["options"] = json.loads(request.form["options"])
+            except Exception:
+                raise _BadRequest("options must be valid JSON")
+        if in_memory:
+            payload["document"] = _read_upload(file)
+        else:
+            payload["file_path"] = _save_upload(file, prefix=upload_prefix)
+        return payload, request.form.get("return_intermediate", "false").lower() == "true"
+
+    data = request.get_json(force=True, silent=True) or {}
+    payload.update({k: v for k, v in data.items() if k in ("text", "url", "file_path", "options")})
+    if not any(k in payload for k in ("text", "url", "file_path")):
+        raise _BadRequest("provide one of: text, url, file_path")
+    return payload, bool(data.get("return_intermediate", False))
+
+
+def _save_batch_uploads(prefix: str) -> List[Tuple[str, str]]:
+    """Save every uploaded file (zip archives are unpacked); returns ``(name, path)`` pairs."""
+    max_files = current_app.config.get("BATCH_MAX_FILES", 100)
+    saved: List[Tuple[str, str]] = []
+    files = request.files.getlist("files") + request.files.getlist("file")
+    if not files:
+        raise _BadRequest("files field missing")
+    try:
+        for file in files:
+            if file.filename == "":
+                raise _BadRequest("empty filename")
+            if file.filename.lower().endswith(".zip"):
+                saved.extend(_save_zip_members(file, prefix, already=len(saved)))
+            elif _allowed_file(file.filename):
+                saved.append((file.filename, _save_upload(file, prefix=prefix)))
+            else:
+                raise _BadRequest(f"file type not allowed: {file.filename}")
+            if len(saved) > max_files:
+                raise _BadRequest(f"too many files (max {max_files})")
+    except Exception:
+        # the request is rejected: nothing will read what was already written
+        discard_uploads(path for _, path in saved)
+        raise
+    if not saved:
+        raise _BadRequest("no processable files in upload")
+    return saved
+
+
+def _save_zip_members(file, prefix: str, already: int = 0) -> List[Tuple[str, str]]:
+    """Unpack the allowed members of an uploaded zip; ``already`` files of the batch are saved."""
+    upload_dir = current_app.config["UPLOAD_FOLDER"]
+    max_files = current_app.config.get("BATCH_MAX_FILES", 100)
+    max_bytes = current_app.config.get("BATCH_MAX_UNZIPPED_BYTES", 200 * 1024 * 1024)
+    os.makedirs(upload_dir, exist_ok=True)
+    out: List[Tuple[str, str]] = []
+    try:
+        with zipfile.ZipFile(file.stream) as zf:
+            members = [m for m in zf.infolist() if not m.is_dir() and _allowed_file(m.filename)]
+            if sum(m.file_size for m in members) > max_bytes:
+                raise _BadRequest("zip archive too large when unpacked")
+            # checked before anything is written, like the unpacked size
+            if already + len(members) > max_files:
+                raise _BadRequest(f"too many files (max {max_files})")
+            for i, m in enumerate(members):
+                # flatten and sanitize member paths; index keeps same-named members apart
+                name = secure_filename(os.path.basename(m.filename)) or f"member{i}"
+                path = os.path.join(upload_dir, f"{prefix}{i}_{name}")
+                out.append((m.filename, path))
+                with zf.open(m) as src, open(path, "wb") as dst:
+                    dst.write(src.read())
+    except zipfile.BadZipFile:
+        discard_uploads(path for _, path in out)
+        raise _BadRequest(f"not a valid zip archive: {file.filename}")
+    except Exception:
+        discard_uploads(path for _, path in out)
+        raise
+    return out
+
+
+def _job_queue() -> JobQueue:
+    return current_app.extensions["job_queue"]
+
+
 @bp.get("/health")
 def health() -> Any:
     return jsonify({
@@ -27,40 +171,56 @@ def health() -> Any:
     })
 
 
+@bp.get("/stats")
+def stats() -> Any:
+    from .integrations.azure_client import get_client as get_azure_client  # noqa: WPS433
+    from .integrations.db import get_pool  # noqa: WPS433
+    from .integrations.extract_cache import get_cache as get_extract_cache  # noqa: WPS433
+    from .integrations.hsn_index import get_hsn_index  # noqa: WPS433
+    return jsonify({
+        "hsn_index": get_hsn_index().stats(),
+        "mongo": get_pool().stats(),
+        "mongo_writer": _loaded_stats("app.integrations.write_behind", "stats"),
+        "jobs": _job_queue().stats(),
+        "azure": get_azure_client().stats(),
+        "extract_cache": get_extract_cache().stats() if get_extract_cache() else None,
+        "text_layer": _loaded_stats("app.integrations.extractor", "text_layer_stats"),
+        "ocr": _loaded_stats("app.integrations.ocr", "stats"),
+        "fingerprints": _loaded_stats("app.integrations.fingerprint", "stats"),
+    })
+
+
+@bp.get("/metrics")
+def metrics_endpoint() -> Any:
+    if not metrics.enabled():
+        return jsonify({"error": "metrics disabled (METRICS_ENABLED=0)"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _loaded_stats(module_name: str, fn: str) -> Any:
+    # only report modules that are already loaded; /api/stats shouldn't pull in OCR deps
+    module = sys.modules.get(module_name)
+    return getattr(module, fn)() if module else None
+
+
+@bp.post("/hsn/reload")
+def hsn_reload() -> Any:
+    from .integrations.hsn_index import get_hsn_index  # noqa: WPS433
+    index = get_hsn_index()
+    version = index.reload()
+    return jsonify({"version": version, "size": len(index)}), 200
+
+
 @bp.post("/extract")
 def extract_endpoint() -> Any:
     try:
-        payload: Dict[str, Any] = {}
-        if request.content_type and request.content_type.startswith("multipart/form-data"):
-            if "file" not in request.files:
-                return jsonify({"error": "file field missing"}), 400
-            file = request.files["file"]
-            if file.filename == "":
-                return jsonify({"error": "empty filename"}), 400
-            if not _allowed_file(file.filename):
-                return jsonify({"error": "file type not allowed"}), 400
-
-            upload_dir = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_dir, exist_ok=True)
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(upload_dir, filename)
-            file.save(save_path)
-            payload["file_path"] = save_path
-            # optional JSON options in a separate field
-            if request.form.get("options"):
-                try:
-                    import json as _json
-                    payload["options"] = _json.loads(request.form["options"])
-                except Exception:
-                    return jsonify({"error": "options must be valid JSON"}), 400
-        else:
-            data = request.get_json(silent=True) or {}
-            if not any(k in data for k in ("text", "url", "file_path")):
-                return jsonify({"error": "provide one of: text, url, file_path"}), 400
-            payload.update({k: v for k, v in data.items() if k in ("text", "url", "file_path", "options")})
-
+        payload, _ = _payload_from_request(in_memory=True)
         extracted = run_extract(payload)
         return jsonify({"extracted": extracted}), 200
+    except _BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except DocumentTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except ExtractorNotConfigured as e:
         return jsonify({"error": str(e)}), 501
     except Exception as e:  # pragma: no cover
@@ -84,47 +244,267 @@ def analyze_endpoint() -> Any:
         return jsonify({"error": "internal_error", "detail": str(e)}), 500
 
 
+def _batch_invoices() -> Tuple[Iterator[Tuple[Any, Optional[str]]], Optional[Dict[str, Any]], bool]:
+    """Invoices posted to /api/analyze/batch as ``(invoice, parse_error)`` pairs.
+
+    NDJSON bodies (one invoice per line) are read lazily while results
+    stream out; ``options`` / ``parallel`` then come from the query string.
+    A JSON body is an array of invoices or ``{"invoices": [...], "options"?, "parallel"?}``.
+    """
+    try:
+        options = json.loads(request.args["options"]) if request.args.get("options") else None
+    except Exception:
+        raise _BadRequest("options must be valid JSON")
+    parallel = request.args.get("parallel", "false").lower() == "true"
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        return _ndjson_lines(request.stream), options, parallel
+
+    data = request.get_json(force=True, silent=True)
+    if isinstance(data, dict):
+        options = data.get("options", options)
+        parallel = bool(data.get("parallel", parallel))
+        data = data.get("invoices")
+    if not isinstance(data, list):
+        raise _BadRequest("body must be a JSON array of invoices, {\"invoices\": [...]} or NDJSON")
+    return ((inv, None) for inv in data), options, parallel
+
+
+def _ndjson_lines(stream) -> Iterator[Tuple[Any, Optional[str]]]:
+    for raw in stream:
+        if not raw.strip():
+            continue
+        try:
+            yield json.loads(raw), None
+        except ValueError as e:
+            yield None, f"invalid JSON line: {e}"
+
+
+def _chunked(pairs: Iterable[Tuple[Any, Optional[str]]], size: int) -> Iterator[Tuple[List[Tuple[int, str]], List[int], List[Any]]]:
+    """Groups of up to ``size`` invoices as ``(parse_errors, indexes, invoices)``."""
+    errors: List[Tuple[int, str]] = []
+    indexes: List[int] = []
+    chunk: List[Any] = []
+    for index, (inv, error) in enumerate(pairs):
+        if error is not None:
+            errors.append((index, error))
+            continue
+        indexes.append(index)
+        chunk.append(inv)
+        if len(chunk) >= size:
+            yield errors, indexes, chunk
+            errors, indexes, chunk = [], [], []
+    if errors or chunk:
+        yield errors, indexes, chunk
+
+
+@bp.post("/analyze/batch")
+def analyze_batch_endpoint() -> Any:
+    """Run /api/analyze over many extracted invoices, streaming NDJSON.
+
+    Invoices are checked in chunks of ANALYZE_BATCH_CHUNK with the HSN index
+    and fingerprint store shared across each chunk; with ``parallel`` the
+    chunks run on the worker pool. One ``{index, status, result}`` line per
+    invoice (input order within a chunk; chunks in completion order), then
+    a final ``{"summary": ...}`` line with throughput.
+    """
+    try:
+        pairs, options, parallel = _batch_invoices()
+    except _BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    chunk_size = max(1, current_app.config.get("ANALYZE_BATCH_CHUNK", 200))
+
+    def lines(errors: List[Tuple[int, str]], indexes: List[int], outs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for index, error in errors:
+            yield {"index": index, "status": "error", "error": error}
+        for index, out in zip(indexes, outs):
+            if "error" in out:
+                yield {"index": index, "status": "error", "error": out["error"]}
+            else:
+                yield {"index": index, "status": "ok", "result": out["result"]}
+
+    def generate() -> Iterator[str]:
+        started = time.monotonic()
+        counts = {"ok": 0, "error": 0}
+        chunks = 0
+        pending: Dict[Any, Tuple[List[Tuple[int, str]], List[int]]] = {}
+
+        def failed(e: Exception, indexes: List[int]) -> List[Dict[str, Any]]:
+            return [{"error": f"{type(e).__name__}: {e}"}] * len(indexes)
+
+        def finished(fut) -> Iterator[Dict[str, Any]]:
+            errors, indexes = pending.pop(fut)
+            try:
+                outs = fut.result()["results"]
+            except Exception as e:
+                outs = failed(e, indexes)
+            return lines(errors, indexes, outs)
+
+        try:
+            for errors, indexes, chunk in _chunked(pairs, chunk_size):
+                chunks += 1
+                if parallel and chunk:
+                    pending[workers.submit(workers.run_analyze_chunk, chunk, options)] = (errors, indexes)
+                    # bound how much of a streamed body is held while the pool is busy
+                    if len(pending) < 2 * workers.max_workers():
+                        continue
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    out_lines = [line for fut in done for line in finished(fut)]
+                else:
+                    try:
+                        outs = run_analyze_many(chunk, options) if chunk else []
+                    except Exception as e:
+                        outs = failed(e, indexes)
+                    out_lines = list(lines(errors, indexes, outs))
+                for line in out_lines:
+                    counts["ok" if line["status"] == "ok" else "error"] += 1
+                    yield json.dumps(line, default=str) + "\n"
+            for fut in as_completed(list(pending)):
+                for line in finished(fut):
+                    counts["ok" if line["status"] == "ok" else "error"] += 1
+                    yield json.dumps(line, default=str) + "\n"
+        except Exception as e:
+            # e.g. the request body could not be read; the summary still closes the stream
+            yield json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n"
+        finally:
+            for fut in pending:
+                fut.cancel()
+        elapsed = time.monotonic() - started
+        total = counts["ok"] + counts["error"]
+        yield json.dumps({"summary": {
+            "invoices": total,
+            "succeeded": counts["ok"],
+            "failed": counts["error"],
+            "chunks": chunks,
+            "elapsed_sec": round(elapsed, 3),
+            "invoices_per_sec": round(total / elapsed, 3) if elapsed > 0 else None,
+            "workers": workers.max_workers() if parallel else 1,
+        }}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 @bp.post("/process")
 def process_endpoint() -> Any:
     try:
-        # Reuse extract handler logic for payload shaping
-        if request.content_type and request.content_type.startswith("multipart/form-data"):
-            # create a fake request dict like extract_endpoint does
-            if "file" not in request.files:
-                return jsonify({"error": "file field missing"}), 400
-            file = request.files["file"]
-            if file.filename == "":
-                return jsonify({"error": "empty filename"}), 400
-            if not _allowed_file(file.filename):
-                return jsonify({"error": "file type not allowed"}), 400
-            upload_dir = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_dir, exist_ok=True)
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(upload_dir, filename)
-            file.save(save_path)
-            payload = {"file_path": save_path}
-            if request.form.get("options"):
-                try:
-                    import json as _json
-                    payload["options"] = _json.loads(request.form["options"])
-                except Exception:
-                    return jsonify({"error": "options must be valid JSON"}), 400
-            return_intermediate = request.form.get("return_intermediate", "false").lower() == "true"
-        else:
-            data = request.get_json(force=True)
-            payload = {k: v for k, v in data.items() if k in ("text", "url", "file_path", "options")}
-            if not any(k in payload for k in ("text", "url", "file_path")):
-                return jsonify({"error": "provide one of: text, url, file_path"}), 400
-            return_intermediate = bool(data.get("return_intermediate", False))
-
-        extracted = run_extract(payload)
-        result = run_analyze(extracted, payload.get("options"))
+        payload, return_intermediate = _payload_from_request(in_memory=True)
+        # facts: fields and item amounts extract() parsed, so analyze() doesn't redo them
+        extracted, facts = extract_with_facts(payload)
+        result = run_analyze(extracted, payload.get("options"), facts=facts)
         out: Dict[str, Any] = {"result": result}
         if return_intermediate:
             out["extracted"] = extracted
         return jsonify(out), 200
+    except _BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except DocumentTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except (ExtractorNotConfigured, LogicNotConfigured) as e:
         return jsonify({"error": str(e)}), 501
     except Exception as e:  # pragma: no cover
         current_app.logger.exception("/process failed")
         return jsonify({"error": "internal_error", "detail": str(e)}), 500
+
+
+@bp.post("/jobs")
+def submit_job() -> Any:
+    try:
+        job_id = new_job_id()
+        # prefix uploads with the job id: the file is read later, after other
+        # uploads with the same name may have arrived
+        payload, return_intermediate = _payload_from_request(upload_prefix=f"{job_id}_")
+        # only a file saved from this request is ours to delete, not a posted file_path
+        uploads = [payload["file_path"]] if request.files and "file_path" in payload else []
+        try:
+            job = _job_queue().submit(payload, return_intermediate=return_intermediate, job_id=job_id, uploads=uploads)
+        except Exception:
+            discard_uploads(uploads)
+            raise
+        return jsonify(job), 202, {"Location": f"{request.script_root}/api/jobs/{job_id}"}
+    except _BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        return jsonify({"error": "queue_full", "detail": str(e)}), 429, {"Retry-After": "5"}
+    except Exception as e:  # pragma: no cover
+        current_app.logger.exception("/jobs failed")
+        return jsonify({"error": "internal_error", "detail": str(e)}), 500
+
+
+@bp.get("/jobs/<job_id>")
+def get_job(job_id: str) -> Any:
+    job = _job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job), 200
+
+
+@bp.post("/process/batch")
+def process_batch_endpoint() -> Any:
+    """Run /api/process over many uploads in parallel, streaming NDJSON.
+
+    One line per file as soon as it finishes (completion order, with its
+    upload ``index``), then a final ``{"summary": ...}`` line.
+    """
+    try:
+        if not (request.content_type and request.content_type.startswith("multipart/form-data")):
+            raise _BadRequest("multipart/form-data with one or more files (or a zip) required")
+        options = None
+        if request.form.get("options"):
+            try:
+                options = json.loads(request.form["options"])
+            except Exception:
+                raise _BadRequest("options must be valid JSON")
+        # last, so a rejected request leaves no files behind
+        uploads = _save_batch_uploads(prefix=f"{uuid.uuid4().hex}_")
+        return_intermediate = request.form.get("return_intermediate", "false").lower() == "true"
+    except _BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    started = time.monotonic()
+    futures = {}
+    try:
+        for index, (name, path) in enumerate(uploads):
+            payload: Dict[str, Any] = {"file_path": path}
+            if options is not None:
+                payload["options"] = options
+            fut = workers.submit(workers.run_pipeline, payload)
+            # also runs for files cancelled after the client went away
+            fut.add_done_callback(lambda _, p=path: discard_uploads([p]))
+            futures[fut] = (index, name)
+    except Exception:
+        for fut in futures:
+            fut.cancel()
+        discard_uploads(path for _, path in uploads[len(futures):])
+        raise
+
+    def generate() -> Iterator[str]:
+        ok = 0
+        try:
+            for fut in as_completed(futures):
+                index, name = futures[fut]
+                line: Dict[str, Any] = {"index": index, "filename": name}
+                try:
+                    out = fut.result()
+                except Exception as e:
+                    line.update(status="error", error=f"{type(e).__name__}: {e}")
+                else:
+                    ok += 1
+                    line.update(status="ok", result=out["result"])
+                    if return_intermediate:
+                        line["extracted"] = out["extracted"]
+                line["elapsed_sec"] = round(time.monotonic() - started, 3)
+                yield json.dumps(line, default=str) + "\n"
+            elapsed = time.monotonic() - started
+            yield json.dumps({"summary": {
+                "files": len(futures),
+                "succeeded": ok,
+                "failed": len(futures) - ok,
+                "elapsed_sec": round(elapsed, 3),
+                "files_per_sec": round(len(futures) / elapsed, 3) if elapsed > 0 else None,
+                "workers": workers.max_workers(),
+            }}) + "\n"
+        finally:
+            # client went away: drop whatever hasn't started yet
+            for fut in futures:
+                fut.cancel()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
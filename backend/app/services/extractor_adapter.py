@@ -1,22 +1,14 @@
 from __future__ import annotations
 
 import importlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 
 class ExtractorNotConfigured(Exception):
     pass
 
 
-def extract(input_payload: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Bridge to user-provided extractor.
-
-    Expects a module at app.integrations.extractor with a function:
-        def extract(input: dict) -> dict
-
-    input_payload keys may include: text, file_path, url, options
-    """
+def _module():
     try:
         module = importlib.import_module("app.integrations.extractor")
     except ModuleNotFoundError as e:
@@ -28,5 +20,29 @@ def extract(input_payload: Dict[str, Any]) -> Dict[str, Any]:
         raise ExtractorNotConfigured(
             "'extract' function missing in app/integrations/extractor.py"
         )
+    return module
+
+
+def extract(input_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bridge to user-provided extractor.
+
+    Expects a module at app.integrations.extractor with a function:
+        def extract(input: dict) -> dict
+
+    input_payload keys may include: text, file_path, url, options
+    """
+    return _module().extract(input_payload)
+
 
-    return module.extract(input_payload)
+def extract_with_facts(input_payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Any]]:
+    """
+    extract(), plus whatever the extractor parsed along the way for analyze().
+
+    Uses ``extract_with_facts(input) -> (dict, facts)`` when the module has
+    it; otherwise facts are None.
+    """
+    module = _module()
+    if hasattr(module, "extract_with_facts"):
+        return module.extract_with_facts(input_payload)
+    return module.extract(input_payload), None
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import workers
+
+
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class QueueFull(Exception):
+    pass
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def discard_uploads(paths: Iterable[str]) -> None:
+    """Delete uploaded files once nothing will read them again; already gone is fine."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class JobQueue:
+    """Background /api/process jobs executed on the shared worker pool.
+
+    At most ``capacity`` jobs may be queued or running at once. Every state
+    change is written to ``<state_dir>/<job_id>.json`` (atomically, via
+    rename) so finished results outlive the process, and unfinished jobs are
+    resubmitted when the queue is recreated after a restart. A job's
+    uploaded files are deleted once it has succeeded or failed.
+    """
+
+    def __init__(self, state_dir: str, capacity: int = 32):
+        self.state_dir = state_dir
+        self.capacity = capacity
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    # ---------- persistence ----------
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _persist(self, job: Dict[str, Any]) -> None:
+        tmp = self._path(job["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, default=str)
+        os.replace(tmp, self._path(job["id"]))
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def recover(self) -> int:
+        """Resubmit jobs left queued/running by a previous process."""
+        resumed = 0
+        for name in sorted(os.listdir(self.state_dir)):
+            if not name.endswith(".json"):
+                continue
+            job = self._load(name[:-5])
+            if not job or job.get("status") not in ("queued", "running"):
+                continue
+            try:
+                self._enqueue(job)
+                resumed += 1
+            except QueueFull:
+                job.update(status="failed", error="not resumed after restart: queue full", finished_at=_now())
+                self._persist(job)
+                discard_uploads(job.get("uploads") or [])
+        return resumed
+
+    # ---------- queue ----------
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def submit(
+        self,
+        payload: Dict[str, Any],
+        return_intermediate: bool = False,
+        job_id: Optional[str] = None,
+        uploads: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Queue a job; ``uploads`` are files saved for it, deleted when it finishes."""
+        job = {
+            "id": job_id or new_job_id(),
+            "status": "queued",
+            "created_at": _now(),
+            "finished_at": None,
+            "payload": payload,
+            "return_intermediate": return_intermediate,
+            "uploads": list(uploads or []),
+            "result": None,
+            "error": None,
+        }
+        self._enqueue(job)
+        return self._public(job)
+
+    def _enqueue(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._futures) >= self.capacity:
+                raise QueueFull(f"job queue full ({self.capacity} pending)")
+            job["status"] = "queued"
+            self._persist(job)
+            self._jobs[job["id"]] = job
+            fut = workers.submit(workers.run_pipeline, job["payload"])
+            self._futures[job["id"]] = fut
+        fut.add_done_callback(lambda f, jid=job["id"]: self._finish(jid, f))
+
+    def _finish(self, job_id: str, fut: Future) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._futures.pop(job_id, None)
+        if job is None:
+            return
+        job["finished_at"] = _now()
+        try:
+            out = fut.result()
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+        else:
+            job["status"] = "succeeded"
+            job["result"] = out["result"]
+            if job.get("return_intermediate"):
+                job["extracted"] = out["extracted"]
+        self._persist(job)
+        discard_uploads(job.get("uploads") or [])
+        with self._lock:
+            # finished jobs are served from disk from now on
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            fut = self._futures.get(job_id)
+        if job is None:
+            # finished before a restart, or owned by another server process
+            job = self._load(job_id)
+            if job is None:
+                return None
+        out = self._public(job)
+        if fut is not None and fut.running():
+            out["status"] = "running"
+        return out
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        out = {k: v for k, v in job.items() if k not in ("payload", "return_intermediate", "uploads")}
+        if out.get("result") is None:
+            out.pop("result", None)
+        if out.get("error") is None:
+            out.pop("error", None)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self.active(), "capacity": self.capacity, "workers": workers.max_workers()}
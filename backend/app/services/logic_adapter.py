@@ -1,20 +1,14 @@
 from __future__ import annotations
 
 import importlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 class LogicNotConfigured(Exception):
     pass
 
 
-def analyze(extracted: Dict[str, Any], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """
-    Bridge to user-provided business logic.
-
-    Expects a module at app.integrations.logic with a function:
-        def analyze(extracted: dict, options: dict | None = None) -> dict
-    """
+def _module():
     try:
         module = importlib.import_module("app.integrations.logic")
     except ModuleNotFoundError as e:
@@ -24,5 +18,43 @@ def analyze(extracted: Dict[str, Any], options: Optional[Dict[str, Any]] = None)
 
     if not hasattr(module, "analyze"):
         raise LogicNotConfigured("'analyze' function missing in app/integrations/logic.py")
+    return module
+
+
+def analyze(
+    extracted: Dict[str, Any],
+    options: Optional[Dict[str, Any]] = None,
+    facts: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """
+    Bridge to user-provided business logic.
 
+    Expects a module at app.integrations.logic with a function:
+        def analyze(extracted: dict, options: dict | None = None) -> dict
+
+    ``facts`` from extractor_adapter.extract_with_facts is passed on as
+    ``analyze(..., facts=facts)`` when given.
+    """
+    module = _module()
+    if facts is not None:
+        return module.analyze(extracted, options, facts=facts)
     return module.analyze(extracted, options)
+
+
+def analyze_many(extracted_list: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    analyze() over a list of invoices: ``{"result": ...}`` or ``{"error": "..."}`` each, in order.
+
+    Uses the module's ``analyze_many`` when it has one (shared state loaded
+    once per list); otherwise calls ``analyze`` per invoice.
+    """
+    module = _module()
+    if hasattr(module, "analyze_many"):
+        return module.analyze_many(extracted_list, options)
+    out: List[Dict[str, Any]] = []
+    for extracted in extracted_list:
+        try:
+            out.append({"result": module.analyze(extracted, options)})
+        except Exception as e:
+            out.append({"error": f"{type(e).__name__}: {e}"})
+    return out
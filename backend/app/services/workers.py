@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from ..integrations import metrics
+from .extractor_adapter import extract_with_facts
+from .logic_adapter import analyze, analyze_many
+
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_MAX_WORKERS = os.cpu_count() or 1
+_LOCK = threading.Lock()
+
+
+def run_pipeline(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract then analyze one input; runs inside a pool worker process."""
+    extracted, facts = extract_with_facts(payload)
+    result = analyze(extracted, payload.get("options"), facts=facts)
+    # stage timings observed in this worker; replayed into the server's metrics
+    return {"extracted": extracted, "result": result, "metrics": metrics.drain()}
+
+
+def run_analyze_chunk(extracted_list: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Analyze one chunk of /api/analyze/batch inside a pool worker process."""
+    return {"results": analyze_many(extracted_list, options), "metrics": metrics.drain()}
+
+
+def configure(max_workers: Optional[int] = None) -> None:
+    global _MAX_WORKERS
+    if max_workers:
+        _MAX_WORKERS = max_workers
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by background jobs.
+
+    Workers are spawned rather than forked so they don't inherit the web
+    server's threads, locks or open Mongo sockets.
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ProcessPoolExecutor(
+                    max_workers=_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=metrics.start_capture,
+                )
+    return _EXECUTOR
+
+
+def submit(fn, *args: Any) -> Future:
+    try:
+        fut = get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        # a worker died (OOM, segfault in a native lib); start a fresh pool
+        shutdown(wait=False)
+        fut = get_executor().submit(fn, *args)
+    fut.add_done_callback(_replay_metrics)
+    return fut
+
+
+def _replay_metrics(fut: Future) -> None:
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    out = fut.result()
+    if isinstance(out, dict):
+        metrics.replay(out.pop("metrics", None))
+
+
+def max_workers() -> int:
+    return _MAX_WORKERS
+
+
+def shutdown(wait: bool = True) -> None:
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=wait, cancel_futures=not wait)
+            _EXECUTOR = None
@@ -0,0 +1,304 @@
+"""Deterministic synthetic invoices for the benchmarks.
+
+Each invoice is rendered three ways: a text-layer PDF (what e-invoicing
+portals produce), a slightly skewed scan-like PNG (exercises rasterize /
+deskew / OCR), and the nested JSON shape ``extractor.extract`` returns (the
+input of ``logic.analyze``). The same seed always yields the same corpus.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import random
+import string
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None  # type: ignore
+
+try:
+    import cv2
+    import numpy as np
+except Exception:
+    cv2 = None  # type: ignore
+    np = None  # type: ignore
+
+# (code, description, GST %): a spread of chapters and every standard slab
+HSN_TABLE = [
+    ("0401", "Milk and cream", 0),
+    ("1006", "Rice", 5),
+    ("3004", "Medicaments", 12),
+    ("4820", "Registers, notebooks", 18),
+    ("6109", "T-shirts, knitted", 5),
+    ("8471", "Laptop computer", 18),
+    ("84713010", "Personal computer", 18),
+    ("8517", "Mobile handset", 18),
+    ("8703", "Motor car", 28),
+    ("9403", "Office furniture", 18),
+    ("996311", "Room accommodation", 12),
+    ("998314", "IT consulting", 18),
+]
+
+STATE_CODES = ["07", "08", "09", "19", "24", "27", "29", "33", "36"]
+VENDORS = [
+    "Sharma Traders Pvt Ltd",
+    "Kaveri Electronics LLP",
+    "Bharat Office Supplies",
+    "Jaisalmer Resort & Spa",
+    "Deccan Pharma Distributors",
+    "Northline Logistics Pvt Ltd",
+]
+UPI_HANDLES = ["okaxis", "oksbi", "ybl", "paytm", "okhdfcbank"]
+
+_GSTIN_CHARS = string.digits + string.ascii_uppercase
+
+
+def gstin_checksum(first14: str) -> str:
+    """Check character of a GSTIN (mod-36, alternating weights 1/2)."""
+    total = 0
+    for i, ch in enumerate(first14):
+        v = _GSTIN_CHARS.index(ch) * (2 if i % 2 else 1)
+        total += v // 36 + v % 36
+    return _GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+def random_pan(rng: random.Random) -> str:
+    letters = string.ascii_uppercase
+    return (
+        "".join(rng.choice(letters) for _ in range(3))
+        + rng.choice("CPHFT")
+        + rng.choice(letters)
+        + f"{rng.randrange(10000):04d}"
+        + rng.choice(letters)
+    )
+
+
+def random_gstin(rng: random.Random, pan: Optional[str] = None) -> str:
+    body = rng.choice(STATE_CODES) + (pan or random_pan(rng)) + rng.choice("123456789") + "Z"
+    return body + gstin_checksum(body)
+
+
+def _rupees(paise: int) -> str:
+    return f"{paise // 100:,}.{paise % 100:02d}"
+
+
+def make_invoice(rng: random.Random, index: int, max_items: int = 12) -> Dict[str, Any]:
+    """One invoice as plain data; amounts are integer paise so totals add up exactly."""
+    pan = random_pan(rng)
+    seller = random_gstin(rng, pan)
+    buyer = random_gstin(rng)
+    items = []
+    for line_no in range(1, rng.randint(1, max_items) + 1):
+        code, desc, rate = rng.choice(HSN_TABLE)
+        qty = rng.randint(1, 20)
+        unit_paise = rng.randint(50, 50000) * 100
+        taxable = qty * unit_paise
+        half_tax = taxable * rate // 200
+        items.append({
+            "line_no": line_no,
+            "hsn": code,
+            "description": desc,
+            "quantity": qty,
+            "unit_price": unit_paise,
+            "taxable_value": taxable,
+            "gst_percent": rate,
+            "cgst_amount": half_tax,
+            "sgst_amount": half_tax,
+            "line_total": taxable + 2 * half_tax,
+        })
+    total_tax = sum(it["cgst_amount"] + it["sgst_amount"] for it in items)
+    total = sum(it["line_total"] for it in items)
+    return {
+        "index": index,
+        "vendor_name": rng.choice(VENDORS),
+        "seller_gstin": seller,
+        "buyer_gstin": buyer,
+        "pan": pan,
+        "invoice_no": f"INV/{rng.randint(2023, 2025)}/{index:05d}",
+        "invoice_date": f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(2023, 2025)}",
+        "irn": "".join(rng.choice("0123456789abcdef") for _ in range(64)),
+        "ack_no": str(rng.randrange(10 ** 14, 10 ** 15)),
+        "upi": (
+            f"{rng.choice(VENDORS).split()[0].lower()}@{rng.choice(UPI_HANDLES)}"
+            if rng.random() < 0.3
+            else None
+        ),
+        "upi_ref": str(rng.randrange(10 ** 11, 10 ** 12)),
+        "items": items,
+        "total_tax": total_tax,
+        "total_amount": total,
+    }
+
+
+def invoice_lines(inv: Dict[str, Any]) -> List[str]:
+    lines = [
+        "TAX INVOICE",
+        inv["vendor_name"].upper(),
+        f"Seller GSTIN: {inv['seller_gstin']}   PAN: {inv['pan']}",
+        f"Invoice No: {inv['invoice_no']}   Dated: {inv['invoice_date']}",
+        f"IRN: {inv['irn']}",
+        f"Ack No: {inv['ack_no']}   Ack Date: {inv['invoice_date']}",
+        "Buyer (Bill to)",
+        "Acme Retail Pvt Ltd",
+        f"Buyer GSTIN: {inv['buyer_gstin']}",
+        "Sl  HSN/SAC   Description            Qty   Rate       Taxable     CGST      SGST      Amount",
+    ]
+    for it in inv["items"]:
+        lines.append(
+            f"{it['line_no']:<3} {it['hsn']:<9} {it['description'][:22]:<22} {it['quantity']:>4} "
+            f"{_rupees(it['unit_price']):>10} {_rupees(it['taxable_value']):>11} "
+            f"{_rupees(it['cgst_amount']):>9} {_rupees(it['sgst_amount']):>9} {_rupees(it['line_total']):>11}"
+        )
+    lines += [
+        f"Total Tax: {_rupees(inv['total_tax'])}",
+        f"Grand Total: {_rupees(inv['total_amount'])}",
+        f"Amount Chargeable (in words): INR {inv['total_amount'] // 100} Rupees Only",
+    ]
+    if inv["upi"]:
+        lines.append(f"Paid via UPI: {inv['upi']}  UPI Ref: {inv['upi_ref']}")
+    return lines
+
+
+def invoice_text(inv: Dict[str, Any]) -> str:
+    return "\n".join(invoice_lines(inv))
+
+
+def extracted_doc(inv: Dict[str, Any]) -> Dict[str, Any]:
+    """The nested dict ``extractor.extract`` would return for this invoice."""
+    def rupees(paise: int) -> float:
+        return paise / 100
+
+    items = []
+    for it in inv["items"]:
+        items.append({
+            "hsn": it["hsn"],
+            "description": it["description"],
+            "quantity": it["quantity"],
+            "unit": "NOS",
+            "unit_price": rupees(it["unit_price"]),
+            "taxable_value": rupees(it["taxable_value"]),
+            "gst_percent": it["gst_percent"],
+            "gst_amount": rupees(it["cgst_amount"] + it["sgst_amount"]),
+            "cgst_percent": it["gst_percent"] / 2,
+            "cgst_amount": rupees(it["cgst_amount"]),
+            "sgst_percent": it["gst_percent"] / 2,
+            "sgst_amount": rupees(it["sgst_amount"]),
+            "igst_percent": None,
+            "igst_amount": None,
+            "line_total": rupees(it["line_total"]),
+            "line_no": it["line_no"],
+            "anomalies": [],
+        })
+    d, m, y = inv["invoice_date"].split("-")
+    return {
+        "company": {"vendor_name": inv["vendor_name"], "gstin": inv["seller_gstin"], "other_gstins": [inv["buyer_gstin"]]},
+        "invoice": {
+            "invoice_no": inv["invoice_no"],
+            "invoice_date": f"{y}-{m}-{d}",
+            "ack_no": inv["ack_no"],
+            "ack_date": f"{y}-{m}-{d}",
+            "irn": inv["irn"],
+        },
+        "totals": {
+            "total_amount": rupees(inv["total_amount"]),
+            "total_tax": rupees(inv["total_tax"]),
+            "total_cgst": rupees(inv["total_tax"] // 2),
+            "total_sgst": rupees(inv["total_tax"] - inv["total_tax"] // 2),
+            "total_igst": None,
+            "amount_in_words": None,
+        },
+        "items": items,
+        "metadata": {
+            "hsn_codes_detected": sorted({it["hsn"] for it in inv["items"]}),
+            "notes": {"company_pan": inv["pan"]},
+            "computed_items_sum": rupees(sum(it["taxable_value"] for it in inv["items"])),
+            "raw_text_sample": invoice_text(inv)[:2000],
+            "azure_raw_fields": None,
+        },
+        "source_file": f"synthetic_{inv['index']:05d}.pdf",
+        "anomalies": [],
+    }
+
+
+def write_pdf(inv: Dict[str, Any], path: str, lines_per_page: int = 60) -> None:
+    """A4 PDF with a real text layer; long item lists continue on further pages."""
+    doc = fitz.open()
+    lines = invoice_lines(inv)
+    for start in range(0, len(lines), lines_per_page):
+        page = doc.new_page(width=595, height=842)
+        y = 50
+        for ln in lines[start:start + lines_per_page]:
+            page.insert_text((36, y), ln, fontsize=7, fontname="cour")
+            y += 12
+    doc.save(path)
+    doc.close()
+
+
+def write_image(inv: Dict[str, Any], path: str, skew_deg: float = 0.0, width: int = 2480) -> None:
+    """Grayscale A4 "scan" at ~300 DPI, rotated by ``skew_deg`` with a little noise."""
+    height = int(width * 842 / 595)
+    img = np.full((height, width), 255, dtype=np.uint8)
+    y = 150
+    for ln in invoice_lines(inv):
+        cv2.putText(img, ln, (100, y), cv2.FONT_HERSHEY_SIMPLEX, 1.1, 0, 2, cv2.LINE_AA)
+        y += 48
+        if y > height - 100:
+            break
+    if skew_deg:
+        m = cv2.getRotationMatrix2D((width / 2, height / 2), skew_deg, 1.0)
+        img = cv2.warpAffine(img, m, (width, height), borderValue=255)
+    noise = np.random.default_rng(inv["index"]).integers(0, 25, img.shape, dtype=np.uint8)
+    img = cv2.subtract(img, noise)
+    cv2.imwrite(path, img)
+
+
+def write_hsn_csv(path: str) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["HSN_SAC_Code", "GST_Rate"])
+        for code, _, rate in HSN_TABLE:
+            w.writerow([code, rate])
+
+
+def generate(
+    out_dir: str,
+    count: int,
+    seed: int = 0,
+    kinds: Sequence[str] = ("pdf", "image", "json"),
+    max_items: int = 12,
+) -> Dict[str, Any]:
+    """Write ``count`` invoices under ``out_dir``; returns a manifest of the files.
+
+    Files that already exist are reused, so reruns with the same seed are cheap.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest: Dict[str, Any] = {"seed": seed, "count": count, "pdf": [], "image": [], "json": None}
+    docs = []
+    hsn_csv = os.path.join(out_dir, "hsn.csv")
+    write_hsn_csv(hsn_csv)
+    manifest["hsn_csv"] = hsn_csv
+    for i in range(count):
+        inv = make_invoice(rng, i, max_items=max_items)
+        skew = rng.uniform(-4.0, 4.0)
+        if "pdf" in kinds and fitz is not None:
+            path = os.path.join(out_dir, f"invoice_{i:05d}.pdf")
+            if not os.path.exists(path):
+                write_pdf(inv, path)
+            manifest["pdf"].append(path)
+        if "image" in kinds and cv2 is not None:
+            path = os.path.join(out_dir, f"invoice_{i:05d}.png")
+            if not os.path.exists(path):
+                write_image(inv, path, skew_deg=skew)
+            manifest["image"].append(path)
+        if "json" in kinds:
+            docs.append(extracted_doc(inv))
+    if "json" in kinds:
+        path = os.path.join(out_dir, "extracted.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(docs, f)
+        manifest["json"] = path
+    return manifest
@@ -0,0 +1,416 @@
+"""Throughput / latency / peak-RSS benchmarks for the extractor and logic modules.
+
+Run from ``backend/``::
+
+    python -m benchmarks.run                       # all cases, 20 invoices
+    python -m benchmarks.run --count 200 --only check_invoice,analyze
+    python -m benchmarks.run --save main           # record benchmarks/baselines/main.json
+    python -m benchmarks.run --compare main        # exit 1 on a regression
+
+Each case runs in a fresh spawned process (``--no-isolate`` to disable) so
+its peak RSS is its own. Azure, Mongo, the fingerprint store, the extraction
+cache and metrics are switched off so only local code is measured.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(HERE, "baselines")
+DEFAULT_CORPUS_DIR = os.path.join(os.getcwd(), "cache", "bench")
+
+# no network or shared state in the measured code paths
+BENCH_ENV = {
+    "AZURE_ENDPOINT": "",
+    "AZURE_KEY": "",
+    "MONGO_URI": "",
+    "EXTRACT_CACHE_ENABLED": "0",
+    "METRICS_ENABLED": "0",
+    # repeated runs would otherwise find their own fingerprints in the shared store
+    "FINGERPRINT_STORE": "off",
+}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# ---------- cases ----------
+# each returns (fn, inputs): fn is called once per input and timed per call
+
+
+def _case_gstins(manifest):
+    from app.integrations import extractor
+    return extractor.extract_gstins_with_context, [d["metadata"]["raw_text_sample"] for d in _docs(manifest)]
+
+
+def _case_irn(manifest):
+    from app.integrations import extractor
+    return extractor.extract_irn_loose, [d["metadata"]["raw_text_sample"] for d in _docs(manifest)]
+
+
+def _long_texts(manifest, pages: int = 10) -> List[str]:
+    """Multi-page OCR-sized inputs: ``pages`` invoice texts joined per input."""
+    texts = [d["metadata"]["raw_text_sample"] for d in _docs(manifest)]
+    return ["\n\f\n".join(texts[(i + k) % len(texts)] for k in range(pages)) for i in range(len(texts))]
+
+
+def _case_scan_fields(manifest):
+    from app.integrations.fields import scan_fields
+    return scan_fields, _long_texts(manifest)
+
+
+# what build_output + check_invoice ran per document before app.integrations.fields:
+# one search per field, label patterns compiled at call time, IRN retried on a
+# whitespace-stripped copy. Kept as the reference for scan_fields.
+_LEGACY_GST_LABELS = [
+    r"(?:COMPANY'S\s*GSTIN\/UIN|COMPANY'S\s*GSTIN|COMPANY\s*GSTIN|GSTIN\/UIN|GSTIN)(?:\s*[:\-\n]\s*|\s+)([0-9A-Z\-\s]{10,30})",
+    r"(?:BUYER|BILL TO|CONSIGNEE|SHIP TO).{0,40}(?:GSTIN\/UIN|GSTIN)(?:\s*[:\-\n]\s*|\s+)([0-9A-Z\-\s]{10,30})",
+]
+_LEGACY_SEARCHES = [
+    (r"\bInvoice[ \t]*(?:No\b|Number\b|#)\.?[ \t]*[:\-]?[ \t]*([A-Z0-9][A-Z0-9/\-]{1,30})", re.I),
+    (r"\b(?:Invoice[ \t]*Date|Dated|Date)[ \t]*[:\-]?[ \t]*([0-9]{1,2}[/.\- ][A-Za-z0-9]{1,3}[/.\- ][0-9]{2,4})", re.I),
+    (r"\b(?:Grand[ \t]*Total|Total[ \t]*Amount|Invoice[ \t]*Total|Amount[ \t]*Payable)[ \t]*[:\-]?[ \t]*(?:INR|Rs\.?|₹)?[ \t]*([0-9][0-9,]*(?:\.\d{1,2})?)", re.I),
+    (r"\bAck\s*No\.?\s*[:\-]?\s*([0-9]{6,})", re.I),
+    (r"\bAck\s*Date\s*[:\-]?\s*([0-9]{1,2}[/-][A-Za-z0-9]{1,3}[/-][0-9]{2,4})", re.I),
+    (r"(INR[\s\S]{0,120}?Only)", re.I),
+    (r"Amount Chargeable\s*\(in words\)\s*[:\-\s]*([\s\S]{1,120})", re.I),
+    (r"\b([A-Z]{5}[0-9]{4}[A-Z])\b", 0),  # PAN, extractor
+    (r"\b([A-Z]{5}[0-9]{4}[A-Z])\b", 0),  # PAN, check_invoice
+    (r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}", re.I),
+    (r"(?:Txn ID|Transaction ID|UTR|Ref|TXN|Transaction No|Trans ID)\s*[:\-\s]*([A-Za-z0-9\-_/]{6,})", re.I),
+    (r"(?:From|Sender|Remitter|Paid By)\s*[:\-]?\s*([A-Za-z\s]{2,60})", re.I),
+]
+_LEGACY_IRN = re.compile(r"([a-f0-9]{64}\s*-\s*[a-f0-9]{32})", re.I)
+
+
+def _legacy_field_regexes(text: str) -> None:
+    upper = text.upper()
+    for pat in _LEGACY_GST_LABELS:
+        for m in re.finditer(pat, upper, flags=re.I | re.S):
+            re.sub(r"[^0-9A-Z]", "", m.group(1))
+    for m in re.finditer(r"([0-9A-Z]{15})", upper, flags=re.I):
+        re.match(r"[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z0-9]{3}", m.group(1))
+    if not _LEGACY_IRN.search(text):
+        cleaned = re.sub(r"\s+", "", text)
+        if not _LEGACY_IRN.search(cleaned):
+            re.search(r"([a-f0-9]{60,64}).{0,8}?-?.{0,8}?([a-f0-9]{28,32})", cleaned, flags=re.I)
+    re.findall(r"\b[0-9]{4,8}\b", text)
+    for pat, flags in _LEGACY_SEARCHES:
+        re.search(pat, text, flags=flags)
+
+
+def _case_field_regexes(manifest):
+    return _legacy_field_regexes, _long_texts(manifest)
+
+
+def _case_text_layer(manifest):
+    from app.integrations import extractor
+
+    def read(path: str) -> str:
+        pages = list(range(extractor.page_count(path)))
+        return "\n".join(extractor.words_to_text(w) for w in extractor.pdf_page_words(path, pages))
+    return read, manifest["pdf"]
+
+
+def _case_table_items(manifest):
+    from app.integrations import extractor
+    layouts = [extractor.pdf_page_layouts(p, list(range(extractor.page_count(p)))) for p in manifest["pdf"]]
+    return extractor.extract_table_items, layouts
+
+
+def _case_deskew(manifest):
+    from app.integrations import extractor
+    images = [extractor.load_image_any(p) for p in manifest["image"]]
+    return extractor.deskew_image, images
+
+
+def _case_check_invoice(manifest):
+    from app.integrations.hsn_index import get_hsn_index
+    from app.integrations.logic import check_invoice
+    index = get_hsn_index()
+    index.get("8471")  # load outside the timed loop
+    return (lambda doc: check_invoice(json.loads(doc), index)), [json.dumps(d) for d in _docs(manifest)]
+
+
+def _case_analyze(manifest):
+    from app.integrations import logic
+    options = {"check_duplicates": False}
+    logic.analyze(_docs(manifest)[0], options)
+    return (lambda doc: logic.analyze(json.loads(doc), options)), [json.dumps(d) for d in _docs(manifest)]
+
+
+def _case_extract_pdf(manifest):
+    from app.integrations import extractor
+    options = {"use_cache": False, "check_duplicates": False}
+    return (lambda p: extractor.extract({"file_path": p, "options": options})), manifest["pdf"]
+
+
+def _case_extract_image(manifest):
+    from app.integrations import extractor, ocr
+    if not ocr.available():
+        raise _Skip("no OCR backend (install tesseract or tesserocr)")
+    options = {"use_cache": False, "check_duplicates": False}
+    return (lambda p: extractor.extract({"file_path": p, "options": options})), manifest["image"]
+
+
+def _case_process_pdf(manifest):
+    from app.integrations import extractor, logic
+    options = {"use_cache": False, "check_duplicates": False}
+    return (
+        lambda p: logic.analyze(extractor.extract({"file_path": p, "options": options}), options)
+    ), manifest["pdf"]
+
+
+# cold imports, each in a fresh interpreter; fails if a heavy optional
+# dependency was loaded that the path doesn't use
+_HEAVY = ("fitz", "numpy", "cv2", "tesserocr", "PIL", "requests", "pymongo", "bson", "pandas")
+
+_IMPORT_PROBE = """
+import sys
+exec(sys.argv[1])
+loaded = [m for m in sys.argv[2].split(",") if m in sys.modules]
+if loaded:
+    sys.exit("imported eagerly: " + ", ".join(loaded))
+"""
+
+
+def _import_case(statement: str, forbidden: Iterable[str], runs: int = 5):
+    import subprocess
+    backend_dir = os.path.dirname(HERE)
+    env = dict(os.environ, **BENCH_ENV)
+
+    def fn(_):
+        proc = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE, statement, ",".join(forbidden)],
+            cwd=backend_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+
+    return fn, list(range(runs))
+
+
+def _case_import_app(manifest):
+    return _import_case("from app import create_app; create_app()", _HEAVY)
+
+
+def _case_import_logic(manifest):
+    # what pool workers and the analyze-only / text-only paths load
+    return _import_case(
+        "import app.integrations.logic, app.integrations.extractor, app.services.workers",
+        _HEAVY + ("flask",),
+    )
+
+
+CASES: Dict[str, Callable[[Dict[str, Any]], Tuple[Callable[[Any], Any], List[Any]]]] = {
+    "extract_gstins_with_context": _case_gstins,
+    "extract_irn_loose": _case_irn,
+    "scan_fields": _case_scan_fields,
+    "field_regexes_legacy": _case_field_regexes,
+    "text_layer": _case_text_layer,
+    "table_items": _case_table_items,
+    "deskew_image": _case_deskew,
+    "check_invoice": _case_check_invoice,
+    "analyze": _case_analyze,
+    "extract_pdf": _case_extract_pdf,
+    "extract_image": _case_extract_image,
+    "process_pdf": _case_process_pdf,
+    "import_app": _case_import_app,
+    "import_logic": _case_import_logic,
+}
+
+
+class _Skip(Exception):
+    pass
+
+
+_DOCS: Optional[List[Dict[str, Any]]] = None
+
+
+def _docs(manifest) -> List[Dict[str, Any]]:
+    global _DOCS
+    if _DOCS is None:
+        with open(manifest["json"], encoding="utf-8") as f:
+            _DOCS = json.load(f)
+    return _DOCS
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+def run_case(name: str, manifest: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """Time one case in this process."""
+    os.environ.update(BENCH_ENV)
+    os.environ["HSN_CSV_PATH"] = manifest["hsn_csv"]
+    try:
+        fn, inputs = CASES[name](manifest)
+    except _Skip as e:
+        return {"skipped": str(e)}
+    if not inputs:
+        return {"skipped": "no inputs of this kind in the corpus"}
+    fn(inputs[0])  # warm-up: imports, lazy singletons, regex caches
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            t0 = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "per_sec": round(len(latencies) / wall, 3) if wall > 0 else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _run_isolated(name: str, manifest: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+        return ex.submit(run_case, name, manifest, repeat).result()
+
+
+# ---------- baselines ----------
+
+
+def _baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, report: Dict[str, Any]) -> str:
+    path = _baseline_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions: throughput below or p95 latency above the baseline by more than ``tolerance``."""
+    problems = []
+    for name, cur in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "skipped" in cur or "skipped" in base:
+            continue
+        if base.get("per_sec") and cur["per_sec"] < base["per_sec"] * (1 - tolerance):
+            problems.append(f"{name}: {cur['per_sec']}/s vs baseline {base['per_sec']}/s")
+        if base.get("p95_ms") and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {cur['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+    return problems
+
+
+def _print_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    head = f"{'case':30} {'calls':>6} {'per_sec':>10} {'p50_ms':>10} {'p95_ms':>10} {'max_ms':>10} {'rss_mb':>8}"
+    if baseline:
+        head += f" {'vs base':>8}"
+    print(head)
+    for name, r in report["results"].items():
+        if "skipped" in r:
+            print(f"{name:30} skipped: {r['skipped']}")
+            continue
+        line = (
+            f"{name:30} {r['calls']:>6} {r['per_sec']:>10} {r['p50_ms']:>10} "
+            f"{r['p95_ms']:>10} {r['max_ms']:>10} {r['peak_rss_mb']:>8}"
+        )
+        base = (baseline or {}).get("results", {}).get(name) or {}
+        if base.get("per_sec"):
+            line += f" {r['per_sec'] / base['per_sec']:>7.2f}x"
+        print(line)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--count", type=int, default=20, help="synthetic invoices to generate (default: 20)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-items", type=int, default=12, help="max line items per invoice")
+    ap.add_argument("--repeat", type=int, default=3, help="passes over the corpus per case")
+    ap.add_argument("--only", help="comma-separated case names (default: all)")
+    ap.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    ap.add_argument("--no-isolate", action="store_true", help="run cases in this process (peak RSS is then cumulative)")
+    ap.add_argument("--save", metavar="NAME", help="write results as a baseline (name or .json path)")
+    ap.add_argument("--compare", metavar="NAME", help="compare against a saved baseline; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown (default: 0.15)")
+    ap.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = ap.parse_args(list(argv) if argv is not None else None)
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        ap.error(f"unknown case(s): {', '.join(unknown)}; choose from {', '.join(CASES)}")
+
+    from benchmarks.corpus import generate
+    corpus_dir = os.path.join(args.corpus_dir, f"seed{args.seed}-items{args.max_items}")
+    t0 = time.perf_counter()
+    manifest = generate(corpus_dir, args.count, seed=args.seed, max_items=args.max_items)
+    print(f"corpus: {args.count} invoices in {corpus_dir} ({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    os.environ.update(BENCH_ENV)
+    os.environ["HSN_CSV_PATH"] = manifest["hsn_csv"]
+    results: Dict[str, Any] = {}
+    for name in names:
+        print(f"running {name} ...", file=sys.stderr)
+        runner = run_case if args.no_isolate else _run_isolated
+        results[name] = runner(name, manifest, args.repeat)
+
+    report = {
+        "meta": {
+            "created": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "count": args.count,
+            "seed": args.seed,
+            "max_items": args.max_items,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(_baseline_path(args.compare), encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_table(report, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        print(f"baseline written to {save_baseline(args.save, report)}", file=sys.stderr)
+    if baseline:
+        problems = compare(report, baseline, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())